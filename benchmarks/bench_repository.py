@@ -0,0 +1,94 @@
+"""
+regression benchmarks of the hot paths on a synthetic repository
+
+    python -m pytest benchmarks/bench_repository.py
+
+needs pytest-benchmark, the persist_table benchmark also a config.ini (settings)
+"""
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from repo.repository import ConfigFile, Repository, read_pdata_inp_descr
+from repo.repository_async import RepositoryAsync
+from benchmarks.sqlite_pool import SQLitePool
+
+pytest.importorskip("pytest_benchmark")
+
+PROGRAM = "prog000"
+
+
+def ocd_path(root: Path) -> Path:
+    return root / "kn" / PROGRAM / "DE" / "2" / "db"
+
+
+def load_program(root: Path, **kwargs):
+    repo = Repository(root, **kwargs)
+    repo.read_profiles()
+    return repo.load_program(PROGRAM)
+
+
+def test_config_file_read(benchmark, synthetic_repository):
+    benchmark(ConfigFile, synthetic_repository / "registry" / f"kn_{PROGRAM}_DE_1.cfg")
+
+
+def test_read_pdata_inp_descr(benchmark, synthetic_repository):
+    benchmark(read_pdata_inp_descr, ocd_path(synthetic_repository) / "pdata.inp_descr")
+
+
+def test_load_program_definitions(benchmark, synthetic_repository):
+    # registries and inp_descr only, identical inp_descr of the programs are parsed once
+    def load_definitions():
+        repo = Repository(synthetic_repository)
+        repo.read_profiles()
+        for program_name in repo.program_names():
+            repo.load_program(program_name).load_all()
+        return repo
+
+    assert benchmark(load_definitions).programs()
+
+
+@pytest.mark.parametrize("engine", ["c", "pyarrow"])
+def test_read_table_ocd_price(benchmark, synthetic_repository, engine):
+    program = load_program(synthetic_repository, engine=engine)
+    program.load_ocd()
+    table = benchmark(program.ocd.read_table, "ocd_price.csv")
+    assert not table.df.empty
+
+
+def test_program_load_all(benchmark, synthetic_repository):
+    def load_all():
+        program = load_program(synthetic_repository)
+        program.load_all()
+        for ofml_part in program.loaded_ofml_parts():
+            ofml_part.read_all_tables()
+        return program
+
+    assert benchmark(load_all).all_tables
+
+
+def test_repository_async_load_program(benchmark, synthetic_repository):
+    async def load():
+        repo = RepositoryAsync(synthetic_repository)
+        await repo.read_profiles()
+        return await repo.load_program(PROGRAM)
+
+    assert benchmark(lambda: asyncio.run(load())).all_tables
+
+
+def test_persist_table(benchmark, synthetic_repository):
+    try:
+        from repo.db_async import AsyncDatabaseInterface
+    except ValueError as e:
+        # settings needs a config.ini
+        pytest.skip(str(e))
+
+    program = load_program(synthetic_repository)
+    program.load_ocd()
+    table = program.ocd.read_table("ocd_price.csv")
+    pool = SQLitePool()
+    pool.create_table(table.database_table_name, list(table.df.columns))
+    db = AsyncDatabaseInterface(pool)
+
+    assert benchmark(lambda: asyncio.run(db.persist_table(table, PROGRAM)))
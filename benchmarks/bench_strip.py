@@ -0,0 +1,77 @@
+"""
+compares the former per cell strip of read_table with strip_string_columns
+on a synthetic ocd_price table
+
+    python -m benchmarks.bench_strip [rows]
+"""
+import csv
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from repo.repository import strip_string_columns
+
+OCD_PRICE_COLUMNS = ['article_nr', 'var_cond', 'price_type', 'price_level', 'price_rule', 'price_textnr',
+                     'scale_quantity', 'rounding_id', 'is_fix', 'currency', 'date_from', 'date_to', 'price']
+OCD_PRICE_DTYPES = ['string', 'string', 'string', 'string', 'string', 'string',
+                    'float64', 'string', 'float64', 'string', 'string', 'string', 'float64']
+
+
+def write_ocd_price(path: Path, rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'article_nr': np.char.add('ART ', rng.integers(0, rows // 20 + 1, rows).astype(str)),
+        'var_cond': np.char.add(' VC_', rng.integers(0, 200, rows).astype(str)),
+        'price_type': 'S',
+        'price_level': rng.choice(['B', 'X'], rows),
+        'price_rule': '',
+        'price_textnr': '',
+        'scale_quantity': 1,
+        'rounding_id': '',
+        'is_fix': 1,
+        'currency': 'EUR ',
+        'date_from': '20240101',
+        'date_to': '99991231',
+        'price': rng.integers(0, 100000, rows) / 100,
+    })
+    df.to_csv(path, sep=';', header=False, index=False, encoding='cp1252')
+
+
+def read(path: Path):
+    return pd.read_csv(path, sep=';', header=None, names=OCD_PRICE_COLUMNS,
+                       dtype=dict(zip(OCD_PRICE_COLUMNS, OCD_PRICE_DTYPES)),
+                       encoding='cp1252', comment='#', quoting=csv.QUOTE_MINIMAL)
+
+
+def main(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'ocd_price.csv'
+        write_ocd_price(path, rows)
+
+        start = time.perf_counter()
+        df = read(path)
+        read_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        before = df.map(lambda x: x.strip() if isinstance(x, str) else x)
+        before_seconds = time.perf_counter() - start
+
+        df = read(path)
+        start = time.perf_counter()
+        after = strip_string_columns(df)
+        after_seconds = time.perf_counter() - start
+
+    assert before.astype(object).equals(after.astype(object))
+    print(f"rows: {rows}")
+    print(f"read_csv:             {read_seconds:.2f}s")
+    print(f"df.map strip:         {before_seconds:.2f}s")
+    print(f"strip_string_columns: {after_seconds:.2f}s")
+    print(f"dtypes kept: {dict(after.dtypes.astype(str))}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
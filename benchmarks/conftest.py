@@ -0,0 +1,15 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from benchmarks.synthetic_repository import generate_repository
+
+# size of the synthetic repository, e.g. OFML_BENCH_PROGRAMS=20 OFML_BENCH_ROWS=100000
+PROGRAMS = int(os.environ.get("OFML_BENCH_PROGRAMS", 3))
+ROWS = int(os.environ.get("OFML_BENCH_ROWS", 20000))
+
+
+@pytest.fixture(scope="session")
+def synthetic_repository(tmp_path_factory) -> Path:
+    return generate_repository(tmp_path_factory.mktemp("repository"), programs=PROGRAMS, rows=ROWS)
@@ -0,0 +1,52 @@
+"""
+stand-in for the aiomysql pool on top of sqlite3
+so AsyncDatabaseInterface.persist_table can be benchmarked without a MariaDB
+"""
+import sqlite3
+from contextlib import asynccontextmanager
+
+
+class SQLiteCursor:
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.cursor = connection.cursor()
+
+    @staticmethod
+    def statement(statement: str):
+        return statement.replace("%s", "?")
+
+    async def execute(self, statement: str, args=None):
+        self.cursor.execute(self.statement(statement), args or ())
+
+    async def executemany(self, statement: str, args):
+        self.cursor.executemany(self.statement(statement), args)
+
+
+class SQLiteConnection:
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def cursor(self):
+        yield SQLiteCursor(self.connection)
+
+    async def commit(self):
+        self.connection.commit()
+
+
+class SQLitePool:
+
+    maxsize = 1
+
+    def __init__(self, path=":memory:"):
+        self.connection = sqlite3.connect(path)
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield SQLiteConnection(self.connection)
+
+    def create_table(self, table_name: str, columns: list):
+        column_definitions = ", ".join(f"`{_}`" for _ in columns)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({column_definitions}, "
+                                f"sql_db_program, sql_db_timestamp_modified, sql_db_timestamp_read)")
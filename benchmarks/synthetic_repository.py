@@ -0,0 +1,281 @@
+"""
+generates a synthetic plaintext ofml repository with all six ofml parts
+
+    python -m benchmarks.synthetic_repository <root> [programs] [rows]
+
+rows is the size of the large ocd tables (ocd_price, ocd_propertyvalue, ...) of each program,
+the other tables are scaled down from it
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+LANGUAGES = ["de", "en", "fr", "nl"]
+
+TEXT_COLUMNS = [("textnr", "string"), ("language", "string"), ("line_nr", "int"), ("line_fmt", "string"),
+                ("text", "string")]
+
+OCD_TABLES = {
+    "ocd_article.csv": [("article_nr", "string"), ("art_type", "string"), ("manufacturer", "string"),
+                        ("series", "string"), ("short_textnr", "string"), ("long_textnr", "string"),
+                        ("rel_obj", "string"), ("fast_supply", "int"), ("discountable", "int"),
+                        ("order_unit", "string"), ("scheme_id", "string")],
+    "ocd_propertyclass.csv": [("article_nr", "string"), ("pos_class", "int"), ("prop_class", "string"),
+                              ("textnr", "string"), ("rel_obj", "string")],
+    "ocd_property.csv": [("prop_class", "string"), ("property", "string"), ("pos_prop", "int"),
+                         ("prop_textnr", "string"), ("rel_obj", "string"), ("prop_hint_textnr", "string"),
+                         ("prop_type", "string"), ("digits", "int"), ("dec_digits", "int"),
+                         ("obligatory", "int"), ("add_values", "int"), ("restrictable", "int"),
+                         ("multi_option", "int"), ("scope", "string"), ("txt_control", "string")],
+    "ocd_propertyvalue.csv": [("prop_class", "string"), ("property", "string"), ("pos_pval", "int"),
+                              ("pval_textnr", "string"), ("rel_obj", "string"), ("is_default", "int"),
+                              ("suppress_txt", "int"), ("op_from", "string"), ("value_from", "string"),
+                              ("op_to", "string"), ("value_to", "string"), ("raster", "string")],
+    "ocd_price.csv": [("article_nr", "string"), ("var_cond", "string"), ("price_type", "string"),
+                      ("price_level", "string"), ("price_rule", "string"), ("price_textnr", "string"),
+                      ("scale_quantity", "float"), ("rounding_id", "string"), ("is_fix", "int"),
+                      ("currency", "string"), ("date_from", "string"), ("date_to", "string"),
+                      ("price", "float")],
+    "ocd_relation.csv": [("rel_name", "string"), ("rel_blocknr", "int"), ("rel_block", "string")],
+    "ocd_relationobj.csv": [("rel_obj", "string"), ("position", "int"), ("rel_name", "string"),
+                            ("rel_type", "string"), ("rel_domain", "string")],
+    "ocd_artshorttext.csv": TEXT_COLUMNS,
+    "ocd_artlongtext.csv": TEXT_COLUMNS,
+    "ocd_proptext.csv": TEXT_COLUMNS,
+    "ocd_propvaluetext.csv": TEXT_COLUMNS,
+    "ocd_pricetext.csv": TEXT_COLUMNS,
+}
+
+OAM_TABLES = {
+    "oam_article2ofml.csv": [("article", "string"), ("ofml_type", "string"), ("odb_name", "string"),
+                             ("params", "string")],
+    "oam_property2mat.csv": [("article", "string"), ("property", "string"), ("prop_value", "string"),
+                             ("mat_layer", "string"), ("material", "string")],
+}
+
+GO_TABLES = {
+    "go_types.csv": [("article", "string"), ("meta_type", "string"), ("params", "string")],
+}
+
+ODB_TABLES = {
+    "funcs.csv": [("name", "string"), ("args", "string"), ("body", "string")],
+    "odb2d.csv": [("odb_name", "string"), ("level", "string"), ("obj_name", "string"), ("visible", "string"),
+                  ("x_offs", "string"), ("y_offs", "string"), ("rot", "string"), ("ctor", "string")],
+    "odb3d.csv": [("odb_name", "string"), ("obj_name", "string"), ("visible", "string"), ("x_offs", "string"),
+                  ("y_offs", "string"), ("z_offs", "string"), ("ctor", "string"), ("mat", "string")],
+}
+
+OAP_TABLES = {
+    "oap_action.csv": [("action", "string"), ("type", "string"), ("parameter", "string")],
+    "oap_property.csv": [("article", "string"), ("property", "string"), ("editor", "string")],
+}
+
+
+def write_inp_descr(path: Path, tables: dict, delimiters: dict = None):
+    delimiters = delimiters or {}
+    lines = ["comment", "  synthetic table definitions", "end comment"]
+    for filename, columns in tables.items():
+        table = filename.split(".")[0]
+        lines.append(f"table {table} {filename}")
+        for name, dtype in columns:
+            delim = f" delim {delimiters[filename]}" if filename in delimiters else ""
+            lines.append(f"field {table} {name} {dtype}{delim}")
+    path.write_text("\n".join(lines) + "\n", encoding="cp1252")
+
+
+def write_table(path: Path, df: pd.DataFrame, sep: str = ";"):
+    df.to_csv(path, sep=sep, header=False, index=False, encoding="cp1252")
+
+
+def text_table(rng: np.random.Generator, prefix: str, count: int) -> pd.DataFrame:
+    textnr = np.repeat([f"{prefix}{i}" for i in range(count)], len(LANGUAGES))
+    language = np.tile(LANGUAGES, count)
+    return pd.DataFrame({
+        "textnr": textnr,
+        "language": language,
+        "line_nr": 1,
+        "line_fmt": "\\",
+        "text": [f"{prefix} text {t} {rng.integers(1000)} ({l})" for t, l in zip(textnr, language)],
+    })
+
+
+def write_ocd(path: Path, rng: np.random.Generator, program: str, rows: int):
+    articles = max(rows // 20, 1)
+    prop_classes = max(articles // 5, 1)
+    properties_per_class = 8
+    values_per_property = max(rows // (prop_classes * properties_per_class), 1)
+
+    article_nr = [f"{program.upper()}-{i:06d}" for i in range(articles)]
+    prop_class = [f"PC_{program}_{i}" for i in range(prop_classes)]
+    property_names = [f"P{i:02d}" for i in range(properties_per_class)]
+
+    write_inp_descr(path / "pdata.inp_descr", OCD_TABLES)
+
+    write_table(path / "ocd_article.csv", pd.DataFrame({
+        "article_nr": article_nr, "art_type": "P", "manufacturer": "KN", "series": program,
+        "short_textnr": [f"ST{i}" for i in range(articles)], "long_textnr": [f"LT{i}" for i in range(articles)],
+        "rel_obj": "", "fast_supply": 0, "discountable": 1, "order_unit": "C62", "scheme_id": "",
+    }))
+    write_table(path / "ocd_propertyclass.csv", pd.DataFrame({
+        "article_nr": article_nr, "pos_class": 1,
+        "prop_class": [prop_class[i % prop_classes] for i in range(articles)], "textnr": "", "rel_obj": "",
+    }))
+    property_df = pd.DataFrame({
+        "prop_class": np.repeat(prop_class, properties_per_class),
+        "property": np.tile(property_names, prop_classes),
+    })
+    property_df["pos_prop"] = property_df.groupby("prop_class").cumcount() + 1
+    property_df["prop_textnr"] = [f"PT{i}" for i in range(len(property_df))]
+    property_df = property_df.assign(rel_obj="", prop_hint_textnr="", prop_type="C", digits=10, dec_digits=0,
+                                     obligatory=1, add_values=0, restrictable=1, multi_option=0, scope="C",
+                                     txt_control="")
+    write_table(path / "ocd_property.csv", property_df)
+
+    value_df = property_df[["prop_class", "property"]].loc[
+        np.repeat(property_df.index.values, values_per_property)].reset_index(drop=True)
+    value_df["pos_pval"] = value_df.groupby(["prop_class", "property"]).cumcount() + 1
+    value_df["pval_textnr"] = [f"PVT{i}" for i in range(len(value_df))]
+    value_df["rel_obj"] = ""
+    value_df["is_default"] = (value_df["pos_pval"] == 1).astype(int)
+    value_df["suppress_txt"] = 0
+    value_df["op_from"] = "EQ"
+    value_df["value_from"] = [f" V{p:03d} " for p in value_df["pos_pval"]]
+    value_df = value_df.assign(op_to="", value_to="", raster="")
+    write_table(path / "ocd_propertyvalue.csv", value_df)
+
+    price_article = rng.choice(article_nr, rows)
+    surcharge = rng.random(rows) < 0.8
+    write_table(path / "ocd_price.csv", pd.DataFrame({
+        "article_nr": price_article,
+        "var_cond": np.where(surcharge, np.char.add("VC_", rng.integers(0, 200, rows).astype(str)), ""),
+        "price_type": "S",
+        "price_level": np.where(surcharge, "X", "B"),
+        "price_rule": "", "price_textnr": "", "scale_quantity": 1.0, "rounding_id": "", "is_fix": 1,
+        "currency": "EUR", "date_from": "20240101", "date_to": "99991231",
+        "price": rng.integers(100, 100000, rows) / 100,
+    }))
+
+    relations = max(rows // 4, 1)
+    write_table(path / "ocd_relation.csv", pd.DataFrame({
+        "rel_name": [f"REL{i % max(relations // 4, 1)}" for i in range(relations)],
+        "rel_blocknr": np.arange(relations) % 4 + 1,
+        "rel_block": [f"$VARCOND = 'VC_{i % 200}' if P0{i % 8} = 'V001'" for i in range(relations)],
+    }))
+    write_table(path / "ocd_relationobj.csv", pd.DataFrame({
+        "rel_obj": [f"RO{i}" for i in range(articles)], "position": 1,
+        "rel_name": [f"REL{i % max(relations // 4, 1)}" for i in range(articles)],
+        "rel_type": "3", "rel_domain": "PCON",
+    }))
+
+    write_table(path / "ocd_artshorttext.csv", text_table(rng, "ST", articles))
+    write_table(path / "ocd_artlongtext.csv", text_table(rng, "LT", articles))
+    write_table(path / "ocd_proptext.csv", text_table(rng, "PT", len(property_df)))
+    write_table(path / "ocd_propvaluetext.csv", text_table(rng, "PVT", len(value_df)))
+    write_table(path / "ocd_pricetext.csv", text_table(rng, "PRT", 10))
+    return article_nr
+
+
+def write_oam(path: Path, article_nr: list):
+    write_inp_descr(path / "oam.inp_descr", OAM_TABLES)
+    write_table(path / "oam_article2ofml.csv", pd.DataFrame({
+        "article": article_nr, "ofml_type": "::kn::xoi::xOiObj", "odb_name": [f"odb_{_}" for _ in article_nr],
+        "params": "",
+    }))
+    write_table(path / "oam_property2mat.csv", pd.DataFrame({
+        "article": article_nr, "property": "P00", "prop_value": "V001", "mat_layer": "top", "material": "oak",
+    }))
+
+
+def write_go_and_odb(path: Path, program: str, article_nr: list):
+    write_inp_descr(path / "mt.inp_descr", GO_TABLES)
+    write_table(path / "go_types.csv", pd.DataFrame({
+        "article": article_nr, "meta_type": "::kn::go::GoMetaType", "params": "",
+    }))
+    for language in LANGUAGES:
+        (path / f"{program}_{language}.sr").write_text(
+            "\n".join(f"{_}=text of {_} ({language})" for _ in article_nr[:200]) + "\n", encoding="cp1252")
+
+    write_inp_descr(path / "odb.inp_descr", ODB_TABLES)
+    funcs = [f'f{i};"x, y";"return x + y * {i}"' for i in range(50)]
+    (path / "funcs.csv").write_text("\n".join(funcs) + "\n", encoding="cp1252")
+    write_table(path / "odb2d.csv", pd.DataFrame({
+        "odb_name": [f"odb_{_}" for _ in article_nr], "level": "1", "obj_name": "body", "visible": "1",
+        "x_offs": "0", "y_offs": "0", "rot": "0", "ctor": '"rect" 0 0 ${W} ${D}',
+    }))
+    write_table(path / "odb3d.csv", pd.DataFrame({
+        "odb_name": [f"odb_{_}" for _ in article_nr], "obj_name": "body", "visible": "1", "x_offs": "0",
+        "y_offs": "0", "z_offs": "0", "ctor": '"block" ${W} ${H} ${D}', "mat": "oak",
+    }))
+
+
+def write_oap(path: Path, article_nr: list):
+    write_inp_descr(path / "oap.inp_descr", OAP_TABLES)
+    write_table(path / "oap_action.csv", pd.DataFrame({
+        "action": [f"A{i}" for i in range(20)], "type": "Method", "parameter": "",
+    }))
+    write_table(path / "oap_property.csv", pd.DataFrame({
+        "article": article_nr, "property": "P00", "editor": "Choice",
+    }))
+
+
+def write_oas(path: Path, program: str, article_nr: list):
+    write_table(path / "article.csv", pd.DataFrame({
+        "name": article_nr, "type": "A", "param3": "", "param4": "", "param5": "", "param6": "", "program": program,
+    }))
+    write_table(path / "resource.csv", pd.DataFrame({
+        "name": article_nr, "type": "I", "param3": "", "param4": "", "resource_path": [f"img/{_}.png" for _ in article_nr],
+    }))
+    write_table(path / "structure.csv", pd.DataFrame({
+        "name": article_nr, "type": "A", "param3": "", "param4": "", "param5": "",
+    }))
+    write_table(path / "text.csv", pd.DataFrame({
+        "name": np.repeat(article_nr, 2), "type": "A", "language": np.tile(["de", "en"], len(article_nr)),
+        "text": [f"text {_}" for _ in np.repeat(article_nr, 2)],
+    }))
+
+
+def generate_repository(root: Path, programs: int = 3, rows: int = 1000, seed: int = 0) -> Path:
+    """
+    write a repository of programs prog000, prog001, ... to root and return root
+    """
+    root = root if isinstance(root, Path) else Path(root)
+    rng = np.random.default_rng(seed)
+    (root / "profiles").mkdir(parents=True, exist_ok=True)
+    (root / "registry").mkdir(exist_ok=True)
+
+    profiles = ["# synthetic repository", "[lib:kn]"]
+    for i in range(programs):
+        program = f"prog{i:03d}"
+        registry_name = f"kn_{program}_DE_1"
+        profiles.append(f"{registry_name}=1")
+        (root / "registry" / f"{registry_name}.cfg").write_text("\n".join([
+            f"program={program}",
+            f"productdb_path=kn/{program}/DE/2/db",
+            f"oam_path=kn/{program}/DE/2/oam",
+            "series_type=kn",
+            "meta_type=::kn::go::GoMetaType",
+            "type=ofml",
+            "cat_type=XCF",
+        ]) + "\n", encoding="cp1252")
+
+        program_path = root / "kn" / program
+        for path in [program_path / "DE" / "2" / "db", program_path / "DE" / "2" / "oam", program_path / "2",
+                     program_path / "DE" / "2" / "oap", program_path / "DE" / "2" / "cat"]:
+            path.mkdir(parents=True, exist_ok=True)
+
+        article_nr = write_ocd(program_path / "DE" / "2" / "db", rng, program, rows)
+        write_oam(program_path / "DE" / "2" / "oam", article_nr)
+        write_go_and_odb(program_path / "2", program, article_nr)
+        write_oap(program_path / "DE" / "2" / "oap", article_nr)
+        write_oas(program_path / "DE" / "2" / "cat", program, article_nr)
+
+    (root / "profiles" / "kn.cfg").write_text("\n".join(profiles) + "\n", encoding="cp1252")
+    return root
+
+
+if __name__ == "__main__":
+    generate_repository(Path(sys.argv[1]),
+                        programs=int(sys.argv[2]) if len(sys.argv) > 2 else 3,
+                        rows=int(sys.argv[3]) if len(sys.argv) > 3 else 1000)
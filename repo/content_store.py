@@ -0,0 +1,84 @@
+import hashlib
+import json
+import threading
+import weakref
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+
+try:
+    import xxhash
+except ImportError:
+    # optional, blake2b is the fallback
+    xxhash = None
+
+CHUNK_SIZE = 1024 ** 2
+
+
+def hasher():
+    # the name of the algorithm is part of the hash, hashes of both never compare equal
+    if xxhash is not None:
+        return 'xxh3', xxhash.xxh3_128()
+    return 'blake2b', hashlib.blake2b(digest_size=16)
+
+
+def content_hash(data: bytes) -> str:
+    name, h = hasher()
+    h.update(data)
+    return f"{name}:{h.hexdigest()}"
+
+
+def file_content_hash(path: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    content_hash of a file read in chunks of chunk_size bytes
+    """
+    name, h = hasher()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return f"{name}:{h.hexdigest()}"
+
+
+class ContentStore:
+    """
+    the parsed DataFrames of the process by content hash and read arguments
+
+    tables of identical files (e.g. of several programs) share one DataFrame, which
+    must be treated as read-only. an entry lives as long as a Table references its DataFrame
+    """
+
+    def __init__(self):
+        self.frames: weakref.WeakValueDictionary[str, pd.DataFrame] = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    @staticmethod
+    def key(content_hash: str, **kwargs) -> str:
+        """
+        kwargs: everything else that changes the parsed result, e.g. names, dtype or engine
+        """
+        return f"{content_hash}:{json.dumps(sorted(kwargs.items()), default=str)}"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        with self.lock:
+            df = self.frames.get(key, None)
+            if df is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return df
+
+    def put(self, key: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        returns the DataFrame of the entry, the one of another thread that put the same content first
+        """
+        with self.lock:
+            return self.frames.setdefault(key, df)
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
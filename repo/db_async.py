@@ -1,21 +1,50 @@
 import asyncio
+import csv
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Union
 import aiomysql
+import pandas as pd
 from loguru import logger
-from .repository import Table
-from settings import db_config
+from .instrumentation import report
+from .repository import Table, TableStream, NotAvailable
+from settings import db_config, persist_config
+
+# errors of a lost or broken connection, persist_table_retrying tries the table again
+TRANSIENT_ERRORS = (aiomysql.OperationalError, aiomysql.InterfaceError, OSError, asyncio.TimeoutError)
 
 
 class AsyncDatabaseInterface:
 
-    def __init__(self, pool):
+    def __init__(self, pool, method: str = "batch", batch_size: int = 10000, mode: str = "delete"):
         self.pool: aiomysql.pool.Pool = pool
+        self.method = method
+        self.batch_size = batch_size
+        # delete: DELETE the rows of the program and INSERT in place
+        # swap: INSERT into <table>__staging and RENAME it over the table in swap_staging_tables
+        self.mode = mode
+        self.staging_tables: dict[str, asyncio.Task] = {}
+        self.staged_programs: dict[str, set] = defaultdict(set)
+        # the staging tables are kept from an unfinished run, see resume_staging_tables
+        self.resumed = False
 
     @staticmethod
-    async def create(event_loop: asyncio.AbstractEventLoop):
+    async def create(event_loop: asyncio.AbstractEventLoop, **kwargs):
+        method = kwargs.get("method", persist_config["method"])
+        batch_size = kwargs.get("batch_size", persist_config["batch_size"])
+        mode = kwargs.get("mode", persist_config["mode"])
+        if method not in ("batch", "load_data"):
+            raise ValueError(f"Unknown persist method {method}")
+        if mode not in ("delete", "swap"):
+            raise ValueError(f"Unknown persist mode {mode}")
         pool = await aiomysql.create_pool(**db_config,
+                                          local_infile=method == "load_data",
                                           loop=event_loop)
 
-        return AsyncDatabaseInterface(pool)
+        return AsyncDatabaseInterface(pool, method=method, batch_size=batch_size, mode=mode)
 
     async def update_misc(self, **kwargs):
         import datetime
@@ -44,44 +73,299 @@ class AsyncDatabaseInterface:
                 await cur.execute(statement, args)
                 await conn.commit()
 
-    async def persist_table(self, table: Table, program_name):
+    @staticmethod
+    def staging_table_name(table_name: str):
+        return f"{table_name}__staging"
 
+    async def create_staging_table(self, table_name: str):
         async with self.pool.acquire() as conn:
-            cur: aiomysql.Cursor
             async with conn.cursor() as cur:
+                if not self.resumed:
+                    await cur.execute(f"DROP TABLE IF EXISTS {self.staging_table_name(table_name)};")
+                await cur.execute(f"CREATE TABLE IF NOT EXISTS {self.staging_table_name(table_name)} LIKE {table_name};")
+                await conn.commit()
 
-                try:
-                    await cur.execute(f"DELETE FROM {table.database_table_name} WHERE sql_db_program=%s;",
-                                      (program_name,))
-                    await conn.commit()
-                except Exception as e:
+    async def resume_staging_tables(self, staged_programs: dict[str, set]):
+        """
+        continue the staging tables of an unfinished run (see ProgressJournal) instead of creating them again,
+        staged_programs: table -> the programs the unfinished run committed to its staging table.
+        a table without staging table was already swapped in by the unfinished run, its programs are not staged
+        """
+        self.resumed = True
+        if not staged_programs:
+            return
+        staging_table_names = [self.staging_table_name(_) for _ in staged_programs]
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"SELECT table_name FROM information_schema.tables WHERE table_schema=DATABASE() "
+                                  f"AND table_name IN ({', '.join(['%s'] * len(staging_table_names))});",
+                                  staging_table_names)
+                existing = {_ for (_, ) in await cur.fetchall()}
+        for table_name, programs in staged_programs.items():
+            if self.staging_table_name(table_name) in existing:
+                self.staged_programs[table_name] |= programs
+            else:
+                logger.info(f"resume_staging_tables {table_name} was swapped in already")
 
-                    logger.error(f"persist_table DELETE failed (now skip) {table.name} _ {table.database_table_name} in {program_name} | {e}")
-                    return
-                else:
-                    # logger.info(f"persist_table DELETE success {table.name} _ {table.database_table_name} in {program_name}")
-                    pass
+    async def staging_table(self, table_name: str):
+        """
+        create <table>__staging once per run, concurrent writers wait for the same task
+        """
+        if table_name not in self.staging_tables:
+            self.staging_tables[table_name] = asyncio.create_task(self.create_staging_table(table_name))
+        task = self.staging_tables[table_name]
+        try:
+            await task
+        except Exception:
+            # a retry creates it again
+            if self.staging_tables.get(table_name) is task:
+                del self.staging_tables[table_name]
+            raise
+        return self.staging_table_name(table_name)
 
-                table.df.fillna(value='', inplace=True)
+    async def remove_program_rows(self, table_name: str, program_name: str):
+        """
+        the rows of a program whose table file was removed,
+        in mode swap they are left out when swap_staging_tables copies the rows of the other programs
+        """
+        if self.mode == "swap":
+            await self.staging_table(table_name)
+            self.staged_programs[table_name].add(program_name)
+            return
+        await self.update(f"DELETE FROM {table_name} WHERE sql_db_program=%s;", (program_name,))
 
-                table.df["sql_db_program"] = program_name
-                table.df["sql_db_timestamp_modified"] = table.timestamp_modified
-                table.df["sql_db_timestamp_read"] = table.timestamp_read
+    async def swap_staging_tables(self):
+        """
+        copy the rows of all programs not written in this run into the staging tables (one transaction
+        per program, replacing the copy of a former failed swap) and switch all staging tables in with one RENAME TABLE, atomic across the tables.
+        every table a run wrote to is copied as a whole, an incremental run that changes few files
+        is cheaper in mode delete
+        """
+        if not self.staged_programs:
+            return
+        for table_name, programs in self.staged_programs.items():
+            staging_table_name = self.staging_table_name(table_name)
+            start = time.time()
+            async with self.pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(f"SELECT DISTINCT sql_db_program FROM {table_name};")
+                    other_programs = [_ for (_, ) in await cur.fetchall() if _ not in programs]
+                    for program_name in other_programs:
+                        await cur.execute(f"DELETE FROM {staging_table_name} WHERE sql_db_program=%s;",
+                                          (program_name,))
+                        await cur.execute(f"INSERT INTO {staging_table_name} "
+                                          f"SELECT * FROM {table_name} WHERE sql_db_program=%s;", (program_name,))
+                        await conn.commit()
+            logger.info(f"swap_staging_tables {table_name} copied {len(other_programs)} programs "
+                        f"in {round(time.time() - start, 2)}s")
+        table_names = list(self.staged_programs)
+        renames = ", ".join([f"{_} TO {_}__old, {self.staging_table_name(_)} TO {_}" for _ in table_names])
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                for table_name in table_names:
+                    await cur.execute(f"DROP TABLE IF EXISTS {table_name}__old;")
+                await cur.execute(f"RENAME TABLE {renames};")
+                for table_name in table_names:
+                    await cur.execute(f"DROP TABLE {table_name}__old;")
+                await conn.commit()
+        logger.info(f"swap_staging_tables swapped in {len(table_names)} tables")
+        self.staging_tables.clear()
+        self.staged_programs.clear()
 
-                column_names = ", ".join([f"`{_}`" for _ in list(table.df.columns)])
-                value_placeholders = ", ".join(["%s" for _ in table.df.columns])
-                data = table.df.values.tolist()
-                stmt = f"INSERT INTO {table.database_table_name} ({column_names}) VALUES ({value_placeholders});"
+    @staticmethod
+    async def table_chunks(table: Union[Table, TableStream]) -> AsyncIterator[Union[pd.DataFrame, NotAvailable]]:
+        """
+        the DataFrame of a Table, the chunks of a TableStream (opened and parsed in a thread).
+        a chunk that can not be parsed ends the chunks with a NotAvailable, like read_table reports the table
+        """
+        if isinstance(table, TableStream):
+            try:
+                chunks = await asyncio.to_thread(iter, table)
+                while (df := await asyncio.to_thread(next, chunks, None)) is not None:
+                    yield df
+            except (ValueError, FileNotFoundError) as e:
+                yield NotAvailable(e)
+        else:
+            yield table.df
 
+    @staticmethod
+    def database_frame(df: pd.DataFrame, table: Union[Table, TableStream], program_name: str) -> pd.DataFrame:
+        """
+        df with the sql_db_* columns, a new frame on the same column data: the df of a Table may be shared
+        by the Tables of other programs (see read_table_deduplicated) and is never changed
+        """
+        columns = pd.DataFrame({
+            "sql_db_program": program_name,
+            "sql_db_timestamp_modified": table.timestamp_modified,
+            "sql_db_timestamp_read": table.timestamp_read,
+        }, index=df.index)
+        return pd.concat([df, columns], axis=1, copy=False)
+
+    async def persist_table_retrying(self, table: Union[Table, TableStream], program_name: str, retries: int = 3,
+                                     backoff: float = 1.0) -> bool:
+        """
+        persist_table, an attempt failing with a TRANSIENT_ERRORS (e.g. a lost connection) is tried again
+        after backoff * 2 ** attempt seconds (with jitter) up to retries times. the error of the last attempt
+        is raised, a skipped table (False) is not tried again
+        """
+        for attempt in range(retries + 1):
+            if attempt:
+                delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.warning(f"persist_table {table.name} in {program_name} retry {attempt}/{retries} "
+                               f"in {round(delay, 1)}s")
+                report.record("persist_retry", delay, program=program_name, table=table.name)
+                await asyncio.sleep(delay)
+            try:
+                return await self.persist_table(table, program_name, clean=attempt > 0)
+            except TRANSIENT_ERRORS:
+                if attempt == retries:
+                    raise
+
+    async def persist_table(self, table: Union[Table, TableStream], program_name, clean: bool = False):
+        """
+        a TableStream is inserted chunk by chunk, it is never in memory as a whole.
+        a TableStream whose first chunk can not be parsed is skipped without touching the database,
+        one that fails later loses the rows of the program inserted so far (in mode delete its former rows
+        are gone, in mode swap they are kept since the program is not staged)
+        clean: in mode swap remove rows of the program a former attempt left in the staging table
+        returns False if the table was skipped, TRANSIENT_ERRORS are raised
+        """
+        chunks = self.table_chunks(table)
+        df = await anext(chunks)
+        if isinstance(df, NotAvailable):
+            logger.error(f"persist_table could not read (now skip) {table.name} in {program_name} | {df.error}")
+            return False
+
+        if self.mode == "swap":
+            try:
+                table_name = await self.staging_table(table.database_table_name)
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                logger.error(f"persist_table CREATE staging failed (now skip) {table.name} _ {table.database_table_name} in {program_name} | {e}")
+                return False
+        else:
+            table_name = table.database_table_name
+
+        labels = {"program": program_name, "table": table.name}
+        wait_start = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            report.record("persist_pool_wait", time.perf_counter() - wait_start, **labels)
+            cur: aiomysql.Cursor
+            async with conn.cursor() as cur:
+
+                if self.mode == "delete":
+                    try:
+                        with report.timed("persist_delete", **labels):
+                            await cur.execute(f"DELETE FROM {table.database_table_name} WHERE sql_db_program=%s;",
+                                              (program_name,))
+                            await conn.commit()
+                    except TRANSIENT_ERRORS:
+                        raise
+                    except Exception as e:
+
+                        logger.error(f"persist_table DELETE failed (now skip) {table.name} _ {table.database_table_name} in {program_name} | {e}")
+                        return False
+                    else:
+                        # logger.info(f"persist_table DELETE success {table.name} _ {table.database_table_name} in {program_name}")
+                        pass
+                elif clean or self.resumed:
+                    try:
+                        await cur.execute(f"DELETE FROM {table_name} WHERE sql_db_program=%s;", (program_name,))
+                        await conn.commit()
+                    except TRANSIENT_ERRORS:
+                        raise
+                    except Exception as e:
+                        logger.error(f"persist_table DELETE staging failed (now skip) {table.name} _ {table_name} in {program_name} | {e}")
+                        return False
+
+                start = time.perf_counter()
+                rows = 0
+                commit_seconds = 0.0
                 try:
-                    await cur.executemany(stmt, data)
+                    while df is not None:
+                        if isinstance(df, NotAvailable):
+                            await conn.rollback()
+                            await cur.execute(f"DELETE FROM {table_name} WHERE sql_db_program=%s;", (program_name,))
+                            await conn.commit()
+                            logger.error(f"persist_table could not read (now skip, {rows} rows removed again) "
+                                         f"{table.name} in {program_name} | {df.error}")
+                            return False
+                        df = self.database_frame(df, table, program_name)
+                        if self.method == "load_data":
+                            commit_seconds += await self.load_data(conn, cur, table_name, df)
+                        else:
+                            commit_seconds += await self.insert_batches(conn, cur, table_name, df)
+                        rows += len(df)
+                        df = await anext(chunks, None)
                 except Exception as e:
                     logger.error(
                         f"persist_table INSERT failed {table.name} _ {table.database_table_name} in {program_name} | {e}")
                     # raise Exception from e
                     raise e
                 else:
+                    seconds = time.perf_counter() - start
+                    report.record("persist_insert", seconds - commit_seconds, rows=rows, **labels)
+                    report.record("persist_commit", commit_seconds, **labels)
                     logger.info(
-                        f"persist_table INSERT success {table.name} _ {table.database_table_name} in {program_name}")
-                    pass
-                return await conn.commit()
+                        f"persist_table INSERT success {table.name} _ {table.database_table_name} in {program_name} "
+                        f"| {rows} rows in {round(seconds, 2)}s ({round(rows / max(seconds, 1e-6))} rows/s)")
+                if self.mode == "swap":
+                    self.staged_programs[table.database_table_name].add(program_name)
+                return True
+
+    async def insert_batches(self, conn: aiomysql.Connection, cur: aiomysql.Cursor, table_name: str, df: pd.DataFrame):
+        """
+        insert df in slices of batch_size rows so neither the python row lists
+        nor the transaction grow with the size of the table.
+        every slice is committed on its own, a failure leaves the slices before it in the table
+        (a retry of persist_table_retrying deletes the rows of the program first)
+        returns the seconds spent in commits
+        """
+        column_names = ", ".join([f"`{_}`" for _ in list(df.columns)])
+        value_placeholders = ", ".join(["%s" for _ in df.columns])
+        stmt = f"INSERT INTO {table_name} ({column_names}) VALUES ({value_placeholders});"
+
+        commit_seconds = 0.0
+        for start in range(0, len(df), self.batch_size):
+            # executemany rewrites this into multi-row INSERT statements
+            # object columns first, arrow backed columns of the pyarrow engine can not hold ''
+            data = df.iloc[start:start + self.batch_size].astype(object).fillna(value='').values.tolist()
+            await cur.executemany(stmt, data)
+            commit_start = time.perf_counter()
+            await conn.commit()
+            commit_seconds += time.perf_counter() - commit_start
+        return commit_seconds
+
+    async def load_data(self, conn: aiomysql.Connection, cur: aiomysql.Cursor, table_name: str, df: pd.DataFrame):
+        """
+        stream df to the server with LOAD DATA LOCAL INFILE from a temporary csv file
+        returns the seconds spent in the commit
+        """
+        column_names = ", ".join([f"`{_}`" for _ in list(df.columns)])
+        fd, csv_path = tempfile.mkstemp(suffix=".csv", prefix=f"{table_name}_")
+        os.close(fd)
+        try:
+            await asyncio.to_thread(df.to_csv, csv_path,
+                                    sep="\t",
+                                    header=False,
+                                    index=False,
+                                    encoding="utf-8",
+                                    quoting=csv.QUOTE_ALL,
+                                    doublequote=False,
+                                    escapechar="\\",
+                                    lineterminator="\n",
+                                    chunksize=self.batch_size)
+            csv_path_sql = csv_path.replace("\\", "/")
+            await cur.execute(f"""
+                LOAD DATA LOCAL INFILE '{csv_path_sql}' INTO TABLE {table_name}
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' ENCLOSED BY '"' ESCAPED BY '\\\\'
+                LINES TERMINATED BY '\\n'
+                ({column_names});
+            """)
+            commit_start = time.perf_counter()
+            await conn.commit()
+            return time.perf_counter() - commit_start
+        finally:
+            os.remove(csv_path)
@@ -0,0 +1,148 @@
+import csv
+import json
+import os
+import time
+from contextvars import ContextVar
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+
+class RunReport:
+    """
+    collects wall time, rows and bytes of the stages of a repository load / database update
+
+    a record is a dict with stage, seconds and the optional labels program, ofml_part, table, path, rows and bytes.
+    a record inherits program, ofml_part and table of the timed() blocks it is recorded in
+    (e.g. the strip of a table within its read_table).
+    records of tables parsed in worker processes stay in those processes,
+    the parent only sees the stages it runs itself.
+    disabled until enabled is set (persist_repo_async.main does), only the last max_records records are kept
+    """
+
+    columns = ['stage', 'program', 'ofml_part', 'table', 'path', 'seconds', 'rows', 'bytes', 'rows_per_second']
+    # the labels nested records inherit
+    scope_labels = ('program', 'ofml_part', 'table')
+
+    def __init__(self, max_records: int = 1_000_000, enabled: bool = False):
+        self.records: deque[dict] = deque(maxlen=max_records)
+        self.enabled = enabled
+        self.scope: ContextVar[dict] = ContextVar('scope', default={})
+
+    def reset(self):
+        self.records.clear()
+
+    def record(self, stage: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        self.records.append({'stage': stage, 'seconds': seconds, **self.scope.get(), **labels})
+
+    @contextmanager
+    def timed(self, stage: str, **labels):
+        """
+        time the block, it may fill rows/bytes into the yielded labels
+        """
+        if not self.enabled:
+            yield labels
+            return
+        token = self.scope.set({**self.scope.get(), **{k: v for k, v in labels.items() if k in self.scope_labels}})
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            seconds = time.perf_counter() - start
+            self.scope.reset(token)
+            self.record(stage, seconds, **labels)
+
+    @staticmethod
+    def rows_per_second(rows: Optional[int], seconds: float) -> Optional[float]:
+        if not rows or seconds <= 0:
+            return None
+        return round(rows / seconds, 1)
+
+    def summary(self, *group_by: str) -> list[dict]:
+        """
+        sum of seconds, rows and bytes per stage and the given labels, e.g. summary('program')
+        """
+        groups = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0})
+        for record in self.records:
+            key = (record['stage'], *(record.get(_) for _ in group_by))
+            group = groups[key]
+            group['count'] += 1
+            group['seconds'] += record['seconds']
+            group['rows'] += record.get('rows') or 0
+            group['bytes'] += record.get('bytes') or 0
+        result = []
+        for key, group in groups.items():
+            result.append({
+                'stage': key[0],
+                **dict(zip(group_by, key[1:])),
+                **group,
+                'seconds': round(group['seconds'], 4),
+                'rows_per_second': self.rows_per_second(group['rows'], group['seconds']),
+            })
+        return sorted(result, key=lambda _: _['seconds'], reverse=True)
+
+    def write(self, path: Path):
+        """
+        write the report as json (records plus summaries) or csv (records) depending on the suffix
+        """
+        path = path if isinstance(path, Path) else Path(path)
+        if path.suffix.lower() == '.csv':
+            self.write_csv(path)
+        else:
+            self.write_json(path)
+
+    def write_json(self, path: Path):
+        content = {
+            'stages': self.summary(),
+            'programs': self.summary('program'),
+            'tables': self.summary('program', 'table'),
+            'records': list(self.records),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(content, f, indent=1, default=str)
+
+    def write_csv(self, path: Path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns, extrasaction='ignore')
+            writer.writeheader()
+            for record in self.records:
+                writer.writerow({**record,
+                                 'rows_per_second': self.rows_per_second(record.get('rows'), record['seconds'])})
+
+    def write_prometheus(self, path: Path, prefix: str = 'ofml_update'):
+        """
+        textfile for the node_exporter textfile collector, one series per stage and program
+        """
+        lines = [
+            f'# HELP {prefix}_stage_seconds wall time spent in a stage',
+            f'# TYPE {prefix}_stage_seconds gauge',
+        ]
+        summary = self.summary('program')
+        for group in summary:
+            lines.append(f'{prefix}_stage_seconds{self.prometheus_labels(group)} {group["seconds"]}')
+        lines += [
+            f'# HELP {prefix}_stage_rows rows processed in a stage',
+            f'# TYPE {prefix}_stage_rows gauge',
+        ]
+        for group in summary:
+            lines.append(f'{prefix}_stage_rows{self.prometheus_labels(group)} {group["rows"]}')
+        tmp_path = Path(f'{path}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        # the collector must never see a half written file
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def prometheus_labels(group: dict) -> str:
+        labels = {'stage': group['stage']}
+        if group.get('program'):
+            labels['program'] = group['program']
+        escaped = {k: str(v).replace('\\', '\\\\').replace('"', '\\"') for k, v in labels.items()}
+        return '{' + ','.join(f'{k}="{v}"' for k, v in escaped.items()) + '}'
+
+
+# the report all stages of this process record into
+report = RunReport()
@@ -0,0 +1,137 @@
+import datetime
+from typing import Iterable, Optional, Union
+import numpy as np
+import pandas as pd
+
+from .instrumentation import report
+
+# the columns of a configuration, see calculate_prices
+CONFIGURATION_COLUMNS = ['article_nr', 'var_conds', 'currency', 'date']
+
+
+def configurations_frame(configurations: Union[pd.DataFrame, Iterable]) -> pd.DataFrame:
+    """
+    a DataFrame of configurations given as DataFrame, dicts or tuples in the order of CONFIGURATION_COLUMNS
+    """
+    if isinstance(configurations, pd.DataFrame):
+        return configurations.reset_index(drop=True)
+    configurations = list(configurations)
+    if not configurations:
+        return pd.DataFrame(columns=CONFIGURATION_COLUMNS)
+    if not isinstance(configurations[0], dict):
+        return pd.DataFrame(configurations, columns=CONFIGURATION_COLUMNS[:len(configurations[0])])
+    return pd.DataFrame(configurations)
+
+
+def var_cond_list(var_conds) -> list:
+    """
+    the selected variant conditions of a line as list, a single one may be given as string
+    """
+    if isinstance(var_conds, str):
+        return [var_conds]
+    if isinstance(var_conds, (list, tuple, set, np.ndarray, pd.Series)):
+        return list(var_conds)
+    if var_conds is None or pd.isna(var_conds):
+        return []
+    raise TypeError(f"var_conds must be a list of variant conditions, not {var_conds!r}")
+
+
+def ocd_date(value) -> str:
+    """
+    a date as the YYYYMMDD string of the ocd
+    """
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.strftime('%Y%m%d')
+    return str(value).replace('-', '')
+
+
+def calculate_prices(prices: pd.DataFrame, configurations: Union[pd.DataFrame, Iterable], currency: Optional[str] = None,
+                     date=None, price_type: str = 'S') -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    prices of many configured articles at once from the rows of ocd_price
+
+    configurations: article_nr, var_conds (the selected variant conditions, a list or a single string) and
+                    optionally currency and date (YYYYMMDD or date) per line
+    currency, date: for lines that do not give their own, date defaults to today.
+                    every line needs a currency (ValueError otherwise), amounts of other currencies never add up
+    the base price (price_level B) of a line is the one of a selected var_cond, else the one without var_cond.
+    surcharges (X) and discounts (D) of the selected var_conds are added / subtracted,
+    an amount that is not fix (is_fix 0) is a percentage of the base price.
+    only rows of the price_type that are valid at the date count.
+    scale prices (scale_quantity) and price rules (price_rule) are not evaluated, such rows count like any other
+
+    returns the totals (one row per configuration: base, surcharges, discounts, total, currency)
+    and the breakdown (one row per price row used, line is the position of the configuration)
+    """
+    lines = configurations_frame(configurations)
+    with report.timed("calculate_prices", rows=len(lines)):
+        if 'currency' not in lines.columns:
+            lines['currency'] = currency
+        lines['currency'] = lines['currency'].fillna(currency) if currency is not None else lines['currency']
+        if lines['currency'].isna().any():
+            raise ValueError("calculate_prices needs a currency for every line")
+        if 'date' not in lines.columns:
+            lines['date'] = None
+        lines['date'] = lines['date'].fillna(date or datetime.date.today()).map(ocd_date)
+        if 'var_conds' not in lines.columns:
+            lines['var_conds'] = [[] for _ in range(len(lines))]
+
+        # one row per line and var_cond, the empty var_cond for the base price without condition
+        conditions = lines[['article_nr', 'var_conds']].assign(line=np.arange(len(lines)))
+        conditions['var_conds'] = [[''] + var_cond_list(_) for _ in conditions['var_conds']]
+        conditions = conditions.explode('var_conds').rename(columns={'var_conds': 'var_cond'})
+        conditions = conditions.astype({'article_nr': object, 'var_cond': object})
+
+        rows = conditions.merge(price_rows(prices, price_type), on=['article_nr', 'var_cond'], how='inner')
+        rows = rows.join(lines[['currency', 'date']], on='line')
+        valid = (rows['date_from'] <= rows['date']) & (rows['date'] <= rows['date_to'])
+        valid &= rows['price_currency'] == rows['currency']
+        rows = rows[valid]
+
+        # base price: a row with a selected var_cond wins over the one without
+        base = rows[rows['price_level'] == 'B'].sort_values(['line', 'var_cond'], ascending=[True, False],
+                                                             kind='stable')
+        base = base.drop_duplicates('line')
+        base_price = pd.Series(np.nan, index=np.arange(len(lines)))
+        base_price[base['line'].to_numpy()] = base['price'].to_numpy()
+
+        rows = pd.concat([base, rows[rows['price_level'].isin(['X', 'D'])]])
+        rows['amount'] = np.where(rows['is_fix'] != 0, rows['price'],
+                                  base_price[rows['line'].to_numpy()].to_numpy() * rows['price'] / 100)
+
+        amounts = rows.pivot_table(index='line', columns='price_level', values='amount', aggfunc='sum')
+        totals = pd.DataFrame({
+            'article_nr': lines['article_nr'],
+            'currency': lines['currency'],
+            'base': base_price.to_numpy(),
+            'surcharges': amounts.get('X', pd.Series(dtype=float)).reindex(range(len(lines)), fill_value=0.0)
+                                 .fillna(0.0).to_numpy(),
+            'discounts': amounts.get('D', pd.Series(dtype=float)).reindex(range(len(lines)), fill_value=0.0)
+                                .fillna(0.0).to_numpy(),
+        })
+        totals['total'] = totals['base'] + totals['surcharges'] - totals['discounts']
+
+    breakdown = rows.sort_values(['line', 'price_level'], kind='stable')[
+        ['line', 'article_nr', 'price_level', 'var_cond', 'price', 'is_fix', 'amount', 'price_currency',
+         'price_textnr']].rename(columns={'price_currency': 'currency'})
+    return totals, breakdown.reset_index(drop=True)
+
+
+def price_rows(prices: pd.DataFrame, price_type: str = 'S') -> pd.DataFrame:
+    """
+    the rows of ocd_price as plain columns for the merge, open validity dates filled
+    """
+    columns = ['article_nr', 'var_cond', 'price_type', 'price_level', 'is_fix', 'currency', 'date_from', 'date_to',
+               'price', 'price_textnr']
+    df = prices.reindex(columns=columns)
+    df = df.astype({_: object for _ in columns if _ not in ('price', 'is_fix')})
+    df = df.assign(
+        var_cond=df['var_cond'].fillna(''),
+        date_from=df['date_from'].fillna(''),
+        date_to=df['date_to'].fillna('').replace('', '99999999'),
+        is_fix=pd.to_numeric(df['is_fix'], errors='coerce').fillna(1).astype(int).to_numpy(),
+        price=pd.to_numeric(df['price'], errors='coerce').astype(float).to_numpy(),
+    )
+    if price_type is not None:
+        df = df[df['price_type'].isna() | (df['price_type'] == price_type)]
+    return df.drop(columns=['price_type']).rename(columns={'currency': 'price_currency'})
@@ -0,0 +1,159 @@
+import time
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+
+from .instrumentation import report
+from .repository import OCDPart, Table, compact_string_columns, is_string_column
+
+
+class OCDResolver:
+    """
+    the ocd of a program joined once into a few denormalized frames for one language
+
+    articles: ocd_article with short_text and long_text
+    property_values: ocd_property x ocd_propertyvalue with prop_text and value_text,
+                     sorted by property class so the rows of a class are one contiguous slice
+    prices: ocd_price with price_text, sorted by article so the rows of an article are one contiguous slice
+    resolving an article only slices these frames, there is no merge per call
+    """
+
+    table_names = ('ocd_article', 'ocd_propertyclass', 'ocd_property', 'ocd_propertyvalue', 'ocd_price',
+                   'ocd_artshorttext', 'ocd_artlongtext', 'ocd_proptext', 'ocd_propvaluetext', 'ocd_pricetext')
+
+    def __init__(self, ocd: OCDPart, language: str = 'de'):
+        self.language = language
+        self.tables = {_: ocd.current_table(_) for _ in self.table_names}
+        # the tables are current, see is_stale
+        self.check_key = f"resolver {language}"
+        ocd.checked[self.check_key] = time.monotonic()
+        with report.timed("build_resolver", program=ocd.program_name, ofml_part=ocd.name) as labels:
+            self.articles = self.join_articles()
+            self.article_positions = {k: v[0] for k, v in self.groups(self.articles, 'article_nr').items()}
+            self.article_classes = self.join_article_classes()
+            self.property_values = self.join_property_values()
+            self.class_ranges = self.ranges(self.property_values, 'prop_class')
+            self.prices = self.join_prices()
+            self.price_ranges = self.ranges(self.prices, 'article_nr')
+            labels['rows'] = len(self.property_values) + len(self.prices)
+
+    def is_stale(self, ocd: OCDPart) -> bool:
+        """
+        one of the tables was read again since the join (e.g. by Repository.refresh()),
+        whether their files changed is checked once per check_interval of the ocd
+        """
+        if ocd.is_check_due(self.check_key):
+            return any(ocd.current_table(_) is not table for _, table in self.tables.items())
+        return any(ocd.tables.get(_, table) is not table for _, table in self.tables.items())
+
+    def frame(self, name: str, columns: list) -> pd.DataFrame:
+        table = self.tables[name]
+        if type(table) is not Table or not set(columns) <= set(table.df.columns):
+            return pd.DataFrame({_: pd.Series(dtype=object) for _ in columns})
+        df = table.df
+        # plain python strings, the key columns of the tables may be categories with different categories
+        return df.astype({_: object for _ in df.columns
+                          if isinstance(df[_].dtype, pd.CategoricalDtype) or is_string_column(df[_])})
+
+    def texts(self, name: str) -> dict:
+        """
+        textnr -> the lines of the text in the language joined by newlines
+        """
+        df = self.frame(name, ['textnr', 'language', 'line_nr', 'text'])
+        df = df[df['language'] == self.language]
+        if df.empty:
+            return {}
+        df = df.assign(text=df['text'].fillna('')).sort_values(['textnr', 'line_nr'], kind='stable')
+        return df.groupby('textnr', sort=False)['text'].agg('\n'.join).to_dict()
+
+    def join_articles(self) -> pd.DataFrame:
+        df = self.frame('ocd_article', ['article_nr', 'short_textnr', 'long_textnr'])
+        df = df.assign(short_text=df['short_textnr'].map(self.texts('ocd_artshorttext')),
+                       long_text=df['long_textnr'].map(self.texts('ocd_artlongtext')))
+        return self.compact(df)
+
+    def join_article_classes(self) -> dict:
+        """
+        article_nr -> its property classes in the order of pos_class
+        """
+        df = self.frame('ocd_propertyclass', ['article_nr', 'pos_class', 'prop_class'])
+        df = df.sort_values(['article_nr', 'pos_class'], kind='stable')
+        return df.groupby('article_nr', sort=False)['prop_class'].agg(list).to_dict()
+
+    def join_property_values(self) -> pd.DataFrame:
+        properties = self.frame('ocd_property', ['prop_class', 'property', 'pos_prop', 'prop_textnr'])
+        values = self.frame('ocd_propertyvalue', ['prop_class', 'property', 'pos_pval', 'pval_textnr'])
+        # properties without values (free input) keep one row
+        df = properties.merge(values, on=['prop_class', 'property'], how='left', suffixes=('', '_value'))
+        df = df.assign(prop_text=df['prop_textnr'].map(self.texts('ocd_proptext')),
+                       value_text=df['pval_textnr'].map(self.texts('ocd_propvaluetext')))
+        df = df.sort_values(['prop_class', 'pos_prop', 'pos_pval'], kind='stable')
+        return self.compact(df)
+
+    def join_prices(self) -> pd.DataFrame:
+        df = self.frame('ocd_price', ['article_nr', 'var_cond', 'price_textnr'])
+        df = df.assign(price_text=df['price_textnr'].map(self.texts('ocd_pricetext')))
+        df = df.sort_values('article_nr', kind='stable')
+        return self.compact(df)
+
+    @staticmethod
+    def compact(df: pd.DataFrame) -> pd.DataFrame:
+        df = df.reset_index(drop=True)
+        return compact_string_columns(df.astype({_: 'string' for _ in df.columns if df[_].dtype == object}))
+
+    @staticmethod
+    def groups(df: pd.DataFrame, column: str) -> dict:
+        return df.groupby(column, sort=False, observed=True).indices
+
+    def ranges(self, df: pd.DataFrame, column: str) -> dict:
+        """
+        key -> (start, stop) of its rows in df, which is sorted by column
+        """
+        return {k: (v[0], v[-1] + 1) for k, v in self.groups(df, column).items()}
+
+    def property_positions(self, article_nr: str) -> np.ndarray:
+        ranges = [self.class_ranges[_] for _ in self.article_classes.get(article_nr, []) if _ in self.class_ranges]
+        if not ranges:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([np.arange(*_) for _ in ranges])
+
+    def price_positions(self, article_nr: str) -> np.ndarray:
+        if article_nr not in self.price_ranges:
+            return np.empty(0, dtype=np.intp)
+        return np.arange(*self.price_ranges[article_nr])
+
+    def article(self, article_nr: str) -> Optional[dict]:
+        position = self.article_positions.get(article_nr, None)
+        if position is None:
+            return None
+        return self.articles.iloc[position].to_dict()
+
+    def resolve(self, article_nr: str) -> dict:
+        """
+        article (dict or None), properties (one row per property value) and prices of an article
+        """
+        return {
+            'article': self.article(article_nr),
+            'properties': self.property_values.iloc[self.property_positions(article_nr)],
+            'prices': self.prices.iloc[self.price_positions(article_nr)],
+        }
+
+    def resolve_many(self, article_nrs: Iterable[str]) -> dict:
+        """
+        resolve several articles at once, articles, properties and prices are one frame each,
+        the properties carry the article_nr they were resolved for
+        """
+        article_nrs = list(dict.fromkeys(article_nrs))
+        article_positions = [self.article_positions[_] for _ in article_nrs if _ in self.article_positions]
+
+        property_positions = [self.property_positions(_) for _ in article_nrs]
+        properties = self.property_values.iloc[np.concatenate(property_positions) if property_positions else []]
+        properties = properties.reset_index(drop=True)
+        properties.insert(0, 'article_nr', np.repeat(article_nrs, [len(_) for _ in property_positions]))
+
+        price_positions = [self.price_positions(_) for _ in article_nrs]
+        return {
+            'articles': self.articles.iloc[article_positions],
+            'properties': properties,
+            'prices': self.prices.iloc[np.concatenate(price_positions) if price_positions else []],
+        }
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+from loguru import logger
+
+
+def copy_parsed(value):
+    """
+    copy of nested dicts and lists, the leaves (str) are immutable. much cheaper than copy.deepcopy
+    """
+    if isinstance(value, dict):
+        return value.__class__((k, copy_parsed(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [copy_parsed(_) for _ in value]
+    return value
+
+
+class ParseCache:
+    """
+    parsed content of small text files (registries, inp_descr) keyed by the hash of their bytes
+
+    most programs ship the same inp_descr files, an identical content is parsed once per process.
+    every hit returns a copy, callers may change what they get (e.g. load_go adds tables).
+    with a path the entries are kept in a json file: loaded in __init__, written by save()
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_entries: int = 4096):
+        self.path = Path(path) if path is not None else None
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, object] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(data: bytes, parser: Callable) -> str:
+        return f"{parser.__name__}:{hashlib.sha1(data).hexdigest()}"
+
+    def parse(self, data: bytes, parser: Callable[[str], object], encoding: str = "cp1252"):
+        """
+        parser(data decoded) or a copy of its result for the same content
+        """
+        key = self.key(data, parser)
+        with self.lock:
+            parsed = self.entries.get(key, None)
+            if parsed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy_parsed(parsed)
+        parsed = parser(data.decode(encoding))
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = parsed
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return copy_parsed(parsed)
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                entries = json.load(f, object_pairs_hook=OrderedDict)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"ParseCache could not read {self.path} (start empty) | {e}")
+            return
+        with self.lock:
+            self.entries.update(entries)
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            content = json.dumps(self.entries)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
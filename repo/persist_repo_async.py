@@ -1,96 +1,255 @@
+import os
 import re
 from datetime import datetime
 from pathlib import Path
 import asyncio
 import time
 from loguru import logger
-from typing import Coroutine, Any, Generator
 
-from repo.repository import NotAvailable
-from .repository_async import RepositoryAsync, ProgramAsync, Table
+from repo.repository import NotAvailable, OFMLPart
+from .repository_async import RepositoryAsync, ProgramAsync, Table, TableStream
 from .db_async import AsyncDatabaseInterface
+from .sync_manifest import SyncManifest
+from .progress_journal import ProgressJournal
+from .instrumentation import report
+from .snapshot import SnapshotWriter
 
 TEST_ENV = r'\\w2_fs1\edv\knps-testumgebung\Testumgebung\EasternGraphics'
 PROD_ENV = r'\\w2_fs1\edv\knps-testumgebung\ofml_development\repository'
 
-ProgramAsyncTask = Coroutine[Any, Any, ProgramAsync]
+DEFAULT_MANIFEST_PATH = Path(__file__).parents[1] / "sync_manifest.json"
+DEFAULT_JOURNAL_PATH = Path(__file__).parents[1] / "sync_journal.jsonl"
 
+def is_persisted_table(ofml_part_name: str, filename: str):
+    return not (ofml_part_name == "ocd" and not re.match(r"^(ocd_|opt)", filename))
 
-async def main(plaintext_path: str, filter_program_names: [] = None):
+
+async def main(plaintext_path: str, filter_program_names: [] = None, incremental: bool = False, manifest_path: str = None,
+               parser_workers: int = 2, writer_workers: int = None, queue_size: int = None, parse_processes: int = None,
+               report_path: str = None, prometheus_path: str = None, snapshot_path: str = None,
+               stream_threshold: int = None, table_timeout: float = None, journal_path: str = None, retries: int = 3,
+               retry_backoff: float = 1.0, **db_options):
     """
     reads all tables from repository @ plaintext_path asynchronously
     and writes all tables to database asynchronously
+
+    parser_workers load programs and put their tables into a queue of queue_size tables,
+    writer_workers (default: size of the connection pool) persist them. a read table keeps its read slot
+    until it is in the queue, so at most queue_size + the read slots of the RepositoryAsync tables are in memory
+    parse_processes: parse the tables in a process pool of this size instead of threads
+    report_path: write the per stage/program/table timings as .json or .csv
+    prometheus_path: write them as textfile for the node_exporter
+    snapshot_path: also write the read tables as snapshot (see Repository.open_snapshot),
+    an incremental run takes the tables whose file did not change from the former snapshot
+    stream_threshold: tables whose file is larger (bytes) go to the database in chunks of batch_size rows
+    and are never read as a whole (they are left out of the snapshot)
+    table_timeout: seconds after which the read of a table is given up and the table skipped
+    journal_path: the tables committed so far are recorded there, a run after a failed one resumes it
+    and skips the tables that were committed (see ProgressJournal)
+    retries, retry_backoff: a table whose persisting fails (e.g. a lost connection) is tried again
+    retries times after retry_backoff * 2 ** attempt seconds before the run fails
+
+    incremental: only read and persist tables whose source file changed since
+    the last run recorded in the manifest @ manifest_path
+    db_options: method ("batch" | "load_data"), batch_size and mode ("delete" | "swap"),
+    default from config.ini [persist]
     """
     logger.debug(f"START PERSIST DB plaintext_path={plaintext_path}")
     logger.debug(f"filter_program_names: {filter_program_names}")
-    repo = RepositoryAsync(Path(plaintext_path))
+    report.reset()
+    report.enabled = True
+    # identical tables of several programs are parsed once, their content hash goes to the manifest
+    repo = RepositoryAsync(Path(plaintext_path), parse_processes=parse_processes, table_timeout=table_timeout,
+                           dedup=True)
+
+    manifest = SyncManifest(manifest_path or DEFAULT_MANIFEST_PATH, repo.root)
 
     # establish db connection and read profiles
     db: AsyncDatabaseInterface
     _, db = await asyncio.gather(
         repo.read_profiles(),
-        AsyncDatabaseInterface.create(asyncio.get_event_loop())
+        AsyncDatabaseInterface.create(asyncio.get_event_loop(), **db_options)
     )
 
-    # list that stores tasks to persist tables
-    persist_tasks: list[asyncio.Task] = []
+    journal = ProgressJournal(journal_path or DEFAULT_JOURNAL_PATH, repo.root, db.mode)
+    if journal.resumed:
+        # what the unfinished run committed counts as persisted
+        for key, entry in journal.manifest_entries().items():
+            manifest.tables.setdefault(key, {}).update(entry)
+        if db.mode == "swap":
+            await db.resume_staging_tables(journal.staged_programs())
+
+    snapshot = None
+    if snapshot_path:
+        snapshot = SnapshotWriter(Path(snapshot_path),
+                                  previous=Path(snapshot_path) if incremental or journal.resumed else None)
+    # keys of the tables read only for the snapshot, they are in the database already
+    snapshot_only = set()
 
-    load_program_tasks: list[ProgramAsyncTask] = []
+    def filter_unchanged(program: ProgramAsync, ofml_part: OFMLPart, filename: str):
+        if not is_persisted_table(ofml_part.name, filename):
+            # not in the database nor the manifest, read again for the snapshot
+            return snapshot is not None
+        path = ofml_part.path / filename
+        if journal.is_committed(program.name, ofml_part.name, filename, path):
+            # the previous snapshot is older than what the unfinished run committed
+            if snapshot:
+                snapshot_only.add(manifest.key(program.name, ofml_part.name, filename))
+            return snapshot is not None
+        if not incremental:
+            return True
+        try:
+            timestamp_modified = os.stat(path).st_mtime
+        except OSError:
+            # let read_table report the missing file
+            return True
+        if manifest.is_modified(program.name, ofml_part.name, filename, timestamp_modified, path=path):
+            return True
+        if snapshot:
+            snapshot.keep_previous(program.name, ofml_part.name, filename)
+        return False
 
+    table_filter = filter_unchanged if incremental or journal.resumed else None
+    if table_filter:
+        logger.debug(f"incremental run, manifest knows {len(manifest.tables)} tables")
+
+    # list the share once instead of a round trip per file
+    await repo.discover()
     program_names = repo.program_names()
 
     if filter_program_names:
         program_names = [_ for _ in program_names if _ in filter_program_names]
 
+    # one writer per pooled connection, a bounded queue between parsers and writers applies backpressure
+    writer_workers = writer_workers or db.pool.maxsize
+    table_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or 2 * writer_workers)
+    program_queue: asyncio.Queue = asyncio.Queue()
     for name in program_names:
-        logger.debug(f"load program {name}")
-        load_program_tasks.append(repo.load_program(
-            name,
-            keep_in_memory=True
-            ))
-
-    def chunked(lst: list[ProgramAsyncTask], n: int) -> Generator:
-        """
-        return subsets of list as generator
-        """
-        for i in range(0, len(lst), n):
-            yield lst[i:i + n]
-
-    # progress only subset at once
-    chunk_size = 1  # 5
-    for chunk in chunked(load_program_tasks, chunk_size):
-
-        chunked_programs = await asyncio.gather(*chunk)
-
-        for p in chunked_programs:
-            if isinstance(p, NotAvailable):
-                logger.warning(f"Skip not available Program {p}.")
-                continue
-            logger.debug(f"persist all {len(p.all_tables)} tables of program {p.name}")
-            table: Table
-            for table in p.all_tables:
-                if not table.df.empty:
-
-                    if table.ofml_part_name == "ocd" and not re.match(r"^(ocd_|opt)", table.name):
-                        continue
-
-                    # tasks run immediately
-                    task: asyncio.Task = asyncio.create_task(
-                        db.persist_table(table, program_name=p.name),
-                        name=f"Persist {table.name} of {p.name}"
-                    )
-                    persist_tasks.append(task)
-            # wait for chunked programs to finish before progress to next
-            logger.debug("persist ...")
-            await asyncio.gather(*persist_tasks)
-
-        del chunked_programs
-
-    logger.debug("Persist all table ...")
-    await asyncio.gather(*persist_tasks)
+        program_queue.put_nowait(name)
+    logger.debug(f"pipeline with {parser_workers} parsers, {writer_workers} writers, "
+                 f"queue size {table_queue.maxsize} for {len(program_names)} programs")
+
+    async def on_table_loaded(program: ProgramAsync, table: Table | TableStream):
+        if type(table) not in (Table, TableStream):
+            return
+        if snapshot and type(table) is Table:
+            await asyncio.to_thread(snapshot.add_table, program.name, table)
+        if not is_persisted_table(table.ofml_part_name, table.name) or \
+                manifest.key(program.name, table.ofml_part_name, table.name) in snapshot_only:
+            program.release_table(table)
+            return
+        if type(table) is Table and table.df.empty and \
+                manifest.key(program.name, table.ofml_part_name, table.name) not in manifest.tables:
+            # nothing of it is in the database, recorded so an incremental run does not read it again.
+            # an empty table that had rows is persisted to remove them
+            manifest.update(program.name, table)
+            program.release_table(table)
+            return
+        await table_queue.put((program, table))
+
+    async def parse_programs():
+        while not program_queue.empty():
+            name = program_queue.get_nowait()
+            logger.debug(f"load program {name}")
+            program = await repo.load_program(
+                name,
+                keep_in_memory=False,
+                table_filter=table_filter,
+                on_table_loaded=on_table_loaded,
+                stream_threshold=stream_threshold,
+                stream_chunksize=db.batch_size,
+            )
+            if isinstance(program, NotAvailable):
+                logger.warning(f"Skip not available Program {name} {program}.")
+            elif snapshot:
+                snapshot.add_program(program)
+
+    async def write_tables():
+        while True:
+            item = await table_queue.get()
+            if item is None:
+                return
+            program, table = item
+            if await db.persist_table_retrying(table, program.name, retries=retries, backoff=retry_backoff):
+                manifest.update(program.name, table)
+                journal.commit(program.name, table)
+            # the table is written, nothing references it any longer
+            program.release_table(table)
+            del item, program, table
+
+    async def close_writers(parsers: list[asyncio.Task]):
+        await asyncio.gather(*parsers)
+        for _ in range(writer_workers):
+            await table_queue.put(None)
+
+    try:
+        # a failing worker cancels all others
+        async with asyncio.TaskGroup() as task_group:
+            for i in range(writer_workers):
+                task_group.create_task(write_tables(), name=f"writer {i}")
+            parsers = [task_group.create_task(parse_programs(), name=f"parser {i}") for i in range(parser_workers)]
+            task_group.create_task(close_writers(parsers))
+    except BaseException:
+        if snapshot:
+            snapshot.abort()
+        # the next run resumes from the journal
+        journal.close()
+        raise
+    finally:
+        repo.close()
+        if db.mode != "swap":
+            # rows written in place count even if the run fails
+            manifest.save()
+        write_report(report_path, prometheus_path)
+
+    await remove_tables(db, manifest, repo.root, program_names if filter_program_names else None)
+    if db.mode != "swap":
+        manifest.save()
+
+    if snapshot:
+        await asyncio.to_thread(snapshot.close, repo.root, repo.profiles)
+
+    if db.mode == "swap":
+        logger.debug("Swap staging tables ...")
+        with report.timed("swap_staging_tables"):
+            await db.swap_staging_tables()
+        # staged rows only count once they are swapped in
+        manifest.save()
+        write_report(report_path, prometheus_path)
+    # all rows are in place, a run after a failing update_misc must not resume the staging tables swapped in
+    journal.finish()
     await db.update_misc(path=repo.root)
 
 
+async def remove_tables(db: AsyncDatabaseInterface, manifest: SyncManifest, root: Path, program_names: list = None):
+    """
+    remove the rows and the manifest entries of the tables whose source file was removed
+    program_names: only of these programs, default all
+    """
+    if not os.path.isdir(root):
+        # an unreachable share is not a removed repository
+        logger.warning(f"remove_tables skipped, {root} is not available")
+        return
+    for key, entry in manifest.removed(program_names):
+        program_name = key.split("/")[0]
+        manifest.remove(key)
+        # other files of the program may be persisted to the same table (e.g. go_de_sr)
+        if any(k.split("/")[0] == program_name and v.get("database_table") == entry["database_table"]
+               for k, v in manifest.tables.items()):
+            continue
+        logger.info(f"remove_tables {key} was removed, remove its rows from {entry['database_table']}")
+        await db.remove_program_rows(entry["database_table"], program_name)
+
+
+def write_report(report_path: str = None, prometheus_path: str = None):
+    for stage in report.summary()[:10]:
+        logger.debug(f"stage {stage['stage']}: {stage['seconds']}s, {stage['rows']} rows")
+    if report_path:
+        report.write(Path(report_path))
+    if prometheus_path:
+        report.write_prometheus(Path(prometheus_path))
+
+
 def run_prod_env(**kwargs):
     run_with_path(PROD_ENV, **kwargs)
 
@@ -0,0 +1,141 @@
+import datetime
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Union
+from loguru import logger
+
+from .content_store import file_content_hash
+from .repository import Table, TableStream
+
+
+class ProgressJournal:
+    """
+    the tables a run committed to the database, so a failed run is resumed instead of started over
+
+    one json line per committed table (program, ofml_part, table, database table, source file attributes,
+    content hash), written and flushed to disk as soon as the table is committed.
+    a run that finds the journal of an unfinished run of the same root and mode skips the tables recorded
+    there whose source file is unchanged. finish() removes the journal after a successful run
+    """
+
+    def __init__(self, path: Path, root: Path, mode: str):
+        self.path = path if isinstance(path, Path) else Path(path)
+        self.root = str(root)
+        self.mode = mode
+        self.entries: dict[str, dict] = self.read()
+        # whether this run continues an unfinished one
+        self.resumed = bool(self.entries)
+        if self.resumed:
+            logger.info(f"ProgressJournal resumes the unfinished run of {self.path} ({len(self.entries)} tables done)")
+        # written again without a half written last line
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.write({'root': self.root, 'mode': self.mode,
+                    'started': datetime.datetime.now().isoformat(timespec='seconds')})
+        for entry in self.entries.values():
+            self.write(entry)
+
+    def read(self) -> dict[str, dict]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return {}
+        except OSError as e:
+            logger.warning(f"ProgressJournal could not read {self.path} (start over) | {e}")
+            return {}
+        entries = {}
+        for i, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of a run that was killed while writing it
+                continue
+            if i == 0:
+                if entry.get('root') != self.root or entry.get('mode') != self.mode:
+                    logger.info(f"ProgressJournal {self.path} belongs to another run (start over)")
+                    return {}
+                continue
+            entries[self.key(entry['program'], entry['ofml_part'], entry['table'])] = entry
+        return entries
+
+    def write(self, entry: dict):
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    @staticmethod
+    def key(program_name: str, ofml_part_name: str, filename: str) -> str:
+        return f"{program_name}/{ofml_part_name}/{filename}"
+
+    def is_committed(self, program_name: str, ofml_part_name: str, filename: str, path: Path) -> bool:
+        """
+        the table was committed by the unfinished run and its file did not change since
+        """
+        entry = self.entries.get(self.key(program_name, ofml_part_name, filename))
+        if entry is None:
+            return False
+        try:
+            file_attributes = os.stat(path)
+        except OSError:
+            return False
+        if (file_attributes.st_size, file_attributes.st_mtime_ns) == (entry['st_size'], entry['st_mtime_ns']):
+            return True
+        try:
+            return entry['content_hash'] is not None and file_content_hash(path) == entry['content_hash']
+        except OSError:
+            return False
+
+    def commit(self, program_name: str, table: Union[Table, TableStream]):
+        entry = {
+            'program': program_name,
+            'ofml_part': table.ofml_part_name,
+            'table': table.name,
+            'database_table': table.database_table_name,
+            'path': str(table.path),
+            'st_size': table.file_size,
+            'st_mtime_ns': table.stat_dict['st_mtime_ns'],
+            'timestamp_modified': table.timestamp_modified,
+            'timestamp_read': table.timestamp_read,
+            'content_hash': getattr(table, 'content_hash', None),
+        }
+        self.entries[self.key(program_name, table.ofml_part_name, table.name)] = entry
+        self.write(entry)
+
+    def staged_programs(self) -> dict[str, set]:
+        """
+        database table -> programs committed to its staging table (mode swap)
+        """
+        staged = defaultdict(set)
+        for entry in self.entries.values():
+            staged[entry['database_table']].add(entry['program'])
+        return staged
+
+    def manifest_entries(self) -> dict[str, dict]:
+        """
+        the entries as SyncManifest.tables
+        """
+        entries = {}
+        for key, entry in self.entries.items():
+            entries[key] = {'timestamp_modified': entry['timestamp_modified'],
+                            'timestamp_read': entry['timestamp_read'], 'content_hash': entry['content_hash'],
+                            'database_table': entry['database_table']}
+            # SyncManifest.removed finds the removed files by their path
+            if entry.get('path'):
+                entries[key]['path'] = entry['path']
+        return entries
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def finish(self):
+        """
+        the run succeeded, the next one starts over
+        """
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,135 @@
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from loguru import logger
+
+from .instrumentation import report
+from .repository import Repository, Table
+
+try:
+    import duckdb
+except ImportError:
+    # optional, only RepositoryQuery needs it
+    duckdb = None
+
+
+def arrow_table(table: Table, program_name: str) -> pa.Table:
+    """
+    the df of a Table as arrow table with the sql_db_* columns of the database schema
+
+    arrow backed columns (pyarrow engine, snapshots) are not copied, columns of python strings are converted
+    """
+    arrow = pa.Table.from_pandas(table.df, preserve_index=False)
+    # categories of all programs in one column, their index types must agree
+    for i, field in enumerate(arrow.schema):
+        if pa.types.is_dictionary(field.type) and field.type.index_type != pa.int32():
+            arrow = arrow.set_column(i, field.name, arrow.column(i).cast(pa.dictionary(pa.int32(),
+                                                                                      field.type.value_type)))
+    rows = arrow.num_rows
+    program = pa.DictionaryArray.from_arrays(pa.array(np.zeros(rows, dtype=np.int32)), pa.array([program_name]))
+    return (arrow.append_column('sql_db_program', program)
+            .append_column('sql_db_timestamp_modified', pa.array(np.full(rows, table.timestamp_modified)))
+            .append_column('sql_db_timestamp_read', pa.repeat(pa.scalar(table.timestamp_read), rows)))
+
+
+class RepositoryQuery:
+    """
+    sql over the read tables of a Repository in an in-process duckdb
+
+    every database_table_name (ocd_article, ...) is one relation of the tables of all loaded programs,
+    with the columns sql_db_program, sql_db_timestamp_modified and sql_db_timestamp_read like in mysql:
+
+        RepositoryQuery(repo).sql("SELECT DISTINCT sql_db_program FROM ocd_property WHERE property = ?", ["COLOR"])
+
+    duckdb scans the arrow buffers of the tables in place. the tables are converted once,
+    refresh() registers only the relations whose tables were read again, added or removed since
+    tables: names of tables to read first (e.g. for a lazy Repository or a snapshot)
+    """
+
+    def __init__(self, repository: Repository, tables: Optional[Iterable[str]] = None, connection=None):
+        if duckdb is None:
+            raise ImportError("RepositoryQuery needs duckdb (pip install duckdb)")
+        self.repository = repository
+        self.tables = list(tables) if tables is not None else []
+        self.connection = connection if connection is not None else duckdb.connect()
+        # database_table_name -> the registered Tables and their arrow table
+        self.registered: dict[str, tuple[list[Table], pa.Table]] = {}
+        # id of a registered Table -> the Table and its converted arrow table
+        self.converted: dict[int, tuple[Table, pa.Table]] = {}
+        self.refresh()
+
+    def __enter__(self) -> 'RepositoryQuery':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def loaded_tables(self) -> dict[str, list[tuple[str, Table]]]:
+        """
+        database_table_name -> (program name, Table) of every read table
+        """
+        tables = {}
+        for program in self.repository.programs():
+            for ofml_part in program.loaded_ofml_parts():
+                for name in self.tables:
+                    if ofml_part.filename_of(name) is not None:
+                        ofml_part.current_table(name)
+            for table in program.all_tables:
+                tables.setdefault(table.database_table_name, []).append((program.name, table))
+        return tables
+
+    def refresh(self) -> list[str]:
+        """
+        register the relations again whose tables changed, returns their names
+        """
+        changed = []
+        with report.timed("register_query_tables") as labels:
+            tables = self.loaded_tables()
+            for name in [_ for _ in self.registered if _ not in tables]:
+                self.connection.unregister(name)
+                del self.registered[name]
+                changed.append(name)
+            for name, program_tables in tables.items():
+                registered = self.registered.get(name, None)
+                if registered is not None and len(registered[0]) == len(program_tables) and \
+                        all(a is b for a, (_, b) in zip(registered[0], program_tables)):
+                    continue
+                try:
+                    arrow = pa.concat_tables([self.convert(table, program_name)
+                                              for program_name, table in program_tables], promote_options='permissive')
+                except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                    logger.warning(f"RepositoryQuery could not register {name} (dropped) | {e}")
+                    # a query must fail rather than see the former tables
+                    if self.registered.pop(name, None) is not None:
+                        self.connection.unregister(name)
+                        changed.append(name)
+                    continue
+                self.connection.register(name, arrow)
+                self.registered[name] = ([table for _, table in program_tables], arrow)
+                changed.append(name)
+            current = {id(table) for program_tables, _ in self.registered.values() for table in program_tables}
+            self.converted = {k: v for k, v in self.converted.items() if k in current}
+            labels['rows'] = len(changed)
+        return changed
+
+    def convert(self, table: Table, program_name: str) -> pa.Table:
+        converted = self.converted.get(id(table), None)
+        if converted is None or converted[0] is not table:
+            converted = self.converted[id(table)] = (table, arrow_table(table, program_name))
+        return converted[1]
+
+    def sql(self, query: str, parameters=None) -> pd.DataFrame:
+        with report.timed("query"):
+            return self.connection.execute(query, parameters).df()
+
+    def arrow(self, query: str, parameters=None) -> pa.Table:
+        with report.timed("query"):
+            result = self.connection.execute(query, parameters).arrow()
+        # a RecordBatchReader in newer duckdb versions
+        return result.read_all() if isinstance(result, pa.RecordBatchReader) else result
+
+    def close(self):
+        self.connection.close()
+        self.registered.clear()
+        self.converted.clear()
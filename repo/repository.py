@@ -1,12 +1,23 @@
 import csv
+import io
 import os
 import re
+import stat
+import time
 import datetime
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, Union
+from typing import Optional, Dict, Union, Iterator
+import numpy as np
 import pandas as pd
 
+from .content_store import ContentStore, content_hash
+from .instrumentation import report
+from .parse_cache import ParseCache
+from .stat_cache import StatCache
+from .table_cache import TableCache
+
 
 def catch_file_exception(f):
     def wrapper(*args, **kwargs):
@@ -34,36 +45,179 @@ class Repository:
         return f"Repository {self.root} -> {self.__programs.items()}"
 
     def __init__(self, root: Path, **kwargs):
+        """
+        kwargs are handed to every loaded Program, e.g. engine="pyarrow" (see OFMLPart.options)
+        """
         self.root = root if isinstance(root, Path) else Path(root)
 
         self.profiles = None
         self.__programs = OrderedDict()
+        self.program_options = kwargs
+        # existence and attributes of the files, shared by the loaded programs, see discover()
+        self.stats = StatCache()
+        # registries read by discover(), load_program uses each once
+        self.registries: Dict[str, ConfigFile] = {}
+        # the RepositoryQuery of sql(), see query.py
+        self.query = None
 
     def programs(self):
         return self.__programs.values()
 
+    def add_program(self, program: 'Program', program_name: str = None):
+        """
+        keep a Program that was not loaded by load_program (e.g. of a snapshot)
+        """
+        self.__programs[program_name or program.name] = program
+
     def __getitem__(self, program) -> 'Program':
+        if program not in self.__programs and self.program_options.get('lazy', False) and self.profiles is not None:
+            self.load_program(program)
         return self.__programs[program]
 
+    def save_snapshot(self, path: Path):
+        """
+        write the loaded programs and their read tables to a snapshot directory, see snapshot.py
+        """
+        from .snapshot import save_snapshot
+        save_snapshot(self, path)
+
+    @classmethod
+    def open_snapshot(cls, path: Path, **kwargs) -> 'Repository':
+        """
+        a Repository of the programs of a snapshot, its tables are memory-mapped on first access
+        kwargs as for Repository
+        """
+        from .snapshot import open_snapshot
+        return open_snapshot(path, repository_cls=cls, **kwargs)
+
+    def diff(self, other: 'Repository', **kwargs) -> Iterator:
+        """
+        the TableDiffs from this repository to other, yielded program by program as they are compared,
+        see repository_diff.py
+        kwargs: max_workers, partition_rows
+        """
+        from .repository_diff import RepositoryDiff
+        return iter(RepositoryDiff(self, other, **kwargs))
+
+    def sql(self, query: str, parameters=None, tables=None) -> pd.DataFrame:
+        """
+        run a duckdb query over the read tables of the loaded programs, see query.RepositoryQuery
+        tables: names of tables to read first
+        """
+        from .query import RepositoryQuery
+        if self.query is None:
+            self.query = RepositoryQuery(self, tables)
+        else:
+            self.query.tables = list(dict.fromkeys([*self.query.tables, *(tables or [])]))
+            self.query.refresh()
+        return self.query.sql(query, parameters)
+
+    def refresh(self, stats: StatCache = None) -> dict:
+        """
+        reload what changed on the filesystem since it was read
+
+        changed profiles add (unless lazy, then on access) and remove programs,
+        a program whose registry changed is replaced, an OFMLPart whose inp_descr changed is read again,
+        changed tables are read again. the OFMLParts and tables read before are read again, nothing else.
+        the files are compared directory-wise through a StatCache, tables of a snapshot are never refreshed
+        returns the names of what changed
+
+        not thread-safe: programs and tables are replaced in place, a reader in another thread
+        (e.g. while a RepositoryWatcher refreshes) must hold the watcher's lock to never see a half refreshed program
+        """
+        if stats is None:
+            # what is read again takes its attributes from this listing
+            stats = self.stats
+            stats.clear()
+        changes = {'profiles': False, 'added': [], 'removed': [], 'programs': [], 'ofml_parts': [], 'tables': []}
+        with report.timed("refresh") as labels:
+            if self.profiles is not None and self.profiles.is_modified(stats):
+                self.read_profiles()
+                changes['profiles'] = True
+                program_names = self.program_names()
+                for program_name in [_ for _ in self.__programs if _ not in program_names]:
+                    del self.__programs[program_name]
+                    changes['removed'].append(program_name)
+                if not self.program_options.get('lazy', False):
+                    for program_name in [_ for _ in program_names if _ not in self.__programs]:
+                        if not isinstance(self.load_program(program_name), NotAvailable):
+                            changes['added'].append(program_name)
+
+            for program_name, program in list(self.__programs.items()):
+                ofml_parts = program.loaded_ofml_parts()
+                if any(_.snapshot is not None for _ in ofml_parts):
+                    continue
+                if program.registry.is_modified(stats):
+                    self.reload_program(program_name, program)
+                    changes['programs'].append(program_name)
+                    continue
+                for ofml_part in ofml_parts:
+                    if ofml_part.inp_descr is not None and ofml_part.inp_descr.is_modified(stats):
+                        program.reload_ofml_part(ofml_part)
+                        changes['ofml_parts'].append((program_name, ofml_part.name))
+                        continue
+                    changes['tables'] += [(program_name, _) for _ in ofml_part.refresh_tables(stats)]
+            labels['rows'] = len(changes['tables'])
+        return changes
+
+    def reload_program(self, program_name: str, program: 'Program') -> Union['Program', NotAvailable]:
+        """
+        replace a Program by a new one that reads the OFMLParts and tables the former one had read
+        """
+        del self.__programs[program_name]
+        new_program = self.load_program(program_name, program_cls=type(program))
+        if not isinstance(new_program, NotAvailable):
+            for ofml_part in program.loaded_ofml_parts():
+                new_program.reload_ofml_part(ofml_part)
+        return new_program
+
+    def discover(self, max_workers: int = 16):
+        """
+        list the directories of the repository and read the registries in a thread pool,
+        the programs loaded afterwards take existence and attributes of their files from self.stats
+        instead of a round trip to the share per file
+        """
+        with report.timed("discover") as labels:
+            self.stats.prefetch([self.root / 'profiles', self.root / 'registry', self.root / 'kn'], max_workers)
+            kn = self.stats.directory(self.root / 'kn') or {}
+            program_paths = [self.root / 'kn' / _ for _, file_attributes in kn.items()
+                             if stat.S_ISDIR(file_attributes.st_mode)]
+            self.stats.prefetch([_ for program_path in program_paths for _ in (
+                program_path, program_path / '2', program_path / 'DE', program_path / 'DE' / '2',
+            )], max_workers)
+
+            if self.profiles is None:
+                return
+            program_names = self.program_names()
+            with ThreadPoolExecutor(max_workers) as pool:
+                registries = dict(zip(program_names, pool.map(self.read_registry, program_names)))
+            self.registries = {k: v for k, v in registries.items() if isinstance(v, ConfigFile)}
+            self.stats.prefetch([self.root / v[_] for v in self.registries.values()
+                                 for _ in ('productdb_path', 'oam_path') if _ in v], max_workers)
+            labels['rows'] = len(self.stats.directories)
+
     def read_profiles(self):
-        self.profiles = ConfigFile(self.root / 'profiles' / 'kn.cfg')
+        with report.timed("read_profiles"):
+            path = self.root / 'profiles' / 'kn.cfg'
+            self.profiles = ConfigFile(path, stat_result=self.stats.stat(path))
 
     def read_registry(self, program):
         registry_name = self.program_name2registry_name(program)
+        path = self.root / 'registry' / f'{registry_name}.cfg'
         try:
-            return ConfigFile(self.root / 'registry' / f'{registry_name}.cfg')
+            return ConfigFile(path, stat_result=self.stats.stat(path))
         except (ValueError, FileNotFoundError,) as e:
             return NotAvailable(e)
 
-    def load_program(self, program_name: str, keep_in_memory: bool = True, program_cls=None) -> Union['Program', NotAvailable]:
+    def load_program(self, program_name: str, keep_in_memory: bool = True, program_cls=None, **kwargs) -> Union['Program', NotAvailable]:
         if program_cls is None:
             program_cls = Program
-        reg = self.read_registry(program_name)
+        reg = self.registries.pop(program_name, None) or self.read_registry(program_name)
 
         if isinstance(reg, NotAvailable):
             return reg
 
-        program = program_cls(registry=reg, root=self.root)
+        program = program_cls(registry=reg, root=self.root, stats=self.stats, **{**self.program_options, **kwargs})
         if keep_in_memory:
             self.__programs[program_name] = program
         return program
@@ -83,12 +237,47 @@ class Repository:
         raise NotImplementedError(f'Program {program} has no registry entry in profiles')
 
 
+class LazyOFMLPart:
+    """
+    OFMLPart attribute of a Program (ocd, oam, ...)
+    for a lazy Program the inp_descr is read on first access
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, program: 'Program', owner):
+        if program is None:
+            return self
+        ofml_part = program.__dict__.get(self.name, None)
+        if ofml_part is None and program.lazy and getattr(program, f'contains_{self.name}')():
+            # the sync loader, ProgramAsync overrides load_* with coroutines
+            ofml_part = getattr(Program, f'load_{self.name}')(program)
+        return ofml_part
+
+    def __set__(self, program: 'Program', ofml_part):
+        program.__dict__[self.name] = ofml_part
+
+
 class Program:
 
+    ocd = LazyOFMLPart()
+    oam = LazyOFMLPart()
+    go = LazyOFMLPart()
+    oas = LazyOFMLPart()
+    oap = LazyOFMLPart()
+    odb = LazyOFMLPart()
+
     def __init__(self, **kwargs):
         self.registry: ConfigFile = kwargs['registry']
         self.root: Path = kwargs['root']
         self.name: str = self.registry['program']
+        self.lazy: bool = kwargs.get('lazy', False)
+        # existence and attributes of the files if the Repository discovered them
+        self.stats: Optional[StatCache] = kwargs.get('stats', None)
+        # whether the program has an odb and oap, e.g. as recorded by a snapshot, instead of looking at the files
+        self.contains: dict[str, bool] = kwargs.get('contains', None) or {}
+        self.ofml_part_options = {_: kwargs[_] for _ in OFMLPart.options if _ in kwargs}
 
         self.program_path = self.root / 'kn' / self.name
 
@@ -111,34 +300,47 @@ class Program:
     @property
     def all_tables(self):
         tables = []
-        if self.is_ocd_available():
-            for table in self.ocd.tables.values():
-                if type(table) is Table:
-                    tables.append(table)
-        if self.is_oas_available():
-            for table in self.oas.tables.values():
-                if type(table) is Table:
-                    tables.append(table)
-        if self.is_oam_available():
-            for table in self.oam.tables.values():
-                if type(table) is Table:
-                    tables.append(table)
-        if self.is_go_available():
-            for table in self.go.tables.values():
-                if type(table) is Table:
-                    tables.append(table)
-        if self.is_oap_available():
-            for table in self.oap.tables.values():
-                if type(table) is Table:
-                    tables.append(table)
-        if self.is_odb_available():
-            for table in self.odb.tables.values():
+        for ofml_part in self.loaded_ofml_parts():
+            for table in ofml_part.tables.values():
                 if type(table) is Table:
                     tables.append(table)
         return tables
 
+    def reload_ofml_part(self, ofml_part: 'OFMLPart') -> Union['OFMLPart', NotAvailable]:
+        """
+        read an OFMLPart again with the tables that were read of the former one
+        """
+        # the sync loader, ProgramAsync overrides load_* with coroutines
+        new_ofml_part = getattr(Program, f'load_{ofml_part.name}')(self)
+        if isinstance(new_ofml_part, OFMLPart):
+            for name, table in ofml_part.tables.items():
+                filename = new_ofml_part.filename_of(name)
+                if filename is None:
+                    continue
+                columns = None
+                if type(table) is Table and filename in ofml_part.tables_definitions:
+                    columns = ofml_part.projection(filename, table)
+                new_ofml_part.read_table(filename, columns=columns)
+        return new_ofml_part
+
+    def release_table(self, table: 'Table'):
+        """
+        drop a read table from its OFMLPart to free its memory
+        """
+        ofml_part = self.__dict__.get(table.ofml_part_name)
+        if isinstance(ofml_part, OFMLPart):
+            ofml_part.tables.pop(re.sub(r'\..+$', '', table.name), None)
+
+    def loaded_ofml_parts(self) -> list['OFMLPart']:
+        """
+        the OFMLParts read so far, never triggers a lazy load
+        """
+        ofml_parts = [self.__dict__.get(_) for _ in ('ocd', 'oas', 'oam', 'go', 'oap', 'odb')]
+        return [_ for _ in ofml_parts if isinstance(_, OFMLPart)]
+
     def load_ocd(self):
-        return self._read_ofml_part(ofml_part='ocd', inp_descr=self.paths['ocd'] / 'pdata.inp_descr', name="ocd")
+        return self._read_ofml_part(ofml_part='ocd', inp_descr=self.paths['ocd'] / 'pdata.inp_descr', name="ocd",
+                                    ofml_part_cls=OCDPart)
 
     def load_oam(self):
         return self._read_ofml_part(ofml_part='oam', inp_descr=self.paths['oam'] / 'oam.inp_descr', name="oam")
@@ -193,22 +395,22 @@ class Program:
             self.load_oas()
 
     def is_ocd_available(self):
-        return type(self.ocd) is OFMLPart
+        return isinstance(self.ocd, OFMLPart)
 
     def is_oam_available(self):
-        return type(self.oam) is OFMLPart
+        return isinstance(self.oam, OFMLPart)
 
     def is_oas_available(self):
-        return type(self.oas) is OFMLPart
+        return isinstance(self.oas, OFMLPart)
 
     def is_go_available(self):
-        return type(self.go) is OFMLPart
+        return isinstance(self.go, OFMLPart)
 
     def is_odb_available(self):
-        return type(self.odb) is OFMLPart
+        return isinstance(self.odb, OFMLPart)
 
     def is_oap_available(self):
-        return type(self.oap) is OFMLPart
+        return isinstance(self.oap, OFMLPart)
 
     def load_all(self):
         if self.contains_ocd():
@@ -234,23 +436,30 @@ class Program:
         return 'series_type' in self.registry and 'meta_type' in self.registry
 
     def contains_odb(self):
+        if 'odb' in self.contains:
+            return self.contains['odb']
         odb_path = self.root / f'kn/{self.name}/2'
-        return odb_path.exists()
+        return self.exists(odb_path)
 
     def contains_oap(self):
+        if 'oap' in self.contains:
+            return self.contains['oap']
         oap_path = self.root / f'kn/{self.name}/DE/2/oap'
-        return oap_path.exists()
+        return self.exists(oap_path)
+
+    def exists(self, path: Path) -> bool:
+        return self.stats.exists(path) if self.stats is not None else path.exists()
 
     def contains_oas(self):
         return 'type' in self.registry and self.registry.get('cat_type', None) in ['XCF']
 
     def ofml_parts(self):
         return {
-            'ocd': {'features': self.contains_ocd(), 'loaded': bool(self.ocd)},
-            'oam': {'features': self.contains_oam(), 'loaded': bool(self.oam)},
-            'go': {'features': self.contains_go(), 'loaded': bool(self.go)},
-            'oas': {'features': self.contains_oas(), 'loaded': bool(self.oas)},
-            'oap': {'features': self.contains_oap(), 'loaded': bool(self.oap)},
+            'ocd': {'features': self.contains_ocd(), 'loaded': bool(self.__dict__.get('ocd'))},
+            'oam': {'features': self.contains_oam(), 'loaded': bool(self.__dict__.get('oam'))},
+            'go': {'features': self.contains_go(), 'loaded': bool(self.__dict__.get('go'))},
+            'oas': {'features': self.contains_oas(), 'loaded': bool(self.__dict__.get('oas'))},
+            'oap': {'features': self.contains_oap(), 'loaded': bool(self.__dict__.get('oap'))},
         }
 
     def featured_ofml_parts(self):
@@ -265,13 +474,19 @@ class Program:
         assert inp_descr is not None or tables_definitions is not None
 
         ofml_part = kwargs['ofml_part']
+        ofml_part_cls = kwargs.get('ofml_part_cls', OFMLPart)
 
-        if inp_descr:
-            self.__setattr__(ofml_part, OFMLPart.from_inp_descr(inp_descr, kwargs["name"]))
+        with report.timed("load_ofml_part", program=self.name, ofml_part=ofml_part):
+            if inp_descr:
+                self.__setattr__(ofml_part, ofml_part_cls.from_inp_descr(inp_descr, kwargs["name"], program=self.name,
+                                                                         stats=self.stats, **self.ofml_part_options))
 
-        else:
-            path = kwargs['path']
-            self.__setattr__(ofml_part, OFMLPart.from_tables_definitions(tables_definitions, path, kwargs["name"]))
+            else:
+                path = kwargs['path']
+                self.__setattr__(ofml_part, ofml_part_cls.from_tables_definitions(tables_definitions, path,
+                                                                                  kwargs["name"], program=self.name,
+                                                                                  stats=self.stats,
+                                                                                  **self.ofml_part_options))
 
         return self.__getattribute__(ofml_part)
 
@@ -284,9 +499,12 @@ class Program:
 
 class TimestampFile:
 
-    def __init__(self, path):
+    def __init__(self, path, stat_result: os.stat_result = None):
+        """
+        stat_result: the known attributes of the file (e.g. of a snapshot), otherwise it is stat'ed
+        """
         self.path = path
-        self._file_attributes = os.stat(self.path)
+        self._file_attributes = stat_result or os.stat(self.path)
         timestamp = datetime.datetime.now()
         self.timestamp_read = timestamp.strftime("%Y-%m-%d-%H-%M-%S")
 
@@ -300,6 +518,35 @@ class TimestampFile:
     def timestamp_modified(self) -> float:
         return self._file_attributes.st_mtime
 
+    @property
+    def file_size(self) -> int:
+        return self._file_attributes.st_size
+
+    @property
+    def stat_dict(self) -> dict:
+        """
+        the attributes the TimestampFile uses, stat_result_from_dict restores them
+        """
+        return {'st_size': self._file_attributes.st_size, 'st_mtime': self._file_attributes.st_mtime,
+                'st_mtime_ns': self._file_attributes.st_mtime_ns}
+
+    def is_modified(self, stats: StatCache = None) -> bool:
+        """
+        the file changed or vanished since it was read
+        stats: take the current attributes from this StatCache instead of a stat of the file
+        """
+        if stats is not None:
+            file_attributes = stats.stat(self.path)
+        else:
+            try:
+                file_attributes = os.stat(self.path)
+            except OSError:
+                file_attributes = None
+        if file_attributes is None:
+            return True
+        return (file_attributes.st_mtime_ns, file_attributes.st_size) != \
+            (self._file_attributes.st_mtime_ns, self._file_attributes.st_size)
+
     def is_newer(self, other: 'TimestampFile'):
         return self.timestamp_modified > other.timestamp_modified
 
@@ -307,12 +554,23 @@ class TimestampFile:
         return self.timestamp_modified < other.timestamp_modified
 
 
+def stat_result_from_dict(d: dict) -> os.stat_result:
+    """
+    an os.stat_result with the attributes of TimestampFile.stat_dict
+    """
+    return os.stat_result((0, 0, 0, 0, 0, 0, d['st_size'], 0, int(d['st_mtime']), 0),
+                          {'st_mtime': d['st_mtime'], 'st_mtime_ns': d['st_mtime_ns']})
+
+
 class ConfigFile(TimestampFile):
 
-    def __init__(self, path: Path):
-        super().__init__(path)
+    def __init__(self, path: Path, config: dict = None, stat_result: os.stat_result = None):
+        """
+        config: the already read content (e.g. of a snapshot), otherwise the file is read
+        """
+        super().__init__(path, stat_result)
         self.path = path
-        self.config = self.read()
+        self.config = self.read() if config is None else config
 
     def __iter__(self):
         return iter(self.config)
@@ -324,70 +582,132 @@ class ConfigFile(TimestampFile):
         return self.config.get(*args, **kwargs)
 
     def read(self):
-        with open(self.path, encoding="cp1252") as f:
-            section = None
-            d = OrderedDict()
-            for _ in f.readlines():
-                _ = _.strip()
-                if not _ or _.isspace() or _.startswith('#'):
-                    continue
-                if re.match(r'\[.+]', _):
-                    section = _
-                    d[section] = OrderedDict()
+        with open(self.path, 'rb') as f:
+            return parse_cache.parse(f.read(), parse_config)
 
-                if re.match('.+=.+', _):
-                    k, v = _.split('=')
-                    if section:
-                        d[section][k] = v
-                    else:
-                        d[k] = v
-        return d
+
+def database_table_name(filename: str) -> str:
+    if re.search(r"(de|en|fr|nl)\.sr$", filename):
+        language = filename[-5:-3]
+        return f"go_{language}_sr"
+    return re.sub(r"\..*$", "", filename)
 
 
 class Table(TimestampFile):
 
-    def __init__(self, df: pd.DataFrame, filepath: Path, ofml_part_name: str):
-        super().__init__(filepath)
+    def __init__(self, df: pd.DataFrame, filepath: Path, ofml_part_name: str, stat_result: os.stat_result = None,
+                 content_hash: str = None):
+        """
+        content_hash: hash of the file content the df was parsed from if it is known (see content_store.py)
+        """
+        super().__init__(filepath, stat_result)
         self.df: pd.DataFrame = df
         self.name: str = filepath.name
         self.ofml_part_name: str = ofml_part_name
-        if re.search("(de|en|fr|nl)\.sr$", self.name):
-            language = self.name[-5:-3]
-            self.database_table_name = f"go_{language}_sr"
-        else:
-            self.database_table_name = re.sub(r"\..*$", "", self.name)
+        self.database_table_name = database_table_name(self.name)
+        self.content_hash: Optional[str] = content_hash
 
     def database_column_type(self, column_name):
-        dtype = str(self.df[column_name].dtype)
+        dtype = self.df[column_name].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            # the compact mode of read_table, the values have the dtype of the categories
+            dtype = dtype.categories.dtype
+        dtype = str(dtype)
         return {
             'string': 'varchar(255)',
+            'object': 'varchar(255)',
             'float64': 'float',
             'int': 'integer',
+            'int64': 'integer',
+            # arrow backed columns of the pyarrow engine
+            'string[pyarrow]': 'varchar(255)',
+            'double[pyarrow]': 'float',
+            'int64[pyarrow]': 'integer',
         }[dtype]
 
 
+class TableStream(TimestampFile):
+    """
+    a table that is read chunk by chunk instead of as one DataFrame, iterate it for the chunks
+    it has the attributes of a Table except df
+    """
+
+    def __init__(self, ofml_part: 'OFMLPart', filename: str, chunksize: int = 100000):
+        filepath = ofml_part.path / filename
+        super().__init__(filepath, ofml_part.stats.stat(filepath) if ofml_part.stats is not None else None)
+        self.ofml_part = ofml_part
+        self.chunksize = chunksize
+        self.name: str = filename
+        self.ofml_part_name: str = ofml_part.name
+        self.database_table_name = database_table_name(self.name)
+
+    def __repr__(self):
+        return f"TableStream({self.path})"
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        return self.ofml_part.iter_table(self.name, self.chunksize)
+
+
 class OFMLPart:
     """
     this class is for reading any ofml data
+
+    options:
+        engine: "c" (pandas) or "pyarrow" (multithreaded pyarrow.csv, arrow backed DataFrames)
+        cache: TableCache to load parsed tables from instead of parsing the csv again
+        lazy: table() / [] read a table on first access
+        categorical: store repeated strings as category to save memory,
+                     "auto" (low cardinality string columns), "declared" (CATEGORICAL_COLUMNS)
+                     or a dict table -> columns
+        snapshot: directory of this OFMLPart in a snapshot (see snapshot.py), the tables are memory-mapped
+                  from there instead of parsed
+        dedup: files with identical content (e.g. of other programs) are parsed once and their Tables
+               share the DataFrame, see read_table_deduplicated
+        check_interval: seconds a read table is used by current_table (lookups, indexes) before its file
+                        is stat'ed again for changes (default 5), 0: on every access,
+                        None: never, only Repository.refresh() reads changed tables again
     """
 
-    @staticmethod
-    def from_inp_descr(inp_descr_path, name):
+    options = ('engine', 'cache', 'lazy', 'categorical', 'snapshot', 'dedup', 'check_interval')
+
+    @classmethod
+    def from_inp_descr(cls, inp_descr_path, name, **kwargs):
         tables_definitions = read_pdata_inp_descr(inp_descr_path)
         if isinstance(tables_definitions, NotAvailable):
             return tables_definitions
         path = inp_descr_path.parents[0]
-        return OFMLPart(path=path, tables_definitions=tables_definitions, name=name)
+        stats: Optional[StatCache] = kwargs.get('stats', None)
+        return cls(path=path, tables_definitions=tables_definitions, name=name,
+                   inp_descr=TimestampFile(inp_descr_path, stats.stat(inp_descr_path) if stats else None), **kwargs)
 
-    @staticmethod
-    def from_tables_definitions(tables_definitions, path, name):
-        return OFMLPart(path=path, tables_definitions=tables_definitions, name=name)
+    @classmethod
+    def from_tables_definitions(cls, tables_definitions, path, name, **kwargs):
+        return cls(path=path, tables_definitions=tables_definitions, name=name, **kwargs)
 
     def __init__(self, **kwargs):
         self.path: Path = kwargs['path']
         self.name = kwargs['name']
         self.tables_definitions = kwargs['tables_definitions']
         self.tables: Dict[str, Table] = OrderedDict()
+        self.engine: str = kwargs.get('engine', 'c')
+        if self.engine not in ENGINES:
+            raise ValueError(f"engine {self.engine} is not supported, one of {ENGINES}")
+        self.cache: Optional[TableCache] = kwargs.get('cache', None)
+        self.lazy: bool = kwargs.get('lazy', False)
+        self.categorical: Union[None, str, dict] = kwargs.get('categorical', None)
+        self.snapshot: Optional[Path] = kwargs.get('snapshot', None)
+        self.dedup: bool = kwargs.get('dedup', False)
+        self.check_interval: Optional[float] = kwargs.get('check_interval', 5.0)
+        # table -> time.monotonic() its file was last checked by current_table
+        self.checked: Dict[str, float] = {}
+        # existence and attributes of the files if the Repository discovered them
+        self.stats: Optional[StatCache] = kwargs.get('stats', None)
+        # the inp_descr the tables_definitions were read from, for Repository.refresh()
+        self.inp_descr: Optional[TimestampFile] = kwargs.get('inp_descr', None)
+        # name of the Program for the instrumentation
+        self.program_name: Optional[str] = kwargs.get('program', None)
+        # (table, columns) -> (Table the index was built on, index), see index()
+        self.indexes: Dict[tuple, tuple[Table, dict]] = {}
 
     @property
     def filepaths_from_tables_definitions(self):
@@ -400,43 +720,404 @@ class OFMLPart:
     def __repr__(self):
         return f'OFMLPart name = {self.name}'
 
-    def read_all_tables(self):
+    def read_all_tables(self, engine=None):
         # TODO: sr files will be overwritten with ";" seperator...
         for name in self.filenames_from_tables_definitions:
-            self.read_table(name)
+            self.read_table(name, engine=engine)
 
-    def read_table(self, filename, encoding="cp1252"):
-        columns, dtypes, sep = self.tables_definitions[filename]
-        table_path = self.path / filename
-        dtypes = {_[0]: _[1] for _ in zip(columns, dtypes)}
+    def read_table_kwargs(self, filename, encoding="cp1252", engine=None, columns=None) -> dict:
+        """
+        the arguments of the module function read_table for a table of this OFMLPart
+        """
+        names, dtypes, sep = self.tables_definitions[filename]
         table = re.sub(r'\..+$', '', filename)
         quoting = csv.QUOTE_MINIMAL
         # most tables we can remove the enclosing " but not in these
         if table in {"funcs", "odb2d", "odb3d"}:
             quoting = csv.QUOTE_NONE
-        self.tables[table] = read_table(table_path, columns, dtypes, encoding, sep=sep, quoting=quoting, ofml_part_name=self.name)
+        return {
+            'filepath': self.path / filename,
+            'names': names,
+            'dtype': {_[0]: _[1] for _ in zip(names, dtypes)},
+            'encoding': encoding,
+            'ofml_part_name': self.name,
+            'sep': sep,
+            'quoting': quoting,
+            'engine': engine or self.engine,
+            'usecols': columns,
+            'categorical': self.categorical_columns(table),
+            'stat_result': self.stats.stat(self.path / filename) if self.stats is not None else None,
+        }
+
+    def categorical_columns(self, table: str) -> Union[None, str, list]:
+        """
+        the categorical argument of read_table for a table of this OFMLPart
+        """
+        if isinstance(self.categorical, dict):
+            return self.categorical.get(table, None)
+        if self.categorical == 'declared':
+            return CATEGORICAL_COLUMNS.get(table, None)
+        return self.categorical or None
+
+    def read_table(self, filename, encoding="cp1252", engine=None, columns=None):
+        """
+        columns: only parse these columns of the table definition
+        """
+        table = re.sub(r'\..+$', '', filename)
+        self.tables[table] = self.load_table(filename, encoding, engine, columns)
         return self.tables[table]
 
-    def table(self, name: str) -> Table:
+    def load_table(self, filename, encoding="cp1252", engine=None, columns=None) -> Union['Table', NotAvailable]:
+        """
+        read_table without keeping the table in tables
+        """
+        with report.timed("read_table", program=self.program_name, ofml_part=self.name, table=filename) as labels:
+            if self.snapshot is not None:
+                # the snapshot module builds on this one
+                from .snapshot import read_snapshot_table
+                table = read_snapshot_table(self.snapshot / f"{filename}.feather", self.path / filename, self.name,
+                                            columns)
+            elif self.dedup:
+                table = read_table_deduplicated(self.cache,
+                                                **self.read_table_kwargs(filename, encoding, engine, columns))
+            else:
+                table = read_table_cached(self.cache, **self.read_table_kwargs(filename, encoding, engine, columns))
+            if type(table) is Table:
+                labels['rows'] = len(table.df)
+                labels['bytes'] = table.file_size
+        return table
+
+    def iter_table(self, filename, chunksize: int = 100000, encoding="cp1252", columns=None) -> Iterator[pd.DataFrame]:
+        """
+        the table as DataFrames of chunksize rows, the whole table is never in memory
+        """
+        return iter_table(**self.read_table_kwargs(filename, encoding, columns=columns), chunksize=chunksize)
+
+    def table(self, name: str, columns=None) -> Table:
+        """
+        columns: for a lazy OFMLPart only parse these columns if the table is not read yet
+        """
         name = re.sub(r'\..+$', '', name)
+        if self.lazy:
+            table = self.tables.get(name, None)
+            if table is None:
+                filename = self.filename_of(name)
+                if filename is not None:
+                    return self.read_table(filename, columns=columns)
+            elif columns is not None and type(table) is Table and not set(columns) <= set(table.df.columns):
+                # a former projection lacks some of the requested columns
+                return self.read_table(self.filename_of(name), columns=list({*table.df.columns, *columns}))
         return self.tables[name]
 
+    def filename_of(self, name: str) -> Optional[str]:
+        for filename in self.tables_definitions.keys():
+            if re.sub(r'\..+$', '', filename) == name:
+                return filename
+        return None
+
     def is_table_available(self, name):
         return type(self.table(name)) is not NotAvailable
 
     def __getitem__(self, item):
         return self.table(item)
 
+    def projection(self, filename: str, table: Table) -> Optional[list]:
+        """
+        the columns of a table that was read with only some of the columns of its definition
+        """
+        columns = list(table.df.columns)
+        return columns if set(columns) != set(self.tables_definitions[filename][0]) else None
+
+    def refresh_tables(self, stats: StatCache) -> list[str]:
+        """
+        read the tables again whose file changed or appeared, returns their filenames
+        """
+        changed = []
+        for name, table in list(self.tables.items()):
+            filename = self.filename_of(name)
+            if filename is None:
+                continue
+            if type(table) is Table:
+                if not table.is_modified(stats):
+                    continue
+                columns = self.projection(filename, table)
+            elif stats.stat(self.path / filename) is None:
+                continue
+            else:
+                columns = None
+            self.read_table(filename, columns=columns)
+            changed.append(filename)
+        return changed
+
+    def current_table(self, name: str) -> Union[Table, NotAvailable, None]:
+        """
+        the read table, read (again) if it is not read yet or its file changed since.
+        the file is checked at most once per check_interval
+        """
+        name = re.sub(r'\..+$', '', name)
+        table = self.tables.get(name, None)
+        # the tables of a snapshot never change
+        if table is None or (type(table) is Table and self.snapshot is None and self.is_check_due(name) and
+                             table.is_modified()):
+            filename = self.filename_of(name)
+            if filename is None:
+                return None
+            if table is not None and self.stats is not None:
+                # the listing may be older than the change, the attributes key the TableCache
+                self.stats.invalidate(self.path)
+            table = self.read_table(filename)
+            self.checked[name] = time.monotonic()
+        return table
+
+    def is_check_due(self, name: str) -> bool:
+        if self.check_interval is None:
+            return False
+        now = time.monotonic()
+        if now - self.checked.get(name, float('-inf')) < self.check_interval:
+            return False
+        self.checked[name] = now
+        return True
+
+    def index(self, name: str, *columns: str) -> dict:
+        """
+        hash index of a table, key -> positions of its rows
+        the key is the value of the column or for several columns the tuple of their values.
+        built on first use and again once the table was read again or its file changed
+        """
+        table = self.current_table(name)
+        if type(table) is not Table:
+            return {}
+        return self.table_index(table, columns)
+
+    def table_index(self, table: Table, columns: tuple) -> dict:
+        key = (table.database_table_name, columns)
+        indexed_table, index = self.indexes.get(key, (None, None))
+        if indexed_table is not table:
+            with report.timed("build_index", program=self.program_name, ofml_part=self.name, table=table.name,
+                              rows=len(table.df)):
+                index = table.df.groupby(list(columns), sort=False, observed=True, dropna=False).indices
+            self.indexes[key] = (table, index)
+        return index
+
+    def lookup(self, name: str, columns: tuple, key) -> pd.DataFrame:
+        """
+        the rows of a table whose columns equal key, through the index of the columns
+        """
+        table = self.current_table(name)
+        if type(table) is not Table:
+            return pd.DataFrame()
+        return table.df.iloc[self.table_index(table, columns).get(key, [])]
+
+
+class OCDPart(OFMLPart):
+    """
+    the ocd of a Program with indexed lookups of articles, properties, prices and texts
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # language -> OCDResolver
+        self.resolvers = {}
+
+    def resolver(self, language: str = 'de') -> 'OCDResolver':
+        """
+        the joined ocd for resolving whole articles, joined again once one of its tables changed
+        """
+        # the resolver module builds on this one
+        from .ocd_resolver import OCDResolver
+        resolver = self.resolvers.get(language, None)
+        if resolver is None or resolver.is_stale(self):
+            resolver = self.resolvers[language] = OCDResolver(self, language)
+        return resolver
+
+    def article(self, article_nr: str) -> Optional[pd.Series]:
+        rows = self.lookup('ocd_article', ('article_nr',), article_nr)
+        return rows.iloc[0] if len(rows) else None
+
+    def property_classes_of(self, article_nr: str) -> pd.DataFrame:
+        return self.lookup('ocd_propertyclass', ('article_nr',), article_nr)
+
+    def properties_of(self, article_nr: str) -> pd.DataFrame:
+        """
+        the properties of the property classes of an article, in the order of the classes
+        """
+        property_classes = self.property_classes_of(article_nr)
+        table = self.current_table('ocd_property')
+        if type(table) is not Table or 'prop_class' not in property_classes.columns:
+            return pd.DataFrame()
+        index = self.table_index(table, ('prop_class',))
+        positions = [index[_] for _ in property_classes['prop_class'] if _ in index]
+        return table.df.iloc[np.concatenate(positions) if positions else []]
+
+    def values_of(self, prop_class: str, property: str) -> pd.DataFrame:
+        return self.lookup('ocd_propertyvalue', ('prop_class', 'property'), (prop_class, property))
+
+    def prices_of(self, article_nr: str, var_cond: Optional[str] = None,
+                  price_level: Optional[str] = None) -> pd.DataFrame:
+        """
+        var_cond: only the prices of this variant condition
+        price_level: only the prices of this level ('B' base, 'X' surcharge, 'D' discount)
+        """
+        columns, key = ['article_nr'], [article_nr]
+        for column, value in (('var_cond', var_cond), ('price_level', price_level)):
+            if value is not None:
+                columns.append(column)
+                key.append(value)
+        if len(columns) == 1:
+            return self.lookup('ocd_price', ('article_nr',), article_nr)
+        return self.lookup('ocd_price', tuple(columns), tuple(key))
+
+    def calculate_prices(self, configurations, currency: Optional[str] = None, date=None,
+                         price_type: str = 'S') -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        totals and breakdown of the prices of many configurations at once, see ocd_prices.calculate_prices
+        only the price rows of the configured articles are taken from the index
+        """
+        from .ocd_prices import calculate_prices, configurations_frame
+        configurations = configurations_frame(configurations)
+        table = self.current_table('ocd_price')
+        prices = pd.DataFrame()
+        if type(table) is Table:
+            index = self.table_index(table, ('article_nr',))
+            positions = [index[_] for _ in configurations['article_nr'].unique() if _ in index]
+            prices = table.df.iloc[np.concatenate(positions) if positions else []]
+        return calculate_prices(prices, configurations, currency, date, price_type)
+
+    def text(self, textnr: str, language: str, table: str = 'ocd_artshorttext') -> Optional[str]:
+        """
+        the lines of a text of one of the ocd text tables joined by newlines
+        """
+        rows = self.lookup(table, ('textnr', 'language'), (textnr, language))
+        if not len(rows):
+            return None
+        if 'line_nr' in rows.columns:
+            rows = rows.sort_values('line_nr', kind='stable')
+        return '\n'.join('' if pd.isna(_) else str(_) for _ in rows['text'])
+
+
+def table_cache_key(cache: TableCache, **kwargs) -> str:
+    """
+    the TableCache key of the table read_table reads with kwargs
+    """
+    return cache.key(kwargs['filepath'], [kwargs['names'], kwargs['dtype'], kwargs.get('sep', ';')],
+                     stat_result=kwargs.get('stat_result'), content_hash=kwargs.get('content_hash'),
+                     encoding=kwargs['encoding'], quoting=kwargs.get('quoting'),
+                     engine=kwargs.get('engine'), columns=kwargs.get('usecols'),
+                     categorical=kwargs.get('categorical'))
+
+
+def read_table_cached(cache: Optional[TableCache], **kwargs) -> Union[Table, NotAvailable]:
+    """
+    read_table through the TableCache if one is given
+    """
+    if cache is None:
+        return read_table(**kwargs)
+
+    filepath = kwargs['filepath']
+    try:
+        cache_key = table_cache_key(cache, **kwargs)
+    except OSError:
+        # missing source file, read_table reports it
+        return read_table(**kwargs)
+
+    df = cache.get(cache_key)
+    if df is not None:
+        return Table(df, filepath, kwargs['ofml_part_name'], stat_result=kwargs.get('stat_result'),
+                     content_hash=kwargs.get('content_hash'))
+
+    table = read_table(**kwargs)
+    if type(table) is Table:
+        cache.put(cache_key, table.df)
+    return table
+
+
+def content_store_key(data_hash: str, **kwargs) -> str:
+    """
+    the content_store key of the file content with data_hash read by read_table with kwargs
+    """
+    return content_store.key(data_hash, **{_: kwargs.get(_) for _ in ('names', 'dtype', 'encoding', 'sep', 'quoting',
+                                                                       'engine', 'usecols', 'categorical')})
+
+
+def read_table_deduplicated(cache: Optional[TableCache], **kwargs) -> Union[Table, NotAvailable]:
+    """
+    read_table_cached by the content of the file: a file whose content was parsed before with the same
+    arguments is not parsed again, its Table shares the DataFrame (read-only!) of the former one.
+    the file is read once, hashed and parsed from memory
+    """
+    filepath = kwargs['filepath']
+    try:
+        with open(filepath, 'rb') as f:
+            data = f.read()
+    except OSError:
+        # missing source file, read_table reports it
+        return read_table_cached(cache, **kwargs)
+
+    data_hash = content_hash(data)
+    key = content_store_key(data_hash, **kwargs)
+    df = content_store.get(key)
+    if df is not None:
+        return Table(df, filepath, kwargs['ofml_part_name'], stat_result=kwargs.get('stat_result'),
+                     content_hash=data_hash)
+
+    table = read_table_cached(cache, data=data, content_hash=data_hash, **kwargs)
+    if type(table) is Table:
+        table.df = content_store.put(key, table.df)
+    return table
 
-def read_table(filepath, names, dtype, encoding, ofml_part_name, sep=";", quoting=csv.QUOTE_MINIMAL):
+
+ENGINES = ('c', 'pyarrow')
+
+
+def read_table(filepath, names, dtype, encoding, ofml_part_name, sep=";", quoting=csv.QUOTE_MINIMAL, engine="c",
+               usecols=None, categorical=None, stat_result=None, data: bytes = None, content_hash: str = None):
     """
     given a filepath and the names from inp_descr read any table
+    usecols: only parse these columns
+    categorical: "auto" or the columns to store as category, see compact_string_columns
+    stat_result: the known attributes of the file, see StatCache
+    data, content_hash: the already read content of the file and its hash, see read_table_deduplicated
     """
+    if engine not in ENGINES:
+        raise ValueError(f"engine {engine} is not supported, one of {ENGINES}")
     on_bad_lines = 'warn'  # warn, skip, error
+    df = None
     try:
-        df = pd.read_csv(filepath, sep=sep,
+        if engine == "pyarrow":
+            df = read_csv_pyarrow(filepath, names, dtype, encoding, sep=sep, quoting=quoting, usecols=usecols,
+                                  data=data)
+        if df is None:
+            df = read_csv_c(filepath, names, dtype, encoding, sep=sep, quoting=quoting, usecols=usecols,
+                            on_bad_lines=on_bad_lines, data=data)
+    except (ValueError, FileNotFoundError,) as e:
+        return NotAvailable(e)
+    if categorical:
+        compact_string_columns(df, categorical)
+    return Table(df, filepath, ofml_part_name, stat_result=stat_result, content_hash=content_hash)
+
+
+def iter_table(filepath, names, dtype, encoding, ofml_part_name, sep=";", quoting=csv.QUOTE_MINIMAL, engine="c",
+               usecols=None, categorical=None, stat_result=None, chunksize=100000) -> Iterator[pd.DataFrame]:
+    """
+    read a table as DataFrames of chunksize rows, cleaned like read_table does,
+    the arguments are those of read_table (see OFMLPart.read_table_kwargs)
+    always parsed by the pandas c parser, categorical is ignored since every chunk would get other categories
+    """
+    return read_csv_c(filepath, names, dtype, encoding, sep=sep, quoting=quoting, usecols=usecols,
+                      chunksize=chunksize)
+
+
+def read_csv_c(filepath, names, dtype, encoding, sep=";", quoting=csv.QUOTE_MINIMAL, usecols=None,
+               on_bad_lines='warn', chunksize=None, data: bytes = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    read a table with the pandas c parser and strip its string columns
+    chunksize: return an iterator of DataFrames of chunksize rows instead
+    data: the already read content of the file
+    """
+    df = pd.read_csv(io.BytesIO(data) if data is not None else filepath, sep=sep,
                          header=None,
                          names=names,
+                         usecols=usecols,
                          dtype=dtype,
                          encoding=encoding,
                          comment='#',
@@ -444,14 +1125,154 @@ def read_table(filepath, names, dtype, encoding, ofml_part_name, sep=";", quotin
                          # new (seems necessary, eg. for co2 funcs. otherwise removes trailing quotes)
                          # not a good idea because then ocd_propertytext etc. keep \"...\"
                          # but is necessary for funcs otherwiese values "" get removed
-                         quoting=quoting
+                         quoting=quoting,
+                         chunksize=chunksize
                          )
-    except (ValueError, FileNotFoundError,) as e:
-        return NotAvailable(e)
-    # map changes dtype of column to object
-    # for now ok because object = string but not good
-    df = df.map(lambda x: x.strip() if isinstance(x, str) else x)
-    return Table(df, filepath, ofml_part_name)
+    if chunksize:
+        return strip_chunks(df, filepath)
+    with report.timed("strip", table=Path(filepath).name, path=str(filepath), rows=len(df)):
+        strip_string_columns(df)
+    return df
+
+
+def strip_chunks(reader, filepath) -> Iterator[pd.DataFrame]:
+    with reader:
+        for df in reader:
+            with report.timed("strip", table=Path(filepath).name, path=str(filepath), rows=len(df)):
+                strip_string_columns(df)
+            yield df
+
+
+def strip_string_columns(df: pd.DataFrame):
+    """
+    strip surrounding whitespace column-wise, keeps the declared dtypes of the columns
+    """
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.StringDtype):
+            df[column] = series.str.strip()
+        elif series.dtype == object:
+            try:
+                stripped = series.str.strip()
+            except AttributeError:
+                # .str is only available if the column holds strings
+                continue
+            # keep values that are not strings untouched
+            df[column] = stripped.where(stripped.notna(), series)
+    return df
+
+
+def compact_string_columns(df: pd.DataFrame, columns: Union[str, list] = "auto", max_ratio: float = 0.5,
+                           sample: int = 10000):
+    """
+    convert string columns to category, each distinct value is stored once
+
+    columns: "auto" converts every string column whose distinct values in a sample of the rows
+             are at most max_ratio of the sampled rows, a list converts these columns
+    """
+    if columns == "auto":
+        columns = [_ for _ in df.columns if is_string_column(df[_]) and is_low_cardinality(df[_], max_ratio, sample)]
+    for column in columns:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    return df
+
+
+def is_string_column(series: pd.Series) -> bool:
+    return isinstance(series.dtype, pd.StringDtype) or str(series.dtype) in {'object', 'string[pyarrow]'}
+
+
+def is_low_cardinality(series: pd.Series, max_ratio: float = 0.5, sample: int = 10000) -> bool:
+    if len(series) < 2:
+        return False
+    if len(series) > sample:
+        # evenly spaced rows, ofml tables are sorted so the head alone would underestimate
+        series = series.iloc[::len(series) // sample]
+    return series.nunique() <= max_ratio * len(series)
+
+
+# columns of the standard ocd tables that repeat few distinct values, see OFMLPart categorical="declared"
+CATEGORICAL_COLUMNS = {
+    'ocd_article': ['art_type', 'manufacturer', 'series', 'order_unit', 'scheme_id'],
+    'ocd_propertyclass': ['article_nr', 'prop_class'],
+    'ocd_property': ['prop_class', 'property', 'prop_type', 'scope', 'txt_control'],
+    'ocd_propertyvalue': ['prop_class', 'property', 'op_from', 'op_to'],
+    'ocd_price': ['article_nr', 'var_cond', 'price_type', 'price_level', 'price_rule', 'rounding_id',
+                  'currency', 'date_from', 'date_to'],
+    'ocd_relationobj': ['rel_name', 'rel_type', 'rel_domain'],
+    'ocd_artshorttext': ['language', 'line_fmt'],
+    'ocd_artlongtext': ['language', 'line_fmt'],
+    'ocd_proptext': ['language', 'line_fmt'],
+    'ocd_propvaluetext': ['language', 'line_fmt'],
+    'ocd_pricetext': ['language', 'line_fmt'],
+}
+
+
+PYARROW_TYPES = {
+    'string': 'string',
+    'float': 'float64',
+    'float64': 'float64',
+    'int': 'int64',
+    'int64': 'int64',
+}
+
+COMMENT_PATTERN = re.compile(rb'#[^\r\n]*')
+# quotes pair up within a line only, a stray quote in a field does not hide the comments of the lines below
+QUOTED_OR_COMMENT_PATTERN = re.compile(rb'("[^"\r\n]*")|#[^\r\n]*')
+
+
+def read_csv_pyarrow(filepath, names, dtype, encoding, sep=";", quoting=csv.QUOTE_MINIMAL,
+                     usecols=None, data: bytes = None) -> Optional[pd.DataFrame]:
+    """
+    read a table with the multithreaded pyarrow csv parser into an arrow backed DataFrame
+
+    returns None if the file contains rows with a wrong number of fields,
+    those are left to the pandas parser which pads/skips them, or no rows at all (pyarrow fails on those)
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import csv as pa_csv
+
+    if data is None:
+        with open(filepath, 'rb') as f:
+            data = f.read()
+
+    # pyarrow has no comment option, drop everything from # to the end of the line like pandas does
+    # (the encodings of ofml data are ascii compatible so this is safe on bytes)
+    if b'#' in data:
+        if quoting == csv.QUOTE_NONE:
+            data = COMMENT_PATTERN.sub(b'', data)
+        else:
+            data = QUOTED_OR_COMMENT_PATTERN.sub(lambda m: m.group(1) or b'', data)
+
+    if not data.strip():
+        return None
+
+    invalid_rows = []
+
+    def invalid_row_handler(row):
+        invalid_rows.append(row)
+        return 'skip'
+
+    table = pa_csv.read_csv(
+        pa.py_buffer(data),
+        read_options=pa_csv.ReadOptions(column_names=names, encoding=encoding, use_threads=True),
+        parse_options=pa_csv.ParseOptions(delimiter=sep,
+                                          quote_char=False if quoting == csv.QUOTE_NONE else '"',
+                                          newlines_in_values=quoting != csv.QUOTE_NONE,
+                                          invalid_row_handler=invalid_row_handler),
+        convert_options=pa_csv.ConvertOptions(column_types={k: PYARROW_TYPES.get(v, v) for k, v in dtype.items()},
+                                              include_columns=[_ for _ in names if _ in usecols] if usecols else None,
+                                              strings_can_be_null=True))
+    if invalid_rows:
+        return None
+
+    with report.timed("strip", table=Path(filepath).name, path=str(filepath), rows=table.num_rows):
+        for i, field in enumerate(table.schema):
+            if pa.types.is_string(field.type):
+                table = table.set_column(i, field, pc.utf8_trim_whitespace(table.column(i)))
+
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
 
 
 def ofml_dtype_2_pandas_dtype(ofml_dtype):
@@ -461,41 +1282,74 @@ def ofml_dtype_2_pandas_dtype(ofml_dtype):
     return ofml_dtype
 
 
-@catch_file_exception
-def read_pdata_inp_descr(file_name):
-    result = OrderedDict()
-    inside_comment = False
-    with open(file_name, 'r', encoding="cp1252") as file:
-        for line in file:
+# parsed registries and inp_descr files of this process, replace it with ParseCache(path) to keep them in a file
+parse_cache = ParseCache()
 
-            if line.isspace():
-                continue
+# the DataFrames of the tables read with the dedup option by their content, see read_table_deduplicated
+content_store = ContentStore()
 
-            row = line.split()
+CONFIG_SECTION = re.compile(r'\[.+]')
 
-            if row[0] == 'comment':
-                inside_comment = True
 
-            if len(row) >= 2 and f'{row[0]} {row[1]}' == 'end comment':
-                inside_comment = False
+def parse_config(text: str) -> OrderedDict:
+    """
+    sections ([name], the key keeps the brackets) with key=value lines, lines before the first section
+    are top level. a value may contain '='
+    """
+    result = OrderedDict()
+    target = result
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        if line[0] == '[' and CONFIG_SECTION.match(line):
+            target = result[line] = OrderedDict()
+            continue
+        k, _, v = line.partition('=')
+        if k and v:
+            target[k] = v
+    return result
 
-            if inside_comment:
-                continue
 
-            if row[0] == 'table':
-                table_name = row[2]
-                result[table_name] = [[], [], ";"]
-            elif row[0] == 'field':
-                field_name = row[2]
-                datatype = row[3]
-                datatype = ofml_dtype_2_pandas_dtype(datatype)
-                delimiter = row[5] if len(row) >= 6 and row[4] == "delim" else ";"
-                result[table_name][0].append(field_name)
-                result[table_name][1].append(datatype)
-                result[table_name][2] = delimiter
+def parse_inp_descr(text: str) -> OrderedDict:
+    """
+    table name -> [field names, pandas dtypes, delimiter]
+    """
+    result = OrderedDict()
+    dtypes = {}
+    definition = None
+    inside_comment = False
+    for line in text.splitlines():
+        row = line.split()
+        if not row:
+            continue
+        keyword = row[0]
+        if keyword == 'comment':
+            inside_comment = True
+            continue
+        if inside_comment:
+            if keyword == 'end' and len(row) >= 2 and row[1] == 'comment':
+                inside_comment = False
+            continue
+
+        if keyword == 'table':
+            definition = result[row[2]] = [[], [], ";"]
+        elif keyword == 'field' and definition is not None:
+            datatype = dtypes.get(row[3], None)
+            if datatype is None:
+                datatype = dtypes[row[3]] = ofml_dtype_2_pandas_dtype(row[3])
+            definition[0].append(row[2])
+            definition[1].append(datatype)
+            definition[2] = row[5] if len(row) >= 6 and row[4] == "delim" else ";"
     return result
 
 
+@catch_file_exception
+def read_pdata_inp_descr(file_name):
+    with open(file_name, 'rb') as file:
+        return parse_cache.parse(file.read(), parse_inp_descr)
+
+
 if __name__ == '__main__':
     repo = Repository(root=Path("b:\Testumgebung\EasternGraphics"))
     print(repo)
@@ -1,5 +1,133 @@
 import asyncio
-from .repository import Repository, Program, Table, OFMLPart, NotAvailable
+import contextlib
+import functools
+import os
+import queue
+import re
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Optional
+import pyarrow as pa
+from loguru import logger
+from .repository import (Repository, Program, Table, TableStream, OFMLPart, NotAvailable, read_table_cached,
+                         content_store, content_store_key)
+from .content_store import content_hash
+from .instrumentation import report
+from .table_cache import TableCache
+
+
+def read_table_in_process(cache: Optional[TableCache], read_kwargs: dict):
+    """
+    runs in a worker process, returns the parsed table as one arrow ipc buffer
+    which is much cheaper to send back than a pickled DataFrame of python strings,
+    and the content hash of the file (None if it could not be read)
+    """
+    try:
+        with open(read_kwargs['filepath'], 'rb') as f:
+            data = f.read()
+    except OSError:
+        # missing source file, read_table reports it
+        return read_table_cached(cache, **read_kwargs), None
+    data_hash = content_hash(data)
+    table = read_table_cached(cache, data=data, content_hash=data_hash, **read_kwargs)
+    if type(table) is not Table:
+        return table, data_hash
+    arrow_table = pa.Table.from_pandas(table.df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue(), data_hash
+
+
+class DaemonThreadPool(Executor):
+    """
+    thread pool for the blocking file reads, its threads are daemon threads:
+    a read hanging on the share (e.g. a stale SMB mount) neither keeps the process from exiting
+    nor, once abandoned, the other reads from running
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "DaemonThreadPool"):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self.work_items = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.threads: set[threading.Thread] = set()
+        # threads hanging in their work item, each was replaced and ends once its work item returns
+        self.abandoned: set[threading.Thread] = set()
+        self.is_shutdown = False
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        with self.lock:
+            if self.is_shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self.work_items.put((future, fn, args, kwargs))
+            if len(self.threads) < self.max_workers + len(self.abandoned):
+                self.start_thread()
+        return future
+
+    def start_thread(self):
+        thread = threading.Thread(target=self.work, name=f"{self.thread_name_prefix}_{len(self.threads)}",
+                                  daemon=True)
+        self.threads.add(thread)
+        thread.start()
+
+    def work(self):
+        while True:
+            work_item = self.work_items.get()
+            if work_item is None:
+                return
+            future, fn, args, kwargs = work_item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            del work_item, future
+            with self.lock:
+                if threading.current_thread() in self.abandoned:
+                    self.abandoned.discard(threading.current_thread())
+                    self.threads.discard(threading.current_thread())
+                    return
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        as many abandoned threads still hang as the pool has workers, no more are replaced
+        """
+        return len(self.abandoned) >= self.max_workers
+
+    def abandon(self, thread: threading.Thread):
+        """
+        thread hangs in its work item, a new thread takes over its work
+        while it still hangs (up to max_workers hanging threads)
+        """
+        with self.lock:
+            if self.is_shutdown or self.exhausted or thread not in self.threads or thread in self.abandoned:
+                return
+            self.abandoned.add(thread)
+            self.start_thread()
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """
+        wait=False does not wait for a hanging thread, neither does the exit of the process
+        """
+        with self.lock:
+            self.is_shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        work_item = self.work_items.get_nowait()
+                    except queue.Empty:
+                        break
+                    if work_item is not None:
+                        work_item[0].cancel()
+            threads = list(self.threads)
+            for _ in threads:
+                self.work_items.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
 
 
 class ProgramAsync(Program):
@@ -7,77 +135,235 @@ class ProgramAsync(Program):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.collected_files_to_read = []
+        # optional callable (program, ofml_part, filename) -> bool deciding which tables get read
+        self.table_filter = kwargs.get("table_filter", None)
+        # optional coroutine function (program, table) awaited as soon as a table was read
+        self.on_table_loaded = kwargs.get("on_table_loaded", None)
+        # optional ProcessPoolExecutor that parses the tables instead of threads
+        self.executor: Optional[Executor] = kwargs.get("executor", None)
+        # tables whose file is larger than stream_threshold bytes are handed to on_table_loaded
+        # as TableStream of stream_chunksize rows instead of being read
+        self.stream_threshold: Optional[int] = kwargs.get("stream_threshold", None)
+        self.stream_chunksize: int = kwargs.get("stream_chunksize", 100000)
+        # bounded thread pool of the RepositoryAsync for the blocking file reads, otherwise asyncio.to_thread
+        self.io_executor: Optional[Executor] = kwargs.get("io_executor", None)
+        # tables read at once: of all programs (shared semaphore of the RepositoryAsync) and of this program
+        self.table_semaphore: Optional[asyncio.Semaphore] = kwargs.get("table_semaphore", None)
+        self.program_semaphore = asyncio.Semaphore(kwargs.get("program_tables", None) or 4)
+        # seconds a table may take to read before it is given up as NotAvailable (None: no limit)
+        self.table_timeout: Optional[float] = kwargs.get("table_timeout", None)
+        # the reads of the tables while load_all runs, cancelled together
+        self.task_group: Optional[asyncio.TaskGroup] = None
 
-    async def load_ocd(self):
-        if self.contains_ocd():
-            res = await asyncio.to_thread(super().load_ocd)
-            if type(res) is OFMLPart:
+    async def run(self, f, *args, **kwargs):
+        """
+        f(*args, **kwargs) in the io_executor
+        """
+        if self.io_executor is None:
+            return await asyncio.to_thread(f, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.io_executor, functools.partial(f, *args, **kwargs))
+
+    async def load_ofml_part(self, ofml_part_name: str):
+        if getattr(self, f'contains_{ofml_part_name}')():
+            # the sync loader reads the inp_descr
+            res = await self.run(getattr(Program, f'load_{ofml_part_name}'), self)
+            if isinstance(res, OFMLPart):
                 self.on_ofml_part_loaded(res)
 
+    async def load_ocd(self):
+        await self.load_ofml_part('ocd')
+
     async def load_oam(self):
-        if self.contains_oam():
-            res = await asyncio.to_thread(super().load_oam)
-            if type(res) is OFMLPart:
-                self.on_ofml_part_loaded(res)
+        await self.load_ofml_part('oam')
 
     async def load_oas(self):
-        if self.contains_oas():
-            res = await asyncio.to_thread(super().load_oas)
-            if type(res) is OFMLPart:
-                self.on_ofml_part_loaded(res)
+        await self.load_ofml_part('oas')
 
     async def load_go(self):
-        if self.contains_go():
-            res = await asyncio.to_thread(super().load_go)
-            if type(res) is OFMLPart:
-                self.on_ofml_part_loaded(res)
+        await self.load_ofml_part('go')
 
     async def load_oap(self):
-        if self.contains_oap():
-            res = await asyncio.to_thread(super().load_oap)
-            if type(res) is OFMLPart:
-                self.on_ofml_part_loaded(res)
+        await self.load_ofml_part('oap')
 
     async def load_odb(self):
-        if self.contains_odb():
-            res = await asyncio.to_thread(super().load_odb)
-            if type(res) is OFMLPart:
-                self.on_ofml_part_loaded(res)
+        await self.load_ofml_part('odb')
 
     def on_ofml_part_error(self, err: NotAvailable):
         pass
 
     def on_ofml_part_loaded(self, ofml_part: OFMLPart):
         for name in ofml_part.filenames_from_tables_definitions:
-            self.collected_files_to_read.append(asyncio.to_thread(ofml_part.read_table, name))
+            if self.table_filter and not self.table_filter(self, ofml_part, name):
+                continue
+            if self.task_group is not None:
+                self.task_group.create_task(self.read_table(ofml_part, name), name=f"{self.name}/{name}")
+            else:
+                # awaited by RepositoryAsync.on_program_loaded
+                self.collected_files_to_read.append(self.read_table(ofml_part, name))
+
+    async def read_table(self, ofml_part: OFMLPart, name: str):
+        if self.on_table_loaded and self.is_streamed(ofml_part, name):
+            await self.on_table_loaded(self, TableStream(ofml_part, name, self.stream_chunksize))
+            return
+        async with self.program_semaphore, self.table_semaphore or contextlib.nullcontext():
+            try:
+                if self.executor is None:
+                    table = await self.load_table(ofml_part, name)
+                    ofml_part.tables[re.sub(r'\..+$', '', name)] = table
+                else:
+                    async with asyncio.timeout(self.table_timeout):
+                        table = await self.read_table_in_executor(ofml_part, name)
+            except TimeoutError as e:
+                logger.error(f"read_table {name} of {self.name} timed out after {self.table_timeout}s")
+                table = NotAvailable(e)
+                ofml_part.tables[re.sub(r'\..+$', '', name)] = table
+            # the slot is released once the table was handed on, a table waiting for a full queue
+            # of on_table_loaded blocks the next read so no more than max_tables read tables wait in memory
+            if self.on_table_loaded:
+                await self.on_table_loaded(self, table)
+
+    async def load_table(self, ofml_part: OFMLPart, name: str):
+        """
+        OFMLPart.load_table in the io_executor, the table_timeout counts from the start of the read,
+        not while it waits for a thread. the thread of a read that timed out cannot be stopped,
+        it is abandoned: the DaemonThreadPool replaces it and its late result is dropped
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def load():
+            thread = threading.current_thread()
+            loop.call_soon_threadsafe(lambda: started.done() or started.set_result(thread))
+            return ofml_part.load_table(name)
+
+        if self.io_executor is None:
+            future = asyncio.ensure_future(asyncio.to_thread(load))
+        else:
+            future = loop.run_in_executor(self.io_executor, load)
+        pool = self.io_executor if isinstance(self.io_executor, DaemonThreadPool) else None
+        try:
+            if pool is None or not pool.exhausted:
+                # once all the threads that may be replaced hang, the wait counts as well
+                await asyncio.wait([started, future], return_when=asyncio.FIRST_COMPLETED)
+            async with asyncio.timeout(self.table_timeout):
+                return await future
+        except TimeoutError:
+            if pool is not None and started.done() and not started.cancelled():
+                pool.abandon(started.result())
+            raise
+        finally:
+            future.cancel()
+            started.cancel()
+
+    def is_streamed(self, ofml_part: OFMLPart, name: str) -> bool:
+        if self.stream_threshold is None:
+            return False
+        path = ofml_part.path / name
+        if ofml_part.stats is not None:
+            file_attributes = ofml_part.stats.stat(path)
+        else:
+            try:
+                file_attributes = os.stat(path)
+            except OSError:
+                file_attributes = None
+        # a missing file is left to read_table to report
+        return file_attributes is not None and file_attributes.st_size > self.stream_threshold
+
+    async def read_table_in_executor(self, ofml_part: OFMLPart, name: str):
+        read_kwargs = ofml_part.read_table_kwargs(name)
+        with report.timed("read_table", program=self.name, ofml_part=ofml_part.name, table=name) as labels:
+            result, data_hash = await asyncio.get_running_loop().run_in_executor(self.executor,
+                                                                                 read_table_in_process,
+                                                                                 ofml_part.cache, read_kwargs)
+            if isinstance(result, pa.Buffer):
+                key = content_store_key(data_hash, **read_kwargs)
+                # identical tables of other programs share one DataFrame like with read_table_deduplicated
+                df = content_store.get(key) if ofml_part.dedup else None
+                if df is None:
+                    df = await self.run(lambda: pa.ipc.open_stream(result).read_all().to_pandas())
+                    if ofml_part.dedup:
+                        df = content_store.put(key, df)
+                result = Table(df, read_kwargs['filepath'], ofml_part.name,
+                               stat_result=read_kwargs.get('stat_result'), content_hash=data_hash)
+                labels['rows'] = len(df)
+                labels['bytes'] = result.file_size
+        ofml_part.tables[re.sub(r'\..+$', '', name)] = result
+        return result
 
     async def load_all(self):
-        return await asyncio.gather(
-            self.load_ocd(),
-            self.load_oam(),
-            self.load_oas(),
-            self.load_go(),
-            self.load_oap(),
-            self.load_odb(),
-        )
+        """
+        load the OFMLParts and read their tables, returns once all tables are read.
+        a failing read cancels the others, as does cancelling load_all
+        """
+        try:
+            async with asyncio.TaskGroup() as self.task_group:
+                await asyncio.gather(
+                    self.load_ocd(),
+                    self.load_oam(),
+                    self.load_oas(),
+                    self.load_go(),
+                    self.load_oap(),
+                    self.load_odb(),
+                )
+        finally:
+            self.task_group = None
 
 
 class RepositoryAsync(Repository):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, executor: Executor = None, parse_processes: int = None, io_workers: int = 8,
+                 max_tables: int = None, program_tables: int = 4, table_timeout: float = None, **kwargs):
+        """
+        executor: ProcessPoolExecutor that parses the tables of all programs
+        parse_processes: create a ProcessPoolExecutor with this many workers (closed by close())
+        io_workers: threads of the DaemonThreadPool for the blocking file reads, shared by all programs
+        max_tables: tables read at once of all programs (default io_workers), program_tables: of one program
+        table_timeout: seconds after which the read of a table is given up (e.g. a hanging SMB read),
+        its thread is replaced and does not keep the process from exiting
+        """
         super().__init__(*args, **kwargs)
 
         self.collected_files_to_read = []
+        self.owns_executor = executor is None and bool(parse_processes)
+        self.executor: Optional[Executor] = ProcessPoolExecutor(parse_processes) if self.owns_executor else executor
+        self.io_executor = DaemonThreadPool(io_workers, thread_name_prefix="RepositoryAsync")
+        self.table_semaphore = asyncio.Semaphore(max_tables or io_workers)
+        self.program_tables = program_tables
+        self.table_timeout = table_timeout
+
+    def close(self):
+        if self.owns_executor:
+            self.executor.shutdown(cancel_futures=True)
+        # a hanging read is not waited for, its daemon thread ends with the process
+        self.io_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, f, *args, **kwargs):
+        """
+        f(*args, **kwargs) in the io_executor
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.io_executor, functools.partial(f, *args, **kwargs))
 
     async def read_profiles(self):
-        return await asyncio.to_thread(super().read_profiles)
+        return await self.run(super().read_profiles)
+
+    async def discover(self, max_workers: int = 16):
+        return await self.run(super().discover, max_workers)
 
     async def load_program(self, program, keep_in_memory: bool = True, program_cls=None, **kwargs) -> ProgramAsync | NotAvailable:
-        result: ProgramAsync = await asyncio.to_thread(super().load_program,
+        result: ProgramAsync = await self.run(super().load_program,
                                                        **{
                                                            "program_name": program,
                                                            "keep_in_memory": keep_in_memory,
-                                                           "program_cls": ProgramAsync
+                                                           "program_cls": ProgramAsync,
+                                                           "table_filter": kwargs.get("table_filter", None),
+                                                           "on_table_loaded": kwargs.get("on_table_loaded", None),
+                                                           "executor": self.executor,
+                                                           "stream_threshold": kwargs.get("stream_threshold", None),
+                                                           "stream_chunksize": kwargs.get("stream_chunksize", 100000),
+                                                           "io_executor": self.io_executor,
+                                                           "table_semaphore": self.table_semaphore,
+                                                           "program_tables": self.program_tables,
+                                                           "table_timeout": self.table_timeout,
                                                        })
         if isinstance(result, NotAvailable):
 
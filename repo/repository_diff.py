@@ -0,0 +1,269 @@
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from .instrumentation import report
+from .repository import Repository, Program, OFMLPart, Table, NotAvailable
+
+# the columns that identify a row, rows of the same key with other values are changed rows.
+# tables without an entry (or with duplicate keys) are compared by whole rows, a change is a removed and an added row
+KEY_COLUMNS = {
+    'ocd_article': ['article_nr'],
+    'ocd_propertyclass': ['article_nr', 'prop_class'],
+    'ocd_property': ['prop_class', 'property'],
+    'ocd_propertyvalue': ['prop_class', 'property', 'value_from'],
+    'ocd_price': ['article_nr', 'var_cond', 'price_type', 'price_level', 'currency', 'date_from'],
+    'ocd_artshorttext': ['textnr', 'language', 'line_nr'],
+    'ocd_artlongtext': ['textnr', 'language', 'line_nr'],
+    'ocd_proptext': ['textnr', 'language', 'line_nr'],
+    'ocd_propvaluetext': ['textnr', 'language', 'line_nr'],
+    'ocd_pricetext': ['textnr', 'language', 'line_nr'],
+    'oam_article2ofml': ['article'],
+}
+
+
+class TableDiff:
+    """
+    the rows of a table that differ between an old and a new repository
+
+    status: 'added' or 'removed' if the table exists on one side only, otherwise 'changed'
+    added, removed: the rows only in the new / old table
+    changed: one row per key whose other columns differ, the key columns and <column>_old, <column>_new
+    """
+
+    def __init__(self, program: str, ofml_part: str, table: str, key_columns: list, added: pd.DataFrame,
+                 removed: pd.DataFrame, changed: pd.DataFrame, status: str = 'changed'):
+        self.program = program
+        self.ofml_part = ofml_part
+        self.table = table
+        self.key_columns = key_columns
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.status = status
+
+    def __bool__(self):
+        return bool(len(self.added) or len(self.removed) or len(self.changed))
+
+    def __repr__(self):
+        return (f"TableDiff({self.program}/{self.ofml_part}/{self.table} {self.status}: +{len(self.added)} "
+                f"-{len(self.removed)} ~{len(self.changed)})")
+
+
+def file_digest(path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha1').hexdigest()
+
+
+def same_file(old: Optional[os.stat_result], old_path, new: Optional[os.stat_result], new_path) -> bool:
+    """
+    identical content without reading the tables: same size and mtime, else same size and hash
+    """
+    if old is None or new is None or old.st_size != new.st_size:
+        return False
+    if old.st_mtime_ns == new.st_mtime_ns:
+        return True
+    return file_digest(old_path) == file_digest(new_path)
+
+
+def aligned_frames(old: pd.DataFrame, new: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    both frames with the union of the columns, a column of different dtypes as float (numbers) or object
+    so equal values hash equal
+    """
+    columns = list(dict.fromkeys([*old.columns, *new.columns]))
+    old, new = old.reindex(columns=columns), new.reindex(columns=columns)
+    casts = {}
+    for column in columns:
+        if old[column].dtype == new[column].dtype:
+            continue
+        numeric = pd.api.types.is_numeric_dtype(old[column]) and pd.api.types.is_numeric_dtype(new[column])
+        casts[column] = 'float64' if numeric else object
+    if casts:
+        old, new = old.astype(casts), new.astype(casts)
+    return old.reset_index(drop=True), new.reset_index(drop=True)
+
+
+def hashes(df: pd.DataFrame, columns: list) -> np.ndarray:
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def diff_frames(old: pd.DataFrame, new: pd.DataFrame, key_columns: Optional[list] = None,
+                partition_rows: int = 1000000) -> tuple[list, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    added, removed and changed rows of two versions of a table, see TableDiff
+
+    rows are compared by a 64 bit hash, identical rows are dropped first. the remaining rows
+    are matched by the hash of their key in partitions of about partition_rows rows
+    returns the key columns used, added, removed, changed
+    """
+    old, new = aligned_frames(old, new)
+    columns = list(old.columns)
+    key_columns = [_ for _ in key_columns or [] if _ in columns]
+    if not key_columns or old.duplicated(key_columns).any() or new.duplicated(key_columns).any():
+        key_columns = columns
+
+    old_rows, new_rows = hashes(old, columns), hashes(new, columns)
+    old = old[~np.isin(old_rows, new_rows)]
+    new = new[~np.isin(new_rows, old_rows)]
+
+    old_keys, new_keys = hashes(old, key_columns), hashes(new, key_columns)
+    value_columns = [_ for _ in columns if _ not in key_columns]
+    partitions = max(1, (len(old) + len(new)) // partition_rows)
+    added, removed, changed = [], [], []
+    for partition in range(partitions):
+        old_mask, new_mask = old_keys % partitions == partition, new_keys % partitions == partition
+        old_part, new_part = old[old_mask], new[new_mask]
+        old_part_keys, new_part_keys = old_keys[old_mask], new_keys[new_mask]
+        old_matched, new_matched = np.isin(old_part_keys, new_part_keys), np.isin(new_part_keys, old_part_keys)
+        removed.append(old_part[~old_matched])
+        added.append(new_part[~new_matched])
+        if not old_matched.any():
+            continue
+        old_both = old_part[old_matched].set_axis(old_part_keys[old_matched])
+        new_both = new_part[new_matched].set_axis(new_part_keys[new_matched]).reindex(old_both.index)
+        rows = old_both[key_columns].reset_index(drop=True)
+        for column in value_columns:
+            rows[f"{column}_old"] = old_both[column].to_numpy()
+            rows[f"{column}_new"] = new_both[column].to_numpy()
+        changed.append(rows)
+
+    changed_columns = key_columns + [f"{_}_{side}" for _ in value_columns for side in ('old', 'new')]
+    return (key_columns,
+            pd.concat(added, ignore_index=True),
+            pd.concat(removed, ignore_index=True),
+            pd.concat(changed, ignore_index=True) if changed else pd.DataFrame(columns=changed_columns))
+
+
+def program_names(repository: Repository) -> list:
+    names = [_.name for _ in repository.programs()]
+    if repository.profiles is not None:
+        names += repository.program_names()
+    return list(dict.fromkeys(names))
+
+
+OFML_PARTS = ('ocd', 'oam', 'oas', 'go', 'oap', 'odb')
+
+
+def load_missing_ofml_parts(program: Program):
+    """
+    load the OFMLParts the program contains but did not load yet, a program of a snapshot has all it has
+    """
+    loaded = program.loaded_ofml_parts()
+    if any(_.snapshot is not None for _ in loaded):
+        return
+    names = {_.name for _ in loaded}
+    for name in OFML_PARTS:
+        if name not in names and getattr(program, f'contains_{name}')():
+            getattr(program, f'load_{name}')()
+
+
+def program_of(repository: Repository, program_name: str) -> Optional[Program]:
+    """
+    the loaded program (e.g. of a snapshot) with all its OFMLParts,
+    otherwise its OFMLParts are loaded without keeping the program
+    """
+    for program in repository.programs():
+        if program.name == program_name:
+            load_missing_ofml_parts(program)
+            return program
+    if repository.profiles is None:
+        return None
+    program = repository.load_program(program_name, keep_in_memory=False)
+    if isinstance(program, NotAvailable):
+        return None
+    program.load_all()
+    return program
+
+
+class RepositoryDiff:
+    """
+    compares the tables of two repositories (e.g. TEST_ENV and PROD_ENV or two snapshots)
+
+    programs are compared in parallel, files with the same size and mtime or content are skipped
+    without reading them, only the tables that differ are read on both sides and released afterwards
+    """
+
+    def __init__(self, old: Repository, new: Repository, max_workers: int = 8, partition_rows: int = 1000000):
+        self.old = old
+        self.new = new
+        self.max_workers = max_workers
+        self.partition_rows = partition_rows
+        for repository in (old, new):
+            if repository.profiles is None and not repository.programs():
+                repository.read_profiles()
+
+    def __iter__(self) -> Iterator[TableDiff]:
+        names = dict.fromkeys(program_names(self.old) + program_names(self.new))
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            futures = [pool.submit(self.diff_program, _) for _ in names]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    def diff_program(self, program_name: str) -> list[TableDiff]:
+        with report.timed("diff_program", program=program_name) as labels:
+            old, new = program_of(self.old, program_name), program_of(self.new, program_name)
+            old_parts = {_.name: _ for _ in old.loaded_ofml_parts()} if old is not None else {}
+            new_parts = {_.name: _ for _ in new.loaded_ofml_parts()} if new is not None else {}
+            diffs = []
+            for ofml_part_name in dict.fromkeys([*old_parts, *new_parts]):
+                old_part, new_part = old_parts.get(ofml_part_name), new_parts.get(ofml_part_name)
+                filenames = dict.fromkeys([*(old_part.tables_definitions if old_part else {}),
+                                           *(new_part.tables_definitions if new_part else {})])
+                for filename in filenames:
+                    try:
+                        diff = self.diff_table(program_name, old_part, new_part, filename)
+                    except Exception as e:
+                        logger.exception(f"could not diff {program_name}/{ofml_part_name}/{filename} | {e}")
+                        continue
+                    if diff:
+                        diffs.append(diff)
+            labels['rows'] = len(diffs)
+        return diffs
+
+    def is_unchanged(self, old_part: Optional[OFMLPart], new_part: Optional[OFMLPart], filename: str) -> bool:
+        if old_part is None or new_part is None or old_part.snapshot is not None or new_part.snapshot is not None:
+            return False
+        if old_part.tables_definitions.get(filename) != new_part.tables_definitions.get(filename):
+            return False
+        old_path, new_path = old_part.path / filename, new_part.path / filename
+        return same_file(self.old.stats.stat(old_path), old_path, self.new.stats.stat(new_path), new_path)
+
+    def diff_table(self, program_name: str, old_part: Optional[OFMLPart], new_part: Optional[OFMLPart],
+                   filename: str) -> Optional[TableDiff]:
+        if self.is_unchanged(old_part, new_part, filename):
+            return None
+        old_df, new_df = read_frame(old_part, filename), read_frame(new_part, filename)
+        if old_df is None and new_df is None:
+            return None
+        status = 'added' if old_df is None else 'removed' if new_df is None else 'changed'
+        old_df = old_df if old_df is not None else pd.DataFrame(columns=new_df.columns)
+        new_df = new_df if new_df is not None else pd.DataFrame(columns=old_df.columns)
+        name = re.sub(r'\..+$', '', filename)
+        key_columns, added, removed, changed = diff_frames(old_df, new_df, KEY_COLUMNS.get(name),
+                                                           self.partition_rows)
+        ofml_part_name = (old_part or new_part).name
+        return TableDiff(program_name, ofml_part_name, filename, key_columns, added, removed, changed, status)
+
+
+def read_frame(ofml_part: Optional[OFMLPart], filename: str) -> Optional[pd.DataFrame]:
+    """
+    the DataFrame of a table, a table that was not read before is released again
+    """
+    if ofml_part is None or filename not in ofml_part.tables_definitions:
+        return None
+    name = re.sub(r'\..+$', '', filename)
+    was_read = name in ofml_part.tables
+    table = ofml_part.current_table(name)
+    if not was_read:
+        ofml_part.tables.pop(name, None)
+    return table.df if type(table) is Table else None
+
+
+def diff(old: Repository, new: Repository, **kwargs) -> list[TableDiff]:
+    return list(RepositoryDiff(old, new, **kwargs))
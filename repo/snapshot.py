@@ -0,0 +1,180 @@
+"""
+a snapshot is a directory
+
+    metadata.json                       root, profiles, registries and table definitions of the programs
+    <program>/<ofml_part>/<file>.feather  one uncompressed feather (arrow ipc) file per read table
+
+the feather files are memory-mapped when a table is accessed, the arrow buffers back the DataFrame
+without a copy, so processes that open the same snapshot share its pages
+"""
+import datetime
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional, Union
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+from loguru import logger
+
+from .instrumentation import report
+from .repository import (Repository, Program, OFMLPart, OCDPart, Table, ConfigFile, NotAvailable,
+                         stat_result_from_dict)
+
+SNAPSHOT_VERSION = 1
+TABLE_METADATA_KEY = b'ofml_table'
+
+
+def config_file_dict(config_file: ConfigFile) -> dict:
+    return {'path': str(config_file.path), 'config': config_file.config, 'stat': config_file.stat_dict}
+
+
+def config_file_from_dict(d: dict) -> ConfigFile:
+    return ConfigFile(Path(d['path']), config=d['config'], stat_result=stat_result_from_dict(d['stat']))
+
+
+def write_snapshot_table(path: Path, table: Table):
+    arrow_table = pa.Table.from_pandas(table.df, preserve_index=False)
+    metadata = json.dumps({'path': str(table.path), 'stat': table.stat_dict})
+    arrow_table = arrow_table.replace_schema_metadata({**(arrow_table.schema.metadata or {}),
+                                                       TABLE_METADATA_KEY: metadata.encode()})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # only uncompressed files can be memory-mapped without a copy
+    feather.write_feather(arrow_table, str(path), compression='uncompressed')
+
+
+def snapshot_types_mapper(arrow_type: pa.DataType):
+    # dictionaries become pandas categories, everything else stays in the mapped arrow buffers
+    if pa.types.is_dictionary(arrow_type):
+        return None
+    return pd.ArrowDtype(arrow_type)
+
+
+def read_snapshot_table(path: Path, filepath: Path, ofml_part_name: str, columns=None) -> Union[Table, NotAvailable]:
+    try:
+        arrow_table = feather.read_table(str(path), columns=columns, memory_map=True)
+    except (OSError, pa.ArrowInvalid) as e:
+        return NotAvailable(e)
+    metadata = json.loads(arrow_table.schema.metadata[TABLE_METADATA_KEY])
+    df = arrow_table.to_pandas(types_mapper=snapshot_types_mapper)
+    return Table(df, filepath, ofml_part_name, stat_result=stat_result_from_dict(metadata['stat']))
+
+
+class SnapshotWriter:
+    """
+    writes a snapshot table by table, e.g. as side output of the database update
+
+    the snapshot is built next to path and replaces it in close(),
+    readers of the former snapshot keep their memory-mapped files
+    previous: the tables that were not read again since their file did not change (an incremental run,
+    see keep_previous) are taken from this snapshot
+    """
+
+    def __init__(self, path: Path, previous: Optional[Path] = None):
+        self.path = path if isinstance(path, Path) else Path(path)
+        self.previous = previous
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        self.tmp_path.mkdir(parents=True)
+        self.programs = {}
+        # (program, ofml_part, filename) of the tables to take from the previous snapshot
+        self.unchanged: set[tuple[str, str, str]] = set()
+
+    def table_path(self, root: Path, program_name: str, ofml_part_name: str, filename: str) -> Path:
+        return root / program_name / ofml_part_name / f"{filename}.feather"
+
+    def add_program(self, program: Program):
+        self.programs[program.name] = {
+            'registry': config_file_dict(program.registry),
+            # as found on the share when the snapshot was written
+            'contains': {'odb': program.contains_odb(), 'oap': program.contains_oap()},
+            'ofml_parts': {_.name: {'path': str(_.path), 'tables_definitions': _.tables_definitions}
+                           for _ in program.loaded_ofml_parts()},
+        }
+
+    def add_table(self, program_name: str, table: Table):
+        with report.timed("write_snapshot", program=program_name, ofml_part=table.ofml_part_name, table=table.name,
+                          rows=len(table.df)):
+            write_snapshot_table(self.table_path(self.tmp_path, program_name, table.ofml_part_name, table.name), table)
+
+    def keep_previous(self, program_name: str, ofml_part_name: str, filename: str):
+        """
+        the table was not read again since its file did not change, close() takes it from the previous snapshot
+        """
+        self.unchanged.add((program_name, ofml_part_name, filename))
+
+    def take_previous_tables(self):
+        for program_name, ofml_part_name, filename in self.unchanged:
+            # a program that is not available any longer is left out
+            if program_name not in self.programs:
+                continue
+            path = self.table_path(self.tmp_path, program_name, ofml_part_name, filename)
+            previous_path = self.table_path(self.previous, program_name, ofml_part_name, filename)
+            if path.exists() or not previous_path.exists():
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(previous_path, path)
+            except OSError:
+                shutil.copyfile(previous_path, path)
+
+    def close(self, root: Path, profiles: Optional[ConfigFile]):
+        if self.previous is not None and self.previous.exists():
+            self.take_previous_tables()
+        metadata = {
+            'version': SNAPSHOT_VERSION,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'root': str(root),
+            'profiles': config_file_dict(profiles) if profiles is not None else None,
+            'programs': self.programs,
+        }
+        with open(self.tmp_path / 'metadata.json', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=1)
+        old_path = self.path.with_name(self.path.name + '.old')
+        shutil.rmtree(old_path, ignore_errors=True)
+        if self.path.exists():
+            os.replace(self.path, old_path)
+        os.replace(self.tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        logger.debug(f"snapshot with {len(self.programs)} programs written to {self.path}")
+
+    def abort(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+def save_snapshot(repository: Repository, path: Path):
+    writer = SnapshotWriter(path)
+    try:
+        for program in repository.programs():
+            writer.add_program(program)
+            for table in program.all_tables:
+                writer.add_table(program.name, table)
+        writer.close(repository.root, repository.profiles)
+    except BaseException:
+        writer.abort()
+        raise
+
+
+def open_snapshot(path: Path, repository_cls=Repository, **kwargs) -> Repository:
+    path = path if isinstance(path, Path) else Path(path)
+    with open(path / 'metadata.json', encoding='utf-8') as f:
+        metadata = json.load(f)
+    if metadata.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unknown snapshot version {metadata.get('version')} of {path}")
+
+    repository = repository_cls(Path(metadata['root']), **kwargs)
+    if metadata['profiles'] is not None:
+        repository.profiles = config_file_from_dict(metadata['profiles'])
+    for program_name, program_metadata in metadata['programs'].items():
+        # the share is not looked at, snapshots of a former version did not record what the program contains
+        program = Program(registry=config_file_from_dict(program_metadata['registry']), root=repository.root,
+                          contains=program_metadata.get('contains', {}), **repository.program_options)
+        for ofml_part_name, ofml_part in program_metadata['ofml_parts'].items():
+            ofml_part_cls = OCDPart if ofml_part_name == 'ocd' else OFMLPart
+            options = {**program.ofml_part_options, 'lazy': True, 'snapshot': path / program_name / ofml_part_name}
+            setattr(program, ofml_part_name, ofml_part_cls(path=Path(ofml_part['path']), name=ofml_part_name,
+                                                          tables_definitions=ofml_part['tables_definitions'],
+                                                          program=program.name, **options))
+        repository.add_program(program)
+    return repository
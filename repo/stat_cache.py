@@ -0,0 +1,68 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+class StatCache:
+    """
+    stat results of whole directories, each directory is listed once with os.scandir
+
+    on a network share one directory listing is much cheaper than a stat per file
+    (on windows the listing already carries the attributes of its entries).
+    a listing older than max_age seconds is listed again.
+    names are compared like the filesystem of the platform does (case-insensitive on windows)
+    """
+
+    def __init__(self, max_age: float = 60.0):
+        self.max_age = max_age
+        # directory -> (time listed, name -> stat result or None for a missing directory)
+        self.directories: dict[str, tuple[float, Optional[dict[str, os.stat_result]]]] = {}
+
+    def directory(self, path: Path) -> Optional[dict[str, os.stat_result]]:
+        key = os.path.normcase(str(path))
+        listed = self.directories.get(key, None)
+        if listed is None or time.monotonic() - listed[0] > self.max_age:
+            try:
+                listing = {}
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            listing[os.path.normcase(entry.name)] = entry.stat()
+                        except OSError:
+                            # a dangling symlink or a file removed while listing counts as missing
+                            pass
+            except OSError:
+                listing = None
+            listed = self.directories[key] = (time.monotonic(), listing)
+        return listed[1]
+
+    def stat(self, path: Path) -> Optional[os.stat_result]:
+        """
+        the stat result of a file or directory, None if it does not exist
+        """
+        path = path if isinstance(path, Path) else Path(path)
+        entries = self.directory(path.parent)
+        if entries is None:
+            return None
+        return entries.get(os.path.normcase(path.name), None)
+
+    def exists(self, path: Path) -> bool:
+        return self.stat(path) is not None
+
+    def prefetch(self, paths: Iterable[Path], max_workers: int = 16):
+        """
+        list the directories concurrently, the round trips to a network share overlap
+        """
+        with ThreadPoolExecutor(max_workers) as pool:
+            list(pool.map(self.directory, paths))
+
+    def invalidate(self, path: Path):
+        """
+        list the directory again on its next use
+        """
+        self.directories.pop(os.path.normcase(str(path)), None)
+
+    def clear(self):
+        self.directories.clear()
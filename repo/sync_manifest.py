@@ -0,0 +1,93 @@
+import json
+import os
+from pathlib import Path
+from loguru import logger
+
+from .content_store import file_content_hash
+from .repository import Table
+
+
+class SyncManifest:
+    """
+    remembers the modification time of every table file that was persisted to the database
+    so an incremental run only has to parse and persist tables whose source file changed.
+    with the content hash of a table (see Table.content_hash) a file whose mtime was touched
+    (e.g. by a copy job) but whose content is the same counts as unchanged
+    """
+
+    def __init__(self, path: Path, root: Path):
+        self.path = path if isinstance(path, Path) else Path(path)
+        self.root = str(root)
+        self.tables = self.read()
+
+    def read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"SyncManifest could not read {self.path} (start empty) | {e}")
+            return {}
+        # the database only reflects the repository that was persisted last
+        if content.get("root") != self.root:
+            logger.info(f"SyncManifest {self.path} belongs to {content.get('root')} (start empty)")
+            return {}
+        return content.get("tables", {})
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"root": self.root, "tables": self.tables}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def key(program_name: str, ofml_part_name: str, filename: str) -> str:
+        return f"{program_name}/{ofml_part_name}/{filename}"
+
+    def is_modified(self, program_name: str, ofml_part_name: str, filename: str, timestamp_modified: float,
+                    path: Path = None) -> bool:
+        """
+        path: the file, hashed if only its mtime differs from the entry
+        """
+        entry = self.tables.get(self.key(program_name, ofml_part_name, filename))
+        if entry is None:
+            return True
+        if entry["timestamp_modified"] == timestamp_modified:
+            return False
+        if path is None or entry.get("content_hash") is None:
+            return True
+        try:
+            if file_content_hash(path) != entry["content_hash"]:
+                return True
+        except OSError:
+            return True
+        # the same content, hash it again only after the next change of the mtime
+        entry["timestamp_modified"] = timestamp_modified
+        return False
+
+    def update(self, program_name: str, table: Table):
+        self.tables[self.key(program_name, table.ofml_part_name, table.name)] = {
+            "timestamp_modified": table.timestamp_modified,
+            "timestamp_read": table.timestamp_read,
+            "content_hash": getattr(table, "content_hash", None),
+            "path": str(table.path),
+            "database_table": table.database_table_name,
+        }
+
+    def removed(self, program_names: list = None) -> list[tuple[str, dict]]:
+        """
+        key and entry of the tables whose source file was removed since they were persisted
+        program_names: only the tables of these programs, default all
+        """
+        removed = []
+        for key, entry in self.tables.items():
+            if program_names is not None and key.split("/")[0] not in program_names:
+                continue
+            # entries of former versions do not know their file, they get it with the next update
+            if "path" in entry and not os.path.exists(entry["path"]):
+                removed.append((key, entry))
+        return removed
+
+    def remove(self, key: str):
+        self.tables.pop(key, None)
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+from loguru import logger
+
+
+class TableCache:
+    """
+    local columnar cache of parsed tables
+
+    an entry is keyed by source path, size, mtime (or the content hash) and the table definition of the inp_descr,
+    so a changed source file or definition never hits a stale entry.
+    the least recently used entries are evicted once the directory grows beyond max_bytes (down to
+    EVICT_TO of it), the size of the directory is tracked by put and counted again only when evicting
+    """
+
+    EVICT_TO = 0.9
+
+    formats = ('feather', 'parquet')
+
+    def __init__(self, directory: Path, max_bytes: int = 10 * 1024 ** 3, format: str = 'feather'):
+        if format not in self.formats:
+            raise ValueError(f"Unknown TableCache format {format}")
+        self.directory = directory if isinstance(directory, Path) else Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.format = format
+        # bytes of the entries, counted on the first put
+        self.size: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"TableCache({self.directory})"
+
+    def __getstate__(self):
+        # sent to the worker processes of RepositoryAsync, a process tracks the size on its own
+        state = self.__dict__.copy()
+        del state['lock']
+        state['size'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def key(self, filepath: Path, definition, stat_result: os.stat_result = None, content_hash: str = None,
+            **kwargs) -> str:
+        """
+        stat_result: the known attributes of the file, otherwise it is stat'ed
+        content_hash: the hash of the file content, identifies the file instead of path, size and mtime
+                      (files copied with a new mtime or the same file of several programs share the entry)
+        kwargs: anything else that changes the parsed result, e.g. engine or quoting
+        """
+        if content_hash is not None:
+            source = [content_hash]
+        else:
+            file_attributes = stat_result or os.stat(filepath)
+            source = [str(filepath), file_attributes.st_size, file_attributes.st_mtime_ns]
+        content = json.dumps([*source, definition, sorted(kwargs.items())], default=str)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}.{self.format}"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        path = self.entry_path(key)
+        try:
+            if self.format == 'feather':
+                df = pd.read_feather(path)
+            else:
+                df = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"TableCache could not read {path} (drop entry) | {e}")
+            self.remove(path)
+            return None
+        # the mtime of an entry is its last use for the eviction
+        os.utime(path)
+        return df
+
+    def put(self, key: str, df: pd.DataFrame):
+        path = self.entry_path(key)
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            if self.format == 'feather':
+                df.reset_index(drop=True).to_feather(tmp_path)
+            else:
+                df.to_parquet(tmp_path)
+            size = os.stat(tmp_path).st_size
+            try:
+                # an entry written again (e.g. by another thread) replaces the former one
+                size -= os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"TableCache could not write {path} | {e}")
+            self.remove(tmp_path)
+            return
+        with self.lock:
+            if self.size is None:
+                self.size = self.directory_size()
+            else:
+                self.size += size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    @staticmethod
+    def remove(path: Path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def entries(self) -> list[tuple[str, os.stat_result]]:
+        """
+        path and attributes of the entries, entries removed meanwhile (e.g. by another process) are left out
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(f".{self.format}"):
+                continue
+            try:
+                entries.append((entry.path, entry.stat()))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def directory_size(self) -> int:
+        return sum(file_attributes.st_size for _, file_attributes in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        self.size = sum(file_attributes.st_size for _, file_attributes in entries)
+        for path, file_attributes in sorted(entries, key=lambda _: _[1].st_mtime):
+            if self.size <= self.max_bytes * self.EVICT_TO:
+                break
+            self.size -= file_attributes.st_size
+            self.remove(Path(path))
+
+    def clear(self):
+        for path, _ in self.entries():
+            self.remove(Path(path))
+        with self.lock:
+            self.size = 0
@@ -0,0 +1,90 @@
+import threading
+from typing import Callable, Optional
+from loguru import logger
+
+from .repository import Repository
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    # optional, without it the RepositoryWatcher only polls
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class ChangeHandler(FileSystemEventHandler):
+
+    def __init__(self, changed: threading.Event):
+        super().__init__()
+        self.changed = changed
+
+    def on_any_event(self, event):
+        self.changed.set()
+
+
+class RepositoryWatcher:
+    """
+    keeps a long lived Repository up to date by calling its refresh() in a thread
+
+    with watchdog installed (inotify, ReadDirectoryChangesW, ...) a refresh runs as soon as the events
+    under the root settled for debounce seconds. every interval seconds it refreshes anyway,
+    network shares often deliver no events.
+    the refresh only protects readers that hold lock while reading the repository
+    (with watcher.lock: ...), others may see a half refreshed program.
+    on_refresh(changes) is called after a refresh that changed something
+    """
+
+    def __init__(self, repository: Repository, interval: float = 60.0, debounce: float = 2.0,
+                 on_refresh: Optional[Callable[[dict], None]] = None, use_events: bool = True):
+        self.repository = repository
+        self.interval = interval
+        self.debounce = debounce
+        self.on_refresh = on_refresh
+        self.use_events = use_events and Observer is not None
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.stopped = threading.Event()
+        self.observer = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'RepositoryWatcher':
+        if self.use_events:
+            self.observer = Observer()
+            self.observer.schedule(ChangeHandler(self.changed), str(self.repository.root), recursive=True)
+            self.observer.start()
+        self.thread = threading.Thread(target=self.run, name="RepositoryWatcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.changed.wait(self.interval):
+                # let a sync of many files settle
+                while self.changed.is_set() and not self.stopped.is_set():
+                    self.changed.clear()
+                    self.stopped.wait(self.debounce)
+            if self.stopped.is_set():
+                return
+            self.refresh()
+
+    def refresh(self):
+        try:
+            with self.lock:
+                changes = self.repository.refresh()
+        except Exception as e:
+            logger.exception(f"RepositoryWatcher could not refresh {self.repository.root} | {e}")
+            return
+        if any(changes.values()):
+            logger.debug(f"RepositoryWatcher refreshed {changes}")
+            if self.on_refresh:
+                self.on_refresh(changes)
+
+    def stop(self):
+        self.stopped.set()
+        self.changed.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        if self.thread is not None:
+            self.thread.join()
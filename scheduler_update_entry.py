@@ -23,6 +23,37 @@ parser = argparse.ArgumentParser(
     usage="python scheduler_db_update.py time")
 # parser.add_argument('time', type=str, help='Time value in the format "HH:MM"')
 parser.add_argument('ofml_repo_path', type=str, help='Existing path to a ofml repo')
+parser.add_argument('--incremental', action='store_true',
+                    help='Only persist tables whose source file changed since the last run')
+parser.add_argument('--method', choices=['batch', 'load_data'], default=None,
+                    help='Bulk insert method, default from config.ini [persist]')
+parser.add_argument('--batch-size', type=int, default=None,
+                    help='Rows per INSERT batch / LOAD DATA chunk, default from config.ini [persist]')
+parser.add_argument('--mode', choices=['delete', 'swap'], default=None,
+                    help='delete: DELETE + INSERT in place, swap: load staging tables and RENAME TABLE them in. '
+                         'Default from config.ini [persist]')
+parser.add_argument('--parsers', type=int, default=None,
+                    help='Number of programs parsed concurrently (default 2)')
+parser.add_argument('--writers', type=int, default=None,
+                    help='Number of concurrent table writers (default: size of the connection pool)')
+parser.add_argument('--parse-processes', type=int, default=None,
+                    help='Parse tables in a pool of this many processes instead of threads')
+parser.add_argument('--report', type=str, default=None,
+                    help='Write per stage, program and table timings to this .json or .csv file')
+parser.add_argument('--prometheus-textfile', type=str, default=None,
+                    help='Write the timings as Prometheus textfile')
+parser.add_argument('--queue-size', type=int, default=None,
+                    help='Parsed tables waiting to be written before parsers block (default 2 * writers)')
+parser.add_argument('--snapshot', type=str, default=None,
+                    help='Also write the read tables as memory-mappable snapshot directory for the api processes')
+parser.add_argument('--stream-threshold-mb', type=float, default=None,
+                    help='Persist tables whose file is larger than this in chunks instead of reading them whole')
+parser.add_argument('--table-timeout', type=float, default=None,
+                    help='Skip a table whose file could not be read within this many seconds (e.g. a hanging share)')
+parser.add_argument('--retries', type=int, default=None,
+                    help='Try to persist a table this many more times (with backoff) before the run fails (default 3)')
+parser.add_argument('--journal', type=str, default=None,
+                    help='Progress journal of the run, a run after a failed one resumes it (default sync_journal.jsonl)')
 args = parser.parse_args()
 
 
@@ -37,4 +68,21 @@ if not is_valid_ofml_repo_path(args.ofml_repo_path):
 
 # run_loop(time_schedule=args.time, ofml_repo_path=args.ofml_repo_path)
 
-job(ofml_repo_path=args.ofml_repo_path)
\ No newline at end of file
+options = {k: v for k, v in {
+    "method": args.method,
+    "batch_size": args.batch_size,
+    "mode": args.mode,
+    "parser_workers": args.parsers,
+    "writer_workers": args.writers,
+    "queue_size": args.queue_size,
+    "parse_processes": args.parse_processes,
+    "report_path": args.report,
+    "prometheus_path": args.prometheus_textfile,
+    "snapshot_path": args.snapshot,
+    "stream_threshold": int(args.stream_threshold_mb * 1024 ** 2) if args.stream_threshold_mb is not None else None,
+    "table_timeout": args.table_timeout,
+    "retries": args.retries,
+    "journal_path": args.journal,
+}.items() if v is not None}
+
+job(ofml_repo_path=args.ofml_repo_path, incremental=args.incremental, **options)
\ No newline at end of file
@@ -14,11 +14,11 @@ def print_scheduled_jobs():
         logger.info(f" - {_.__repr__()}")
 
 
-def job(ofml_repo_path: str):
+def job(ofml_repo_path: str, **kwargs):
     now = datetime.now().strftime("%H:%M:%S")
     logger.info(f"execute job at {now}")
     try:
-        run_with_path(ofml_repo_path)
+        run_with_path(ofml_repo_path, **kwargs)
         # print("FAKE run_with_path :::", ofml_repo_path)
     except Exception as e:
         message = f"Update from {ofml_repo_path} raised exception: {e}"
@@ -37,12 +37,12 @@ def seconds_to_hms(seconds):
     seconds = seconds % 60
     return hours, minutes, round(seconds, 0)
 
-def run_loop(time_schedule: str, ofml_repo_path: str):
+def run_loop(time_schedule: str, ofml_repo_path: str, **kwargs):
     
-    job(ofml_repo_path)
+    job(ofml_repo_path, **kwargs)
     return
     
-    schedule.every().day.at(time_schedule, "Europe/Berlin").do(job, ofml_repo_path=ofml_repo_path)
+    schedule.every().day.at(time_schedule, "Europe/Berlin").do(job, ofml_repo_path=ofml_repo_path, **kwargs)
     logger.info(f'The provided time is: "{time_schedule}". Now is {datetime.now().strftime("%H:%M:%S")}.')
     print_scheduled_jobs()
     while True:
@@ -23,4 +23,11 @@ email_config = {
     "host": config.get('email', 'host'),
     "port": config.getint('email', 'port'),
     "tls": config.getboolean('email', 'tls'),
-}
\ No newline at end of file
+}
+persist_config = {
+    # batch: bounded multi-row INSERT batches | load_data: LOAD DATA LOCAL INFILE
+    "method": config.get('persist', 'method', fallback='batch'),
+    "batch_size": config.getint('persist', 'batch_size', fallback=10000),
+    # delete: DELETE + INSERT per program | swap: load into <table>__staging and RENAME TABLE
+    "mode": config.get('persist', 'mode', fallback='delete'),
+}
@@ -0,0 +1,187 @@
+import asyncio
+import csv
+from pathlib import Path
+
+import aiomysql
+import pandas as pd
+import pytest
+
+from repo.repository import OFMLPart, TableStream
+
+try:
+    from repo.db_async import AsyncDatabaseInterface
+except ValueError:
+    # settings.py needs the config.ini of the database
+    pytest.skip("no config.ini", allow_module_level=True)
+
+
+class Cursor:
+    """
+    the aiomysql cursor and connection, records the statements and their rows instead of sending them
+    """
+
+    def __init__(self, rows=(), errors=None):
+        self.statements = []
+        self.commits = 0
+        self.rows = list(rows)
+        # statement start -> errors raised (one per execute) instead of executing it
+        self.errors = errors or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def cursor(self):
+        return self
+
+    async def execute(self, statement, args=None):
+        for start, errors in self.errors.items():
+            if statement.startswith(start) and errors:
+                raise errors.pop(0)
+        if "LOAD DATA" in statement:
+            path = statement.split("'")[1]
+            with open(path, encoding="utf-8", newline="") as f:
+                args = list(csv.reader(f, delimiter="\t", escapechar="\\", doublequote=False))
+        self.statements.append((" ".join(statement.split()), args))
+
+    async def executemany(self, statement, rows):
+        self.statements.append((statement, rows))
+
+    async def fetchall(self):
+        return self.rows
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.statements.append(("ROLLBACK", None))
+
+
+class Pool:
+
+    def __init__(self, cur: Cursor):
+        self.cur = cur
+
+    def acquire(self):
+        return self.cur
+
+
+def test_insert_batches_in_slices_of_batch_size():
+    cur = Cursor()
+    db = AsyncDatabaseInterface(None, batch_size=2)
+    df = pd.DataFrame({"article_nr": ["A", "B", None], "price": [1.5, 2.0, 3.0]})
+
+    asyncio.run(db.insert_batches(cur, cur, "ocd_price", df))
+
+    statement = "INSERT INTO ocd_price (`article_nr`, `price`) VALUES (%s, %s);"
+    assert cur.statements == [(statement, [["A", 1.5], ["B", 2.0]]), (statement, [["", 3.0]])]
+    assert cur.commits == 2
+
+
+def test_load_data_from_a_csv_file():
+    cur = Cursor()
+    db = AsyncDatabaseInterface(None, method="load_data")
+    df = pd.DataFrame({"article_nr": ['A "1"', "B\tC"], "price": [1.5, 2.0]})
+
+    asyncio.run(db.load_data(cur, cur, "ocd_price", df))
+
+    [(statement, rows)] = cur.statements
+    assert statement.startswith("LOAD DATA LOCAL INFILE") and statement.endswith("(`article_nr`, `price`);")
+    assert rows == [['A "1"', "1.5"], ["B\tC", "2.0"]]
+    assert cur.commits == 1
+
+
+def test_swap_staging_tables_renames_all_tables_at_once():
+    cur = Cursor(rows=[("prog_a",), ("prog_b",)])
+    db = AsyncDatabaseInterface(Pool(cur), mode="swap")
+    db.staged_programs["ocd_article"].add("prog_a")
+    db.staged_programs["ocd_price"].add("prog_a")
+
+    asyncio.run(db.swap_staging_tables())
+
+    statements = [statement for statement, _ in cur.statements]
+    copies = [_ for _ in statements if _.startswith("INSERT")]
+    assert copies == [f"INSERT INTO {_}__staging SELECT * FROM {_} WHERE sql_db_program=%s;"
+                      for _ in ("ocd_article", "ocd_price")]
+    assert [_ for _ in statements if _.startswith("RENAME")] == [
+        "RENAME TABLE ocd_article TO ocd_article__old, ocd_article__staging TO ocd_article, "
+        "ocd_price TO ocd_price__old, ocd_price__staging TO ocd_price;"]
+    assert not db.staged_programs
+
+
+def test_resume_staging_tables_that_were_not_swapped_in():
+    cur = Cursor(rows=[("ocd_price__staging",)])
+    db = AsyncDatabaseInterface(Pool(cur), mode="swap")
+
+    asyncio.run(db.resume_staging_tables({"ocd_article": {"prog_a"}, "ocd_price": {"prog_a", "prog_b"}}))
+
+    [(_, args)] = cur.statements
+    assert args == ["ocd_article__staging", "ocd_price__staging"]
+    assert db.resumed and db.staged_programs == {"ocd_price": {"prog_a", "prog_b"}}
+
+
+def price_stream(tmp_path: Path, content: str) -> TableStream:
+    (tmp_path / "ocd_price.csv").write_text(content, encoding="cp1252")
+    tables_definitions = {"ocd_price.csv": [["article_nr", "price"], ["string", "float"], ";"]}
+    ofml_part = OFMLPart.from_tables_definitions(tables_definitions, tmp_path, "ocd")
+    return TableStream(ofml_part, "ocd_price.csv", chunksize=2)
+
+
+def test_persist_table_stream_in_chunks(tmp_path: Path):
+    cur = Cursor()
+    db = AsyncDatabaseInterface(Pool(cur), batch_size=2)
+    stream = price_stream(tmp_path, "A;1\nB;2\nC;3\n")
+
+    assert asyncio.run(db.persist_table(stream, "prog"))
+    statements = [statement.split(" (")[0] for statement, _ in cur.statements]
+    assert statements == ["DELETE FROM ocd_price WHERE sql_db_program=%s;", "INSERT INTO ocd_price",
+                          "INSERT INTO ocd_price"]
+    assert [row[:2] for _, rows in cur.statements[1:] for row in rows] == [["A", 1.0], ["B", 2.0], ["C", 3.0]]
+
+
+def test_persist_table_skips_stream_that_can_not_be_parsed(tmp_path: Path):
+    cur = Cursor()
+    db = AsyncDatabaseInterface(Pool(cur), batch_size=2)
+
+    # the first chunk fails, the rows of the program stay untouched
+    assert not asyncio.run(db.persist_table(price_stream(tmp_path, "A;x\nB;2\n"), "prog"))
+    assert cur.statements == []
+
+    # a later chunk fails, the rows inserted so far are removed again
+    assert not asyncio.run(db.persist_table(price_stream(tmp_path, "A;1\nB;2\nC;x\n"), "prog"))
+    statements = [statement.split(" (")[0] for statement, _ in cur.statements]
+    assert statements == ["DELETE FROM ocd_price WHERE sql_db_program=%s;", "INSERT INTO ocd_price", "ROLLBACK",
+                          "DELETE FROM ocd_price WHERE sql_db_program=%s;"]
+
+
+def lost_connection():
+    return aiomysql.OperationalError(2013, "Lost connection to MySQL server during query")
+
+
+@pytest.mark.parametrize("mode, failing", [("delete", "DELETE"), ("swap", "CREATE")])
+def test_persist_table_retrying_after_lost_connection(tmp_path: Path, mode: str, failing: str):
+    cur = Cursor(errors={failing: [lost_connection()]})
+    db = AsyncDatabaseInterface(Pool(cur), batch_size=2, mode=mode)
+
+    assert asyncio.run(db.persist_table_retrying(price_stream(tmp_path, "A;1\n"), "prog", backoff=0))
+    statements = [statement.split(" (")[0] for statement, _ in cur.statements]
+    if mode == "delete":
+        assert statements == ["DELETE FROM ocd_price WHERE sql_db_program=%s;", "INSERT INTO ocd_price"]
+    else:
+        # the staging table is created again and cleaned of the rows of the program
+        assert statements == ["DROP TABLE IF EXISTS ocd_price__staging;", "DROP TABLE IF EXISTS ocd_price__staging;",
+                              "CREATE TABLE IF NOT EXISTS ocd_price__staging LIKE ocd_price;",
+                              "DELETE FROM ocd_price__staging WHERE sql_db_program=%s;",
+                              "INSERT INTO ocd_price__staging"]
+        assert db.staged_programs == {"ocd_price": {"prog"}}
+
+
+def test_persist_table_retrying_raises_the_last_error(tmp_path: Path):
+    cur = Cursor(errors={"DELETE": [lost_connection() for _ in range(3)]})
+    db = AsyncDatabaseInterface(Pool(cur), batch_size=2)
+
+    with pytest.raises(aiomysql.OperationalError):
+        asyncio.run(db.persist_table_retrying(price_stream(tmp_path, "A;1\n"), "prog", retries=2, backoff=0))
+    assert cur.statements == []
@@ -0,0 +1,36 @@
+import json
+from pathlib import Path
+
+from repo.instrumentation import RunReport, report
+from repo.repository import Repository
+from tests.test_repository import make_repository
+
+
+def test_report_records_stages_per_program_and_table(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(report, "enabled", True)
+    report.reset()
+    repo = Repository(root=make_repository(tmp_path / "repo"))
+    repo.read_profiles()
+    program = repo.load_program("workplace")
+    program.load_ocd()
+    program.ocd.read_all_tables()
+
+    stages = {_["stage"] for _ in report.records}
+    assert {"read_profiles", "load_ofml_part", "read_table", "strip"} <= stages
+
+    tables = {(_["program"], _["table"]): _ for _ in report.summary("program", "table") if _["stage"] == "read_table"}
+    assert tables[("workplace", "ocd_article.csv")]["rows"] == 2
+    assert tables[("workplace", "ocd_article.csv")]["bytes"] > 0
+    strip = {(_["program"], _["table"]): _ for _ in report.summary("program", "table") if _["stage"] == "strip"}
+    assert strip[("workplace", "ocd_article.csv")]["rows"] == 2
+
+    report.write(tmp_path / "report.json")
+    assert json.loads((tmp_path / "report.json").read_text())["programs"]
+    report.write(tmp_path / "report.csv")
+    assert (tmp_path / "report.csv").read_text().startswith("stage,program")
+    report.write_prometheus(tmp_path / "report.prom")
+    assert 'ofml_update_stage_seconds{stage="read_table",program="workplace"}' in (tmp_path / "report.prom").read_text()
+
+
+def test_report_is_disabled_by_default(tmp_path: Path):
+    assert not RunReport().enabled
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from repo.ocd_prices import calculate_prices
+
+PRICES = pd.DataFrame({
+    "article_nr": ["A", "A", "A", "A", "A", "A", "B"],
+    "var_cond": ["", "BIG", "LEG", "LEG", "PCT", "OLD", ""],
+    "price_type": "S",
+    "price_level": ["B", "B", "X", "X", "X", "X", "B"],
+    "is_fix": [1, 1, 1, 1, 0, 1, 1],
+    "currency": ["EUR", "EUR", "EUR", "CHF", "EUR", "EUR", "EUR"],
+    "date_from": ["20240101", "20240101", "20240101", "20240101", "20240101", "20200101", ""],
+    "date_to": ["", "", "", "", "", "20201231", ""],
+    "price": [100.0, 150.0, 10.0, 11.0, 10.0, 99.0, 50.0],
+    "price_textnr": "",
+}).astype({"article_nr": "category", "var_cond": "string"})
+
+
+def test_calculate_prices():
+    totals, breakdown = calculate_prices(PRICES, [
+        ("A", []),
+        ("A", ["LEG", "PCT"]),
+        ("A", ["BIG", "LEG", "OLD"]),
+        ("B", ["LEG"]),
+        ("C", []),
+    ], currency="EUR", date="2024-06-01")
+
+    assert totals["base"].tolist()[:4] == [100.0, 100.0, 150.0, 50.0]
+    # the percentage surcharge is relative to the base price, the outdated one is ignored
+    assert totals["surcharges"].tolist()[:4] == [0.0, 20.0, 10.0, 0.0]
+    assert totals["total"].tolist()[:4] == [100.0, 120.0, 160.0, 50.0]
+    assert pd.isna(totals["total"].iloc[4])
+    assert breakdown[breakdown["line"] == 1]["amount"].tolist() == [100.0, 10.0, 10.0]
+
+
+def test_calculate_prices_edge_cases():
+    totals, breakdown = calculate_prices(PRICES, [], currency="EUR")
+    assert totals.empty and breakdown.empty
+
+    # a single var_cond as string, the surcharges of other currencies do not count
+    totals, _ = calculate_prices(PRICES, [("A", "LEG", None), ("A", ["LEG"], "CHF")], currency="EUR", date="20240601")
+    assert totals["surcharges"].tolist() == [10.0, 11.0]
+
+    with pytest.raises(ValueError):
+        calculate_prices(PRICES, [("A", ["LEG"])])
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from benchmarks.synthetic_repository import generate_repository
+from repo.repository import Repository, OCDPart
+
+
+def test_resolve_matches_the_indexed_lookups(tmp_path: Path):
+    repo = Repository(root=generate_repository(tmp_path, programs=1, rows=200), lazy=True, categorical="auto")
+    repo.read_profiles()
+    ocd = repo["prog000"].ocd
+    resolver = ocd.resolver("en")
+    assert ocd.resolver("en") is resolver
+
+    article_nr = ocd.table("ocd_article").df["article_nr"].iloc[3]
+    resolved = resolver.resolve(article_nr)
+    assert resolved["article"]["short_text"] == ocd.text(resolved["article"]["short_textnr"], "en")
+    assert resolved["prices"]["price"].tolist() == ocd.prices_of(article_nr)["price"].tolist()
+    assert set(resolved["properties"]["property"]) == set(ocd.properties_of(article_nr)["property"])
+    assert resolved["properties"]["value_text"].str.endswith("(en)").all()
+
+    assert resolver.resolve("missing")["article"] is None
+    many = resolver.resolve_many([article_nr, "missing", article_nr])
+    assert many["articles"]["article_nr"].tolist() == [article_nr]
+    assert (many["properties"]["article_nr"] == article_nr).all()
+    assert len(many["prices"]) == len(resolved["prices"])
+
+
+def test_resolver_is_joined_again_after_refresh(tmp_path: Path, monkeypatch):
+    root = generate_repository(tmp_path, programs=1, rows=50)
+    repo = Repository(root=root, check_interval=60)
+    repo.read_profiles()
+    ocd = repo.load_program("prog000").load_ocd()
+    resolver = ocd.resolver("en")
+
+    # within the interval no file is checked
+    monkeypatch.setattr(OCDPart, "current_table", None)
+    assert ocd.resolver("en") is resolver
+    monkeypatch.undo()
+
+    price_path = ocd.path / "ocd_price.csv"
+    price_path.write_text(price_path.read_text(encoding="cp1252") + "ART_NEW;;S;X;;;9;EUR;;;\n",
+                          encoding="cp1252")
+    repo.refresh()
+    assert ocd.resolver("en") is not resolver
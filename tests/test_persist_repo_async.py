@@ -0,0 +1,151 @@
+import asyncio
+import os
+from collections import defaultdict
+from pathlib import Path
+
+import pytest
+
+from tests.test_repository import make_repository
+
+try:
+    from repo import persist_repo_async
+except ValueError:
+    # settings.py needs the config.ini of the database
+    pytest.skip("no config.ini", allow_module_level=True)
+
+
+class Pool:
+    maxsize = 2
+
+
+class Database:
+    """
+    the AsyncDatabaseInterface used by main, records what was persisted instead of writing it
+    """
+
+    def __init__(self, mode: str = "delete", failing: str = None, misc_error: Exception = None):
+        self.mode = mode
+        self.batch_size = 1000
+        self.pool = Pool()
+        self.persisted = []
+        self.removed = []
+        self.staged_programs = defaultdict(set)
+        # the table that fails once the others were persisted and the error of update_misc
+        self.failing = failing
+        self.misc_error = misc_error
+
+    async def persist_table_retrying(self, table, program_name, **kwargs):
+        if table.name == self.failing:
+            while not self.persisted:
+                await asyncio.sleep(0.01)
+            raise ConnectionError(f"{table.name} lost the connection")
+        self.persisted.append((program_name, table.name, len(table.df)))
+        return True
+
+    async def remove_program_rows(self, table_name, program_name):
+        self.removed.append((program_name, table_name))
+
+    async def resume_staging_tables(self, staged_programs):
+        self.staged_programs.update(staged_programs)
+
+    async def swap_staging_tables(self):
+        pass
+
+    async def update_misc(self, **kwargs):
+        if self.misc_error:
+            raise self.misc_error
+
+
+def run(root: Path, tmp_path: Path, db: Database, monkeypatch, **kwargs):
+    async def create(event_loop, **kw):
+        return db
+
+    monkeypatch.setattr(persist_repo_async.AsyncDatabaseInterface, "create", staticmethod(create))
+    # main enables the report of the process
+    monkeypatch.setattr(persist_repo_async.report, "enabled", persist_repo_async.report.enabled)
+    asyncio.run(persist_repo_async.main(str(root), manifest_path=tmp_path / "manifest.json",
+                                        journal_path=tmp_path / "journal.jsonl", writer_workers=2, **kwargs))
+
+
+def test_incremental_run_persists_changed_and_removed_tables(tmp_path: Path, monkeypatch):
+    root = make_repository(tmp_path / "repo")
+    ocd_path = root / "kn" / "workplace" / "DE" / "2" / "db"
+    (ocd_path / "pdata.inp_descr").write_text(
+        (ocd_path / "pdata.inp_descr").read_text(encoding="cp1252") +
+        "table Text ocd_artshorttext.csv\nfield Text textnr string\n", encoding="cp1252")
+    (ocd_path / "ocd_artshorttext.csv").write_text("", encoding="cp1252")
+
+    db = Database()
+    run(root, tmp_path, db, monkeypatch)
+    assert sorted(db.persisted) == [("workplace", "ocd_article.csv", 2), ("workplace", "ocd_price.csv", 1)]
+
+    # nothing changed, the empty table is known as well
+    db = Database()
+    run(root, tmp_path, db, monkeypatch, incremental=True)
+    assert db.persisted == [] and db.removed == []
+
+    mtime = os.stat(ocd_path / "ocd_price.csv").st_mtime
+    (ocd_path / "ocd_price.csv").write_text("ART 1;10.5\nART 2;3\n", encoding="cp1252")
+    os.utime(ocd_path / "ocd_price.csv", (mtime + 10, mtime + 10))
+    os.remove(ocd_path / "ocd_article.csv")
+    db = Database()
+    run(root, tmp_path, db, monkeypatch, incremental=True)
+    assert db.persisted == [("workplace", "ocd_price.csv", 2)]
+    assert db.removed == [("workplace", "ocd_article")]
+
+    db = Database()
+    run(root, tmp_path, db, monkeypatch, incremental=True)
+    assert db.persisted == [] and db.removed == []
+
+
+def test_failed_run_is_resumed(tmp_path: Path, monkeypatch):
+    root = make_repository(tmp_path / "repo")
+
+    db = Database(mode="swap", failing="ocd_price.csv")
+    with pytest.raises(ExceptionGroup):
+        run(root, tmp_path, db, monkeypatch)
+    assert db.persisted == [("workplace", "ocd_article.csv", 2)]
+
+    # the committed table is skipped and stays staged, it is read for the snapshot only
+    db = Database(mode="swap")
+    run(root, tmp_path, db, monkeypatch, snapshot_path=tmp_path / "snapshot")
+    assert db.persisted == [("workplace", "ocd_price.csv", 1)]
+    assert sorted(_.name for _ in (tmp_path / "snapshot" / "workplace" / "ocd").iterdir()) == [
+        "ocd_article.csv.feather", "ocd_price.csv.feather"]
+    assert db.staged_programs == {"ocd_article": {"workplace"}}
+    assert not (tmp_path / "journal.jsonl").exists()
+
+    # the table committed by the failed run is known with its file
+    os.remove(root / "kn" / "workplace" / "DE" / "2" / "db" / "ocd_article.csv")
+    db = Database(mode="swap")
+    run(root, tmp_path, db, monkeypatch, incremental=True)
+    assert db.persisted == [] and db.removed == [("workplace", "ocd_article")]
+
+
+def test_run_failing_after_the_swap_is_not_resumed(tmp_path: Path, monkeypatch):
+    root = make_repository(tmp_path / "repo")
+
+    db = Database(mode="swap", misc_error=ConnectionError("lost the connection"))
+    with pytest.raises(ConnectionError):
+        run(root, tmp_path, db, monkeypatch)
+    assert not (tmp_path / "journal.jsonl").exists()
+
+    db = Database(mode="swap")
+    run(root, tmp_path, db, monkeypatch)
+    assert sorted(db.persisted) == [("workplace", "ocd_article.csv", 2), ("workplace", "ocd_price.csv", 1)]
+    assert not db.staged_programs
+
+
+def test_incremental_snapshot_takes_only_unchanged_tables(tmp_path: Path, monkeypatch):
+    root = make_repository(tmp_path / "repo")
+    snapshot_path = tmp_path / "snapshot"
+    run(root, tmp_path, Database(), monkeypatch, snapshot_path=snapshot_path)
+    ocd_snapshot = snapshot_path / "workplace" / "ocd"
+    assert sorted(_.name for _ in ocd_snapshot.iterdir()) == ["ocd_article.csv.feather", "ocd_price.csv.feather"]
+
+    os.remove(root / "kn" / "workplace" / "DE" / "2" / "db" / "ocd_article.csv")
+    db = Database()
+    run(root, tmp_path, db, monkeypatch, incremental=True, snapshot_path=snapshot_path)
+    assert db.removed == [("workplace", "ocd_article")]
+    # the rows of the removed file are neither in the database nor in the snapshot
+    assert sorted(_.name for _ in ocd_snapshot.iterdir()) == ["ocd_price.csv.feather"]
@@ -0,0 +1,50 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from repo.progress_journal import ProgressJournal
+from repo.repository import Table
+
+
+def test_unfinished_run_is_resumed(tmp_path: Path):
+    paths = {_: tmp_path / _ for _ in ("ocd_article.csv", "ocd_price.csv")}
+    for path in paths.values():
+        path.write_text("A;B\n", encoding="cp1252")
+    journal = ProgressJournal(tmp_path / "journal.jsonl", root=tmp_path, mode="delete")
+    assert not journal.resumed
+    journal.commit("prog", Table(pd.DataFrame({"x": ["A"]}), paths["ocd_article.csv"], "ocd"))
+    # the run fails
+    journal.close()
+
+    journal = ProgressJournal(tmp_path / "journal.jsonl", root=tmp_path, mode="delete")
+    assert journal.resumed
+    assert journal.is_committed("prog", "ocd", "ocd_article.csv", paths["ocd_article.csv"])
+    assert not journal.is_committed("prog", "ocd", "ocd_price.csv", paths["ocd_price.csv"])
+    assert journal.staged_programs() == {"ocd_article": {"prog"}}
+
+    # changed since the failed run
+    paths["ocd_article.csv"].write_text("A;C\n", encoding="cp1252")
+    os.utime(paths["ocd_article.csv"], (0, 0))
+    assert not journal.is_committed("prog", "ocd", "ocd_article.csv", paths["ocd_article.csv"])
+
+    journal.finish()
+    assert not (tmp_path / "journal.jsonl").exists()
+    assert not ProgressJournal(tmp_path / "journal.jsonl", root=tmp_path, mode="delete").resumed
+
+
+def test_journal_of_another_run_is_not_resumed(tmp_path: Path):
+    (tmp_path / "ocd_article.csv").write_text("A;B\n", encoding="cp1252")
+    journal = ProgressJournal(tmp_path / "journal.jsonl", root=tmp_path, mode="delete")
+    journal.commit("prog", Table(pd.DataFrame({"x": ["A"]}), tmp_path / "ocd_article.csv", "ocd"))
+    journal.close()
+    # a half written last line is ignored
+    with open(tmp_path / "journal.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"program": "pr')
+
+    journal = ProgressJournal(tmp_path / "journal.jsonl", root=tmp_path, mode="delete")
+    assert journal.resumed
+    journal.commit("prog", Table(pd.DataFrame({"x": ["A"]}), tmp_path / "ocd_article.csv", "oam"))
+    journal.close()
+    assert len(ProgressJournal(tmp_path / "journal.jsonl", root=tmp_path, mode="delete").entries) == 2
+    assert not ProgressJournal(tmp_path / "journal.jsonl", root=tmp_path, mode="swap").resumed
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pyarrow as pa
+import pytest
+
+from repo import query
+from repo.repository import Repository
+from tests.test_repository import make_repository
+
+duckdb = pytest.importorskip("duckdb")
+
+
+def test_sql_over_the_tables_of_all_programs(tmp_path: Path):
+    repo = Repository(root=make_repository(tmp_path), categorical={"ocd_article": ["art_type"]})
+    repo.read_profiles()
+    repo.load_program("workplace").load_ocd().read_all_tables()
+
+    without_prices = repo.sql("SELECT a.sql_db_program, a.article_nr FROM ocd_article a "
+                              "ANTI JOIN ocd_price p USING (sql_db_program, article_nr)")
+    assert without_prices.to_dict("records") == [{"sql_db_program": "workplace", "article_nr": "ART 2"}]
+    assert repo.sql("SELECT art_type FROM ocd_article WHERE article_nr = ?", ["ART 1"])["art_type"].tolist() == ["S"]
+
+    # a table read again is registered again
+    (tmp_path / "kn" / "workplace" / "DE" / "2" / "db" / "ocd_price.csv").write_text("ART 1;1\nART 2;2\n")
+    repo["workplace"].ocd.read_table("ocd_price.csv")
+    assert repo.sql("SELECT count(*) n FROM ocd_price")["n"].tolist() == [2]
+    assert repo.query.arrow("SELECT sum(price) s FROM ocd_price").column("s").to_pylist() == [3.0]
+
+
+def test_table_that_can_not_be_registered_again_is_dropped(tmp_path: Path, monkeypatch):
+    repo = Repository(root=make_repository(tmp_path))
+    repo.read_profiles()
+    repo.load_program("workplace").load_ocd().read_all_tables()
+    assert repo.sql("SELECT count(*) n FROM ocd_price")["n"].tolist() == [1]
+
+    def arrow_table(table, program_name):
+        raise pa.ArrowInvalid("no arrow")
+
+    monkeypatch.setattr(query, "arrow_table", arrow_table)
+    repo["workplace"].ocd.read_table("ocd_price.csv")
+    with pytest.raises(duckdb.CatalogException):
+        repo.sql("SELECT count(*) n FROM ocd_price")
+    assert repo.sql("SELECT count(*) n FROM ocd_article")["n"].tolist() == [2]
+
+
+def test_tables_of_a_snapshot_are_read_on_demand(tmp_path: Path):
+    repo = Repository(root=make_repository(tmp_path / "repo"))
+    repo.read_profiles()
+    repo.load_program("workplace").load_ocd().read_all_tables()
+    repo.save_snapshot(tmp_path / "snapshot")
+
+    snapshot = Repository.open_snapshot(tmp_path / "snapshot")
+    assert snapshot.sql("SELECT count(*) n FROM ocd_article", tables=["ocd_article"])["n"].tolist() == [2]
@@ -1,8 +1,348 @@
+import os
 from pathlib import Path
 
-from repo.repository import Repository
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_repository import generate_repository
+from repo.repository import Repository, OFMLPart, OCDPart, Table, read_table
+from repo.table_cache import TableCache
+from repo import repository
+
+
+def make_repository(root: Path):
+    """
+    minimal plaintext repository with one program that has an ocd
+    """
+    (root / "profiles").mkdir(parents=True)
+    (root / "profiles" / "kn.cfg").write_text("[lib:kn]\nkn_workplace_DE_1=1\n", encoding="cp1252")
+    (root / "registry").mkdir()
+    (root / "registry" / "kn_workplace_DE_1.cfg").write_text(
+        "program=workplace\nproductdb_path=kn/workplace/DE/2/db\n", encoding="cp1252")
+    ocd_path = root / "kn" / "workplace" / "DE" / "2" / "db"
+    ocd_path.mkdir(parents=True)
+    (ocd_path / "pdata.inp_descr").write_text(
+        "table Article ocd_article.csv\n"
+        "field Article article_nr string\n"
+        "field Article art_type string\n"
+        "table Price ocd_price.csv\n"
+        "field Price article_nr string\n"
+        "field Price price float\n", encoding="cp1252")
+    (ocd_path / "ocd_article.csv").write_text("ART 1;S\nART 2;S\n", encoding="cp1252")
+    (ocd_path / "ocd_price.csv").write_text("ART 1;10.5\n", encoding="cp1252")
+    return root
 
 
 def test_load_repo():
     Repository(root=Path(r"b:\Testumgebung\EasternGraphics"))
 
+
+def test_lazy_program_reads_on_first_access(tmp_path: Path):
+    repo = Repository(root=make_repository(tmp_path), lazy=True)
+    repo.read_profiles()
+
+    program = repo["workplace"]
+    assert program.loaded_ofml_parts() == []
+    assert program.all_tables == []
+
+    article = program.ocd.table("ocd_article", columns=["article_nr"])
+    assert list(article.df.columns) == ["article_nr"]
+    assert [_.name for _ in program.all_tables] == ["ocd_article.csv"]
+
+    # a wider projection reads the table again
+    assert list(program.ocd.table("ocd_article", columns=["art_type"]).df.columns) == ["article_nr", "art_type"]
+    assert program.ocd["ocd_price"].df["price"].tolist() == [10.5]
+
+
+
+def test_read_table_strips_and_keeps_dtypes(tmp_path: Path):
+    table_path = tmp_path / "ocd_price.csv"
+    table_path.write_text("ART 1 ; VC_1 ;12.5\n#comment\n ART 2;;3\n", encoding="cp1252")
+
+    table = read_table(table_path, names=["article_nr", "var_cond", "price"],
+                       dtype={"article_nr": "string", "var_cond": "string", "price": "float64"},
+                       encoding="cp1252", ofml_part_name="ocd")
+
+    assert table.df["article_nr"].tolist() == ["ART 1", "ART 2"]
+    assert table.df["var_cond"].tolist()[0] == "VC_1"
+    assert str(table.df["article_nr"].dtype) == "string"
+    assert str(table.df["price"].dtype) == "float64"
+    assert table.database_column_type("article_nr") == "varchar(255)"
+
+
+def test_read_table_pyarrow_engine_matches_c_engine(tmp_path: Path):
+    table_path = tmp_path / "ocd_price.csv"
+    table_path.write_text('A 1 ;"x;y ";1.5#comment\n#comment\nB;"a#b";2\nC;;\n', encoding="cp1252")
+    names = ["article_nr", "var_cond", "price"]
+    dtype = {"article_nr": "string", "var_cond": "string", "price": "float64"}
+
+    c = read_table(table_path, names, dtype, "cp1252", ofml_part_name="ocd", engine="c").df
+    arrow = read_table(table_path, names, dtype, "cp1252", ofml_part_name="ocd", engine="pyarrow").df
+
+    assert str(arrow["article_nr"].dtype) == "string[pyarrow]"
+    assert arrow.astype(object).where(arrow.notna(), None).values.tolist() == \
+           c.astype(object).where(c.notna(), None).values.tolist()
+
+    # a stray quote does not pair with the quote of another line
+    table_path.write_text('A 1;x"y;1.5\nB;v;2#comment\nC;"z";3\n', encoding="cp1252")
+    arrow = read_table(table_path, names, dtype, "cp1252", ofml_part_name="ocd", engine="pyarrow").df
+    assert arrow["price"].tolist() == [1.5, 2.0, 3.0]
+
+    # an empty table (only comments or whitespace) is read like the c engine does
+    for content in ("", "\n \n", "#comment\n"):
+        table_path.write_text(content, encoding="cp1252")
+        arrow = read_table(table_path, names, dtype, "cp1252", ofml_part_name="ocd", engine="pyarrow")
+        assert isinstance(arrow, Table) and arrow.df.empty and list(arrow.df.columns) == names
+
+    with pytest.raises(ValueError):
+        OFMLPart.from_tables_definitions({}, tmp_path, "ocd", engine="arrow")
+
+
+def test_ofml_part_reads_tables_from_cache(tmp_path: Path, monkeypatch):
+    (tmp_path / "ocd_article.csv").write_text("ART 1;S\n", encoding="cp1252")
+    tables_definitions = {"ocd_article.csv": [["article_nr", "art_type"], ["string", "string"], ";"]}
+    cache = TableCache(tmp_path / "cache")
+
+    ofml_part = OFMLPart.from_tables_definitions(tables_definitions, tmp_path, "ocd", cache=cache)
+    assert ofml_part.read_table("ocd_article.csv").df["article_nr"].tolist() == ["ART 1"]
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+    # a hit does not parse the csv
+    monkeypatch.setattr(repository, "read_table", None)
+    cached = ofml_part.read_table("ocd_article.csv").df
+    assert cached["article_nr"].tolist() == ["ART 1"]
+    assert str(cached["article_nr"].dtype) == "string"
+
+    # a changed definition is a miss
+    assert cache.get(repository.table_cache_key(cache, **ofml_part.read_table_kwargs("ocd_article.csv"))) is not None
+    tables_definitions["ocd_article.csv"][1][1] = "float64"
+    assert cache.get(repository.table_cache_key(cache, **ofml_part.read_table_kwargs("ocd_article.csv"))) is None
+
+
+def test_table_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = TableCache(tmp_path / "cache")
+    df = pd.DataFrame({"article_nr": ["ART %d" % _ for _ in range(100)]})
+    cache.put("a", df)
+    cache.max_bytes = int(2.5 * cache.size)
+    cache.put("b", df)
+    os.utime(cache.entry_path("a"), (0, 0))
+    assert cache.get("b") is not None
+
+    cache.put("c", df)
+    assert sorted(_.name for _ in (tmp_path / "cache").iterdir()) == ["b.feather", "c.feather"]
+    assert cache.size == cache.directory_size()
+
+    # entries removed by another process
+    os.remove(cache.entry_path("b"))
+    cache.put("d", df)
+    assert cache.size == cache.directory_size()
+
+
+def test_load_all_parts_of_synthetic_repository(tmp_path: Path):
+    repo = Repository(root=generate_repository(tmp_path, programs=2, rows=200))
+    repo.read_profiles()
+    assert repo.program_names() == ["prog000", "prog001"]
+
+    program = repo.load_program("prog001")
+    program.load_all()
+    assert [_.name for _ in program.loaded_ofml_parts()] == ["ocd", "oas", "oam", "go", "oap", "odb"]
+    for ofml_part in program.loaded_ofml_parts():
+        ofml_part.read_all_tables()
+        assert all(type(_) is Table and not _.df.empty for _ in ofml_part.tables.values()), ofml_part
+
+    assert program.odb.table("funcs").df["args"][0] == '"x, y"'
+    assert program.ocd.table("ocd_propertyvalue").df["value_from"][0] == "V001"
+    assert program.go.table("prog001_de.sr").database_table_name == "go_de_sr"
+
+
+def test_read_table_categorical(tmp_path: Path):
+    table_path = tmp_path / "ocd_price.csv"
+    table_path.write_text("".join(f"ART {i} ;DE;{i}\n" for i in range(10)), encoding="cp1252")
+    names = ["article_nr", "language", "price"]
+    dtype = {"article_nr": "string", "language": "string", "price": "float64"}
+
+    for engine in ("c", "pyarrow"):
+        table = read_table(table_path, names, dtype, "cp1252", ofml_part_name="ocd", engine=engine,
+                           categorical="auto")
+        # only the repeated column is converted
+        assert str(table.df["language"].dtype) == "category"
+        assert str(table.df["article_nr"].dtype) != "category"
+        assert table.df["language"].tolist() == ["DE"] * 10
+        assert table.database_column_type("language") == "varchar(255)"
+
+    declared = read_table(table_path, names, dtype, "cp1252", ofml_part_name="ocd", categorical=["article_nr"])
+    assert declared.df["article_nr"].tolist()[0] == "ART 0"
+    assert str(declared.df["article_nr"].dtype) == "category"
+
+
+def test_ocd_lookups_follow_changed_files(tmp_path: Path):
+    repo = Repository(root=make_repository(tmp_path), check_interval=0)
+    repo.read_profiles()
+    program = repo.load_program("workplace")
+    ocd = program.load_ocd()
+    assert isinstance(ocd, OCDPart) and program.is_ocd_available()
+
+    assert ocd.article("ART 2")["art_type"] == "S"
+    assert ocd.article("ART 3") is None
+    assert ocd.prices_of("ART 1")["price"].tolist() == [10.5]
+    assert ocd.prices_of("ART 2").empty
+
+    price_path = tmp_path / "kn" / "workplace" / "DE" / "2" / "db" / "ocd_price.csv"
+    price_path.write_text("ART 1;11\nART 2;20\n", encoding="cp1252")
+    os.utime(price_path, ns=(0, 0))
+    assert ocd.prices_of("ART 1")["price"].tolist() == [11.0]
+    assert ocd.prices_of("ART 2")["price"].tolist() == [20.0]
+
+
+def test_ocd_lookups_check_files_once_per_interval(tmp_path: Path, monkeypatch):
+    repo = Repository(root=make_repository(tmp_path), check_interval=60)
+    repo.read_profiles()
+    ocd = repo.load_program("workplace").load_ocd()
+    assert ocd.prices_of("ART 1")["price"].tolist() == [10.5]
+
+    price_path = tmp_path / "kn" / "workplace" / "DE" / "2" / "db" / "ocd_price.csv"
+    price_path.write_text("ART 1;11\n", encoding="cp1252")
+    os.utime(price_path, ns=(0, 0))
+    monkeypatch.setattr(Table, "is_modified", None)
+    assert ocd.prices_of("ART 1")["price"].tolist() == [10.5]
+
+    monkeypatch.undo()
+    repo.refresh()
+    assert ocd.prices_of("ART 1")["price"].tolist() == [11.0]
+
+
+def test_prices_of_a_price_level(tmp_path: Path):
+    repo = Repository(root=generate_repository(tmp_path, programs=1, rows=200))
+    repo.read_profiles()
+    ocd = repo.load_program("prog000").load_ocd()
+    prices = ocd.current_table("ocd_price").df
+    article_nr = prices.loc[prices["price_level"] == "X", "article_nr"].iloc[0]
+
+    surcharges = ocd.prices_of(article_nr, price_level="X")
+    assert len(surcharges) and (surcharges["price_level"] == "X").all()
+    assert len(surcharges) + len(ocd.prices_of(article_nr, price_level="B")) == len(ocd.prices_of(article_nr))
+    var_cond = surcharges["var_cond"].iloc[0]
+    assert ocd.prices_of(article_nr, var_cond, "X")["var_cond"].tolist() == [var_cond] * \
+           int((surcharges["var_cond"] == var_cond).sum())
+
+
+def test_refresh_reads_only_what_changed(tmp_path: Path):
+    root = make_repository(tmp_path)
+    repo = Repository(root=root)
+    repo.read_profiles()
+    program = repo.load_program("workplace")
+    program.load_ocd().read_table("ocd_price.csv")
+    assert repo.refresh() == {'profiles': False, 'added': [], 'removed': [], 'programs': [], 'ofml_parts': [],
+                              'tables': []}
+
+    ocd_path = root / "kn" / "workplace" / "DE" / "2" / "db"
+    (ocd_path / "ocd_price.csv").write_text("ART 1;11\n", encoding="cp1252")
+    (ocd_path / "ocd_article.csv").write_text("ART 9;S\n", encoding="cp1252")
+    os.utime(ocd_path / "ocd_price.csv", ns=(0, 0))
+    assert repo.refresh()['tables'] == [("workplace", "ocd_price.csv")]
+    assert program.ocd.tables["ocd_price"].df["price"].tolist() == [11.0]
+    # the article table was never read
+    assert "ocd_article" not in program.ocd.tables
+
+    (root / "profiles" / "kn.cfg").write_text("[lib:kn]\n", encoding="cp1252")
+    changes = repo.refresh()
+    assert changes['profiles'] and changes['removed'] == ["workplace"]
+    assert list(repo.programs()) == []
+
+
+def test_discover_serves_stats_from_directory_listings(tmp_path: Path, monkeypatch):
+    repo = Repository(root=generate_repository(tmp_path, programs=2, rows=20))
+    repo.read_profiles()
+    repo.discover()
+    assert set(repo.registries) == {"prog000", "prog001"}
+    size = (tmp_path / "kn" / "prog001" / "DE" / "2" / "db" / "ocd_article.csv").stat().st_size
+
+    def no_stat(*args, **kwargs):
+        raise AssertionError("stat outside of the directory listings")
+
+    monkeypatch.setattr(os, "stat", no_stat)
+    program = repo.load_program("prog001")
+    assert program.contains_odb() and program.contains_oap()
+    table = program.load_ocd().read_table("ocd_article.csv")
+    assert table.file_size == size
+
+
+def test_discover_leaves_out_dangling_symlinks(tmp_path: Path):
+    root = make_repository(tmp_path)
+    ocd_path = root / "kn" / "workplace" / "DE" / "2" / "db"
+    os.symlink(tmp_path / "gone.csv", ocd_path / "ocd_gone.csv")
+    repo = Repository(root=root)
+    repo.read_profiles()
+    repo.discover()
+    assert repo.stats.exists(ocd_path / "ocd_article.csv")
+    assert not repo.stats.exists(ocd_path / "ocd_gone.csv")
+    assert repo.load_program("workplace").load_ocd().read_table("ocd_price.csv").df["price"].tolist() == [10.5]
+
+
+def test_changed_table_is_not_served_from_an_old_listing(tmp_path: Path):
+    root = make_repository(tmp_path / "repo")
+    repo = Repository(root=root, cache=TableCache(tmp_path / "cache"), check_interval=0)
+    repo.read_profiles()
+    repo.discover()
+    ocd = repo.load_program("workplace").load_ocd()
+    assert ocd.prices_of("ART 1")["price"].tolist() == [10.5]
+
+    price_path = root / "kn" / "workplace" / "DE" / "2" / "db" / "ocd_price.csv"
+    price_path.write_text("ART 1;99\n", encoding="cp1252")
+    os.utime(price_path, ns=(0, 0))
+    assert ocd.prices_of("ART 1")["price"].tolist() == [99.0]
+    assert ocd.tables["ocd_price"].stat_dict["st_mtime_ns"] == 0
+
+
+def test_iter_table_yields_cleaned_chunks(tmp_path: Path):
+    repo = Repository(root=generate_repository(tmp_path, programs=1, rows=250))
+    repo.read_profiles()
+    ocd = repo.load_program("prog000").load_ocd()
+
+    chunks = list(ocd.iter_table("ocd_price.csv", chunksize=100))
+    assert [len(_) for _ in chunks] == [100, 100, 50]
+    whole = ocd.read_table("ocd_price.csv").df
+    streamed = pd.concat(chunks, ignore_index=True)
+    assert streamed.dtypes.equals(whole.dtypes)
+    assert streamed.equals(whole)
+
+
+def test_config_file_keeps_equal_signs_in_values(tmp_path: Path):
+    path = tmp_path / "kn_workplace_DE_1.cfg"
+    path.write_text("# comment\nprogram=workplace\n[section]\nfilter=a=b;c=d\n", encoding="cp1252")
+    config = repository.ConfigFile(path)
+    assert config["program"] == "workplace"
+    assert config["[section]"]["filter"] == "a=b;c=d"
+
+
+def test_identical_inp_descr_parsed_once(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(repository, "parse_cache", repository.ParseCache(tmp_path / "parsed.json"))
+    root = make_repository(tmp_path / "repo")
+    inp_descr = root / "kn" / "workplace" / "DE" / "2" / "db" / "pdata.inp_descr"
+    copied = tmp_path / "copy.inp_descr"
+    copied.write_bytes(inp_descr.read_bytes())
+
+    first = repository.read_pdata_inp_descr(inp_descr)
+    first["ocd_article.csv"][0].append("changed by the caller")
+    second = repository.read_pdata_inp_descr(copied)
+    assert second["ocd_article.csv"][0] == ["article_nr", "art_type"]
+    assert repository.parse_cache.misses == 1 and repository.parse_cache.hits == 1
+
+    repository.parse_cache.save()
+    assert len(repository.ParseCache(tmp_path / "parsed.json")) == 1
+
+
+def test_dedup_shares_identical_tables(tmp_path: Path):
+    root = generate_repository(tmp_path, programs=2, rows=50)
+    prices = [root / "kn" / _ / "DE" / "2" / "db" / "ocd_price.csv" for _ in ("prog000", "prog001")]
+    prices[1].write_bytes(prices[0].read_bytes())
+    os.utime(prices[1], (0, 0))
+    repo = Repository(root=root, dedup=True)
+    repo.read_profiles()
+    first, second = [repo.load_program(_).load_ocd().read_table("ocd_price.csv") for _ in ("prog000", "prog001")]
+
+    assert second.df is first.df
+    assert second.content_hash == first.content_hash is not None
+    assert second.timestamp_modified == 0
+    article = [repo[_].ocd.read_table("ocd_article.csv") for _ in ("prog000", "prog001")]
+    assert article[0].df is not article[1].df
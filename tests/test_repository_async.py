@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+from repo.content_store import file_content_hash
+from repo.repository import OFMLPart, NotAvailable
+from repo.repository_async import RepositoryAsync, DaemonThreadPool
+from repo.table_cache import TableCache
+from tests.test_repository import make_repository
+
+
+def test_load_program_in_process_pool(tmp_path: Path):
+    async def load():
+        repo = RepositoryAsync(make_repository(tmp_path), parse_processes=2, dedup=True)
+        try:
+            await repo.read_profiles()
+            return (await repo.load_program("workplace", keep_in_memory=False),
+                    await repo.load_program("workplace", keep_in_memory=False))
+        finally:
+            repo.close()
+
+    program, again = asyncio.run(load())
+    tables = {_.name: _ for _ in program.all_tables}
+    assert sorted(tables) == ["ocd_article.csv", "ocd_price.csv"]
+    assert tables["ocd_article.csv"].df["article_nr"].tolist() == ["ART 1", "ART 2"]
+    assert str(tables["ocd_article.csv"].df["article_nr"].dtype) == "string"
+    assert program.ocd.table("ocd_price").df["price"].tolist() == [10.5]
+    # hashed in the worker for the manifest, identical tables share the DataFrame
+    table = tables["ocd_article.csv"]
+    assert table.content_hash == file_content_hash(table.path)
+    assert again.ocd.table("ocd_article").df is table.df
+
+
+def test_load_program_in_process_pool_with_table_cache(tmp_path: Path):
+    cache = TableCache(tmp_path / "cache")
+
+    async def load():
+        repo = RepositoryAsync(make_repository(tmp_path / "repo"), parse_processes=1, cache=cache)
+        try:
+            await repo.read_profiles()
+            return await repo.load_program("workplace", keep_in_memory=False)
+        finally:
+            repo.close()
+
+    program = asyncio.run(asyncio.wait_for(load(), 60))
+    assert program.ocd.table("ocd_article").df["article_nr"].tolist() == ["ART 1", "ART 2"]
+    # the worker put the parsed tables into the cache
+    assert len(cache.entries()) == 2
+
+
+def load_slowly(tmp_path: Path, monkeypatch, seconds: dict, **kwargs):
+    """
+    load the program while load_table sleeps seconds[filename], returns the program and the most reads at once
+    """
+    load_table = OFMLPart.load_table
+    lock = threading.Lock()
+    reading = []
+    most_at_once = [0]
+
+    def slow_load_table(self, filename, *args, **kw):
+        with lock:
+            reading.append(filename)
+            most_at_once[0] = max(most_at_once[0], len(reading))
+        try:
+            time.sleep(seconds.get(filename, 0.05))
+            return load_table(self, filename, *args, **kw)
+        finally:
+            with lock:
+                reading.remove(filename)
+
+    monkeypatch.setattr(OFMLPart, "load_table", slow_load_table)
+
+    async def load():
+        repo = RepositoryAsync(make_repository(tmp_path), **kwargs)
+        try:
+            await repo.read_profiles()
+            return await repo.load_program("workplace")
+        finally:
+            repo.close()
+
+    return asyncio.run(load()), most_at_once[0]
+
+
+def test_tables_of_a_program_read_at_once(tmp_path: Path, monkeypatch):
+    program, most_at_once = load_slowly(tmp_path / "limited", monkeypatch, {}, program_tables=1)
+    assert most_at_once == 1 and len(program.all_tables) == 2
+    program, most_at_once = load_slowly(tmp_path / "parallel", monkeypatch, {}, program_tables=2)
+    assert most_at_once == 2 and len(program.all_tables) == 2
+
+
+def test_hanging_table_read_times_out(tmp_path: Path, monkeypatch):
+    start = time.perf_counter()
+    # a hanging read of the share
+    program, _ = load_slowly(tmp_path, monkeypatch, {"ocd_price.csv": 1}, table_timeout=0.3)
+    assert time.perf_counter() - start < 0.9
+    assert isinstance(program.ocd.tables["ocd_price"], NotAvailable)
+    assert program.ocd.tables["ocd_article"].df["article_nr"].tolist() == ["ART 1", "ART 2"]
+
+
+def test_hanging_read_neither_blocks_the_other_reads_nor_replaces_its_timeout(tmp_path: Path, monkeypatch):
+    # the only thread hangs, it is replaced for the other read which does not time out while it waits
+    program, _ = load_slowly(tmp_path, monkeypatch, {"ocd_price.csv": 0.6, "ocd_article.csv": 0.2},
+                             io_workers=1, max_tables=2, program_tables=2, table_timeout=0.3)
+    assert isinstance(program.ocd.tables["ocd_price"], NotAvailable)
+    assert program.ocd.tables["ocd_article"].df["article_nr"].tolist() == ["ART 1", "ART 2"]
+    # the late result of the hanging read is dropped
+    time.sleep(0.6)
+    assert isinstance(program.ocd.tables["ocd_price"], NotAvailable)
+
+
+def test_abandoned_threads_are_replaced_again_once_they_returned():
+    pool = DaemonThreadPool(1)
+    try:
+        # more timeouts than workers over the run
+        for _ in range(3):
+            started = threading.Event()
+            threads = []
+
+            def hang():
+                threads.append(threading.current_thread())
+                started.set()
+                time.sleep(0.2)
+
+            hanging = pool.submit(hang)
+            started.wait()
+            pool.abandon(threads[0])
+            assert pool.exhausted
+            # the replacing thread reads while the abandoned one hangs
+            assert pool.submit(lambda: threading.current_thread()).result(timeout=0.1) is not threads[0]
+            hanging.result()
+            time.sleep(0.05)
+            assert not pool.exhausted and len(pool.threads) == 1
+    finally:
+        pool.shutdown(wait=False)
+
+
+def test_next_table_is_read_once_the_table_was_handed_on(tmp_path: Path, monkeypatch):
+    reads = []
+    load_table = OFMLPart.load_table
+
+    def counting_load_table(self, filename, *args, **kwargs):
+        reads.append(filename)
+        return load_table(self, filename, *args, **kwargs)
+
+    monkeypatch.setattr(OFMLPart, "load_table", counting_load_table)
+
+    async def load():
+        repo = RepositoryAsync(make_repository(tmp_path), max_tables=1)
+        queue_has_room = asyncio.Event()
+
+        async def on_table_loaded(program, table):
+            await queue_has_room.wait()
+
+        try:
+            await repo.read_profiles()
+            loading = asyncio.create_task(repo.load_program("workplace", on_table_loaded=on_table_loaded))
+            await asyncio.sleep(0.3)
+            waiting = len(reads)
+            queue_has_room.set()
+            await loading
+            return waiting
+        finally:
+            repo.close()
+
+    assert asyncio.run(load()) == 1
+    assert sorted(reads) == ["ocd_article.csv", "ocd_price.csv"]
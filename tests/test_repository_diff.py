@@ -0,0 +1,61 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from repo.repository import Repository
+from repo.repository_diff import diff_frames
+from benchmarks.synthetic_repository import generate_repository
+from tests.test_repository import make_repository
+
+
+def ocd_path(root: Path) -> Path:
+    return root / "kn" / "workplace" / "DE" / "2" / "db"
+
+
+def test_diff_frames_by_key():
+    old = pd.DataFrame({"article_nr": ["A", "B", "C"], "price": [1.0, 2.0, 3.0]})
+    new = pd.DataFrame({"article_nr": ["A", "B", "D"], "price": [1.0, 2.5, 4.0]})
+    for partition_rows in (1000000, 1):
+        key_columns, added, removed, changed = diff_frames(old, new, ["article_nr"], partition_rows)
+        assert key_columns == ["article_nr"]
+        assert added["article_nr"].tolist() == ["D"]
+        assert removed["article_nr"].tolist() == ["C"]
+        assert changed.to_dict("records") == [{"article_nr": "B", "price_old": 2.0, "price_new": 2.5}]
+
+
+def test_diff_skips_identical_files_and_finds_changed_rows(tmp_path: Path, monkeypatch):
+    old = Repository(root=make_repository(tmp_path / "old"))
+    new = Repository(root=make_repository(tmp_path / "new"))
+    (ocd_path(new.root) / "ocd_price.csv").write_text("ART 1;11.5\nART 2;3\n", encoding="cp1252")
+    # same content, other mtime: equal by hash
+    os.utime(ocd_path(new.root) / "ocd_article.csv", (0, 0))
+
+    diffs = list(old.diff(new))
+    assert [(_.program, _.ofml_part, _.table, _.status) for _ in diffs] == [
+        ("workplace", "ocd", "ocd_price.csv", "changed")]
+    assert diffs[0].added.to_dict("records") == [{"article_nr": "ART 2", "price": 3.0}]
+    assert diffs[0].changed.to_dict("records") == [{"article_nr": "ART 1", "price_old": 10.5, "price_new": 11.5}]
+    # the compared programs are not kept
+    assert not list(old.programs())
+
+
+def test_diff_snapshot_against_plaintext(tmp_path: Path):
+    repo = Repository(root=make_repository(tmp_path / "repo"))
+    repo.read_profiles()
+    repo.load_program("workplace").load_ocd().read_all_tables()
+    repo.save_snapshot(tmp_path / "snapshot")
+    (ocd_path(repo.root) / "ocd_article.csv").write_text("ART 1;S\n", encoding="cp1252")
+
+    diffs = list(Repository.open_snapshot(tmp_path / "snapshot").diff(Repository(root=repo.root)))
+    assert [(_.table, len(_.added), len(_.removed), len(_.changed)) for _ in diffs] == [("ocd_article.csv", 0, 1, 0)]
+    assert diffs[0].removed["article_nr"].tolist() == ["ART 2"]
+
+
+def test_diff_loads_the_missing_parts_of_a_loaded_program(tmp_path: Path):
+    old = Repository(root=generate_repository(tmp_path / "old", programs=1, rows=20))
+    new = Repository(root=generate_repository(tmp_path / "new", programs=1, rows=20))
+    old.read_profiles()
+    old.load_program("prog000").load_ocd()
+
+    assert list(old.diff(new)) == []
@@ -0,0 +1,44 @@
+import shutil
+from pathlib import Path
+
+from repo.repository import Repository, OCDPart
+from tests.test_repository import make_repository
+
+
+def test_snapshot_round_trip(tmp_path: Path):
+    repo = Repository(root=make_repository(tmp_path / "repo"), categorical={"ocd_article": ["art_type"]})
+    repo.read_profiles()
+    program = repo.load_program("workplace")
+    program.load_ocd().read_all_tables()
+    repo.save_snapshot(tmp_path / "snapshot")
+
+    snapshot = Repository.open_snapshot(tmp_path / "snapshot")
+    assert snapshot.root == repo.root
+    assert snapshot.program_names() == ["workplace"]
+    ocd = snapshot["workplace"].ocd
+    assert isinstance(ocd, OCDPart)
+    assert ocd.tables == {}
+
+    article = ocd["ocd_article"]
+    assert article.df["article_nr"].tolist() == ["ART 1", "ART 2"]
+    assert str(article.df["art_type"].dtype) == "category"
+    assert article.timestamp_modified == program.ocd["ocd_article"].timestamp_modified
+    assert ocd.prices_of("ART 1")["price"].tolist() == [10.5]
+
+    # a changed source file does not change the snapshot
+    (tmp_path / "repo" / "kn" / "workplace" / "DE" / "2" / "db" / "ocd_price.csv").write_text("ART 1;99\n")
+    assert ocd.prices_of("ART 1")["price"].tolist() == [10.5]
+
+
+def test_snapshot_does_not_look_at_the_share(tmp_path: Path):
+    root = make_repository(tmp_path / "repo")
+    (root / "kn" / "workplace" / "2").mkdir()
+    repo = Repository(root=root)
+    repo.read_profiles()
+    repo.load_program("workplace").load_ocd().read_all_tables()
+    repo.save_snapshot(tmp_path / "snapshot")
+
+    shutil.rmtree(root)
+    program = Repository.open_snapshot(tmp_path / "snapshot")["workplace"]
+    assert program.contains_odb() and not program.contains_oap()
+    assert program.ocd["ocd_price"].df["price"].tolist() == [10.5]
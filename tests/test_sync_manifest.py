@@ -0,0 +1,47 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from repo.content_store import file_content_hash
+from repo.repository import Table
+from repo.sync_manifest import SyncManifest
+
+
+def test_sync_manifest_detects_modified_tables(tmp_path: Path):
+    table_path = tmp_path / "ocd_article.csv"
+    table_path.write_text("A;B\n", encoding="cp1252")
+    table = Table(pd.DataFrame({"x": ["A"]}), table_path, "ocd")
+
+    manifest = SyncManifest(tmp_path / "manifest.json", root=tmp_path)
+    assert manifest.is_modified("prog", "ocd", "ocd_article.csv", table.timestamp_modified)
+
+    manifest.update("prog", table)
+    manifest.save()
+
+    manifest = SyncManifest(tmp_path / "manifest.json", root=tmp_path)
+    assert not manifest.is_modified("prog", "ocd", "ocd_article.csv", table.timestamp_modified)
+
+    os.utime(table_path, (table.timestamp_modified + 10, table.timestamp_modified + 10))
+    assert manifest.is_modified("prog", "ocd", "ocd_article.csv", os.stat(table_path).st_mtime)
+
+    # a manifest of another repository does not apply
+    assert SyncManifest(tmp_path / "manifest.json", root=tmp_path / "other").tables == {}
+
+
+def test_sync_manifest_compares_content_of_touched_files(tmp_path: Path):
+    table_path = tmp_path / "ocd_article.csv"
+    table_path.write_text("A;B\n", encoding="cp1252")
+    table = Table(pd.DataFrame({"x": ["A"]}), table_path, "ocd", content_hash=file_content_hash(table_path))
+    manifest = SyncManifest(tmp_path / "manifest.json", root=tmp_path)
+    manifest.update("prog", table)
+
+    # a copy job touched the file
+    os.utime(table_path, (table.timestamp_modified + 10, table.timestamp_modified + 10))
+    mtime = os.stat(table_path).st_mtime
+    assert not manifest.is_modified("prog", "ocd", "ocd_article.csv", mtime, path=table_path)
+    assert manifest.tables["prog/ocd/ocd_article.csv"]["timestamp_modified"] == mtime
+
+    table_path.write_text("A;C\n", encoding="cp1252")
+    os.utime(table_path, (mtime + 10, mtime + 10))
+    assert manifest.is_modified("prog", "ocd", "ocd_article.csv", mtime + 10, path=table_path)